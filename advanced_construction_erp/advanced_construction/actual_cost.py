@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Actual cost aggregation for Construction Project budget lines.
+
+Actuals are collected from every cost source with one grouped query per source
+for a whole batch of projects, keyed by the ERPNext Project behind each
+Construction Project and by item code (activity type for timesheets, expense
+type for expense claims). The totals are then written to the budget lines in
+one bulk update. Costs that match no budget line are reported as unallocated.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt
+
+from advanced_construction_erp.advanced_construction.budget_history import record_budget_changes
+
+# Each query returns (project, cost key, amount) rows for submitted documents.
+# Purchase Orders are commitments and are tracked by the commitment ledger, not
+# here. Stock items become an actual when they are issued to the project, so
+# they are taken from Stock Entry issues only. Purchase Invoices count only
+# non-stock items, which are never issued; otherwise an item bought for the
+# project and later issued to it would be counted twice.
+COST_SOURCES = {
+    "Purchase Invoice": """
+        SELECT IFNULL(pii.project, pi.project), pii.item_code, SUM(pii.base_net_amount)
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        JOIN `tabItem` item ON item.name = pii.item_code
+        WHERE pi.docstatus = 1 AND item.is_stock_item = 0
+            AND IFNULL(pii.project, pi.project) IN %(projects)s
+        GROUP BY IFNULL(pii.project, pi.project), pii.item_code
+    """,
+    "Stock Entry": """
+        SELECT IFNULL(sed.project, se.project), sed.item_code, SUM(sed.amount)
+        FROM `tabStock Entry Detail` sed
+        JOIN `tabStock Entry` se ON se.name = sed.parent
+        WHERE se.docstatus = 1 AND IFNULL(sed.s_warehouse, '') != '' AND IFNULL(sed.t_warehouse, '') = ''
+            AND IFNULL(sed.project, se.project) IN %(projects)s
+        GROUP BY IFNULL(sed.project, se.project), sed.item_code
+    """,
+    "Timesheet": """
+        SELECT td.project, td.activity_type, SUM(td.costing_amount)
+        FROM `tabTimesheet Detail` td
+        JOIN `tabTimesheet` ts ON ts.name = td.parent
+        WHERE ts.docstatus = 1 AND td.project IN %(projects)s
+        GROUP BY td.project, td.activity_type
+    """,
+    "Expense Claim": """
+        SELECT ec.project, ecd.expense_type, SUM(ecd.sanctioned_amount)
+        FROM `tabExpense Claim Detail` ecd
+        JOIN `tabExpense Claim` ec ON ec.name = ecd.parent
+        WHERE ec.docstatus = 1 AND ec.approval_status = 'Approved' AND ec.project IN %(projects)s
+        GROUP BY ec.project, ecd.expense_type
+    """,
+}
+
+
+def get_actual_costs(projects):
+    """
+    Aggregate actual costs from every source for a batch of Construction Projects
+
+    Args:
+        projects: List of Construction Project names
+
+    Returns:
+        Dict of Construction Project name -> {cost key: {source: amount}}
+    """
+    construction_project_by_project = dict(frappe.get_all("Construction Project",
+        filters={"name": ["in", projects], "project": ["is", "set"]},
+        fields=["project", "name"],
+        as_list=1
+    ))
+    if not construction_project_by_project:
+        return {}
+
+    costs = {}
+    for source, query in COST_SOURCES.items():
+        if not frappe.db.table_exists(source):
+            continue
+
+        for project, key, amount in frappe.db.sql(query, {"projects": list(construction_project_by_project)}):
+            construction_project = construction_project_by_project.get(project)
+            if construction_project and key:
+                costs.setdefault(construction_project, {}).setdefault(key, {})[source] = flt(amount)
+
+    return costs
+
+
+def update_budget_actuals(projects):
+    """
+    Refresh actual amount and variance on every budget line of the given projects
+
+    When several lines of a project share an item code, its actuals are split in proportion
+    to their budgeted amounts.
+
+    Args:
+        projects: List of Construction Project names
+
+    Returns:
+        Dict with the number of lines updated and unallocated costs per project and key
+    """
+    costs = get_actual_costs(projects)
+
+    lines_by_key = {}
+    for line in frappe.get_all("Construction Project Budget",
+        filters={"parenttype": "Construction Project", "parent": ["in", projects]},
+        fields=["name", "parent", "item_code", "item_name", "amount", "actual_amount", "variance", "variance_percentage"]
+    ):
+        lines_by_key.setdefault((line.parent, line.item_code), []).append(line)
+
+    updates = {}
+    changes = []
+    for (project, key), lines in lines_by_key.items():
+        total = sum((costs.get(project, {}).pop(key, None) or {}).values())
+        budgeted = sum(flt(line.amount) for line in lines)
+
+        for line in lines:
+            share = flt(line.amount) / budgeted if budgeted else 1.0 / len(lines)
+            actual_amount = flt(total * share, 2)
+            variance, variance_percentage = _get_variance(line.amount, actual_amount)
+
+            if (flt(line.actual_amount, 2) != actual_amount or flt(line.variance, 2) != flt(variance, 2)
+                    or flt(line.variance_percentage, 2) != flt(variance_percentage, 2)):
+                updates[line.name] = {
+                    "actual_amount": actual_amount,
+                    "variance": variance,
+                    "variance_percentage": variance_percentage
+                }
+                changes.append({
+                    "construction_project": line.parent,
+                    "budget_item": line.name,
+                    "item_code": line.item_code,
+                    "item_name": line.item_name,
+                    "changes": {"actual_amount": actual_amount, "variance": flt(variance)}
+                })
+
+    if updates:
+        frappe.db.bulk_update("Construction Project Budget", updates, update_modified=False)
+        record_budget_changes(changes)
+
+    # Whatever is left in `costs` matched no budget line
+    unallocated = {
+        project: {key: sum(sources.values()) for key, sources in keys.items()}
+        for project, keys in costs.items() if keys
+    }
+
+    return {"updated_lines": len(updates), "unallocated": unallocated}
+
+
+def _get_variance(amount, actual_amount):
+    """Variance as calculated by ConstructionProjectBudget.calculate_variance"""
+    if flt(amount) and flt(actual_amount):
+        variance = flt(actual_amount) - flt(amount)
+        return variance, variance / flt(amount) * 100
+    return 0, 0
+
+
+def update_all_budget_actuals(chunk_size=200):
+    """
+    Daily scheduled job that refreshes budget actuals for every Construction Project
+
+    Args:
+        chunk_size: Number of projects aggregated and written per commit
+    """
+    projects = frappe.get_all("Construction Project",
+        filters={"project": ["is", "set"]},
+        pluck="name",
+        order_by="name"
+    )
+
+    updated = unallocated = 0
+    for start in range(0, len(projects), chunk_size):
+        result = update_budget_actuals(projects[start:start + chunk_size])
+        updated += result["updated_lines"]
+        unallocated += len(result["unallocated"])
+        frappe.db.commit()
+
+    frappe.logger("construction_project").info(
+        "Budget actuals refreshed: {0} projects, {1} lines updated, {2} projects with unallocated costs".format(
+            len(projects), updated, unallocated))
+
+
+@frappe.whitelist()
+def refresh_budget_actuals(projects):
+    """
+    Refresh budget actuals on demand
+
+    Args:
+        projects: Construction Project name or JSON list of names
+
+    Returns:
+        Dict with the number of lines updated and unallocated costs per project and key
+    """
+    projects = frappe.parse_json(projects) if isinstance(projects, str) and projects.startswith("[") else projects
+    if isinstance(projects, str):
+        projects = [projects]
+
+    for project in projects:
+        frappe.has_permission("Construction Project", "write", project, throw=True)
+
+    return update_budget_actuals(projects)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Budget commitments (encumbrances) for Construction Projects.
+
+Construction Material Requests, Material Requests and Purchase Orders reserve
+budget when submitted and release it when cancelled, through signed entries in
+the Construction Budget Commitment ledger. A document raised from an earlier
+one (a Material Request from a Construction Material Request, a Purchase Order
+from a Material Request) takes over the earlier reservation instead of adding
+to it.
+
+Every (project, budget category, item) keeps a materialized Construction Budget
+Balance row with its budgeted, committed and available amounts, maintained by
+upserts. Checking a transaction against the budget is then one indexed lookup
+on that table, however many budget lines the project has.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import flt, nowdate, now_datetime
+
+from advanced_construction_erp.advanced_construction.budget_control import get_project_budget
+from advanced_construction_erp.advanced_construction.material_request_consolidation import get_consolidated_sources
+
+COMMITMENT_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "construction_project", "budget_category", "item_code", "posting_date", "voucher_type", "voucher_no",
+    "against_voucher_type", "against_voucher_no", "amount", "is_reversal"]
+
+# Link on the item row pointing at the document whose reservation it takes over
+AGAINST_VOUCHER = {
+    "Material Request": ("Construction Material Request", "construction_material_request"),
+    "Purchase Order": ("Material Request", "material_request"),
+}
+
+
+def get_balance_name(construction_project, budget_category, item_code):
+    """Deterministic name of the balance row of a (project, category, item)"""
+    key = "\n".join([construction_project, budget_category or "", item_code or ""])
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def reserve_budget(doc, method=None, check_budget=True):
+    """
+    Reserve budget for a submitted document
+
+    Hooked on submit of Material Request and Purchase Order, and called by
+    Construction Material Request. Posting the same document twice is a no-op.
+
+    Args:
+        doc: The Construction Material Request, Material Request or Purchase Order
+        method: The method being called
+        check_budget: Refuse the reservation when it exceeds the available budget (off when
+            posting documents that were submitted before the ledger existed)
+    """
+    if frappe.db.exists("Construction Budget Commitment", {"voucher_type": doc.doctype, "voucher_no": doc.name}):
+        return
+
+    lines = get_commitment_lines(doc)
+    if not lines:
+        return
+
+    if check_budget:
+        check_available_budget(lines)
+
+    entries = []
+    for line in lines:
+        entries.append(dict(line, voucher_type=doc.doctype, voucher_no=doc.name,
+            against_voucher_type=None, against_voucher_no=None))
+        if flt(line["transferred_amount"]):
+            # Release the reservation held by the source document
+            entries.append(dict(line, voucher_type=doc.doctype, voucher_no=doc.name,
+                amount=-flt(line["transferred_amount"])))
+
+    post_commitments(entries, doc.get("transaction_date"))
+
+
+def release_budget(doc, method=None):
+    """
+    Reverse every commitment posted by a cancelled document
+
+    Args:
+        doc: The Construction Material Request, Material Request or Purchase Order
+        method: The method being called
+    """
+    if frappe.db.exists("Construction Budget Commitment",
+        {"voucher_type": doc.doctype, "voucher_no": doc.name, "is_reversal": 1}):
+        return
+
+    entries = frappe.db.sql("""
+        SELECT construction_project, budget_category, item_code, against_voucher_type, against_voucher_no,
+            -SUM(amount) AS amount
+        FROM `tabConstruction Budget Commitment`
+        WHERE voucher_type = %s AND voucher_no = %s AND is_reversal = 0
+        GROUP BY construction_project, budget_category, item_code, against_voucher_type, against_voucher_no
+    """, (doc.doctype, doc.name), as_dict=1)
+
+    post_commitments([
+        dict(entry, voucher_type=doc.doctype, voucher_no=doc.name, is_reversal=1)
+        for entry in entries if flt(entry.amount)
+    ])
+
+
+def get_commitment_lines(doc):
+    """
+    Group the items of a document by (project, budget category, item)
+
+    Returns:
+        List of dicts with construction_project, budget_category, item_code, amount,
+        against_voucher_type, against_voucher_no and transferred_amount (the part of the
+        source document's open reservation taken over by this line)
+    """
+    against_doctype, against_field = AGAINST_VOUCHER.get(doc.doctype, (None, None))
+
+    consolidated = get_consolidated_sources(doc.name) if doc.doctype == "Material Request" else []
+
+    if doc.doctype == "Construction Material Request":
+        rows = [(doc.construction_project, item.item, flt(item.estimated_amount), None)
+            for item in doc.items]
+    elif consolidated:
+        # Consolidated lines merge several construction requests; commit per source line
+        rows = [(source.construction_project, source.item_code, flt(source.amount),
+                source.construction_material_request)
+            for source in consolidated]
+    else:
+        projects = {item.get("project") or doc.get("project") for item in doc.items} - {None, ""}
+        construction_project_by_project = dict(frappe.get_all("Construction Project",
+            filters={"project": ["in", list(projects)]},
+            fields=["project", "name"],
+            as_list=1
+        )) if projects else {}
+
+        rows = [(construction_project_by_project.get(item.get("project") or doc.get("project")), item.item_code,
+                flt(item.get("base_net_amount") or item.get("amount")) or flt(item.qty) * flt(item.rate),
+                item.get(against_field) if against_field else None)
+            for item in doc.items]
+
+    grouped = {}
+    for construction_project, item_code, amount, against_voucher_no in rows:
+        if not construction_project or not item_code or not amount:
+            continue
+        key = (construction_project, item_code, against_voucher_no)
+        grouped[key] = grouped.get(key, 0) + amount
+
+    if not grouped:
+        return []
+
+    categories = get_budget_categories({key[0] for key in grouped}, {key[1] for key in grouped})
+    open_reservations = get_open_reservations(against_doctype, {key[2] for key in grouped} - {None})
+
+    lines = []
+    for (construction_project, item_code, against_voucher_no), amount in grouped.items():
+        transferred = 0
+        if against_voucher_no:
+            # Take over at most what is still reserved for the item by the source document
+            available = open_reservations.get((against_voucher_no, item_code), 0)
+            transferred = min(amount, max(available, 0))
+            open_reservations[(against_voucher_no, item_code)] = available - transferred
+
+        lines.append({
+            "construction_project": construction_project,
+            "budget_category": categories.get((construction_project, item_code)),
+            "item_code": item_code,
+            "amount": amount,
+            "against_voucher_type": against_doctype if against_voucher_no else None,
+            "against_voucher_no": against_voucher_no,
+            "transferred_amount": transferred
+        })
+
+    return lines
+
+
+def get_budget_categories(projects, item_codes):
+    """Map (project, item) to the budget category of its first budget line"""
+    categories = {}
+    for parent, item_code, budget_category in frappe.db.sql("""
+        SELECT parent, item_code, budget_category
+        FROM `tabConstruction Project Budget`
+        WHERE parenttype = 'Construction Project' AND parent IN %(projects)s AND item_code IN %(items)s
+        ORDER BY idx
+    """, {"projects": list(projects), "items": list(item_codes)}):
+        categories.setdefault((parent, item_code), budget_category)
+
+    return categories
+
+
+def get_open_reservations(voucher_type, voucher_nos):
+    """
+    Get the budget still reserved by source documents, net of what later documents took over
+
+    Returns:
+        Dict of (voucher no, item code) -> open amount
+    """
+    if not voucher_type or not voucher_nos:
+        return {}
+
+    voucher_nos = list(voucher_nos)
+    return {(voucher_no, item_code): flt(amount) for voucher_no, item_code, amount in frappe.db.sql("""
+        SELECT voucher_no, item_code, SUM(amount)
+        FROM (
+            SELECT voucher_no, item_code, amount
+            FROM `tabConstruction Budget Commitment`
+            WHERE voucher_type = %(voucher_type)s AND voucher_no IN %(voucher_nos)s
+            UNION ALL
+            SELECT against_voucher_no, item_code, amount
+            FROM `tabConstruction Budget Commitment`
+            WHERE against_voucher_type = %(voucher_type)s AND against_voucher_no IN %(voucher_nos)s
+                AND voucher_type != %(voucher_type)s
+        ) reservations
+        GROUP BY voucher_no, item_code
+    """, {"voucher_type": voucher_type, "voucher_nos": voucher_nos})}
+
+
+def check_available_budget(lines):
+    """
+    Reject lines that exceed the available budget of projects blocking purchases over budget
+
+    Budget taken over from a source document is already reserved, so only the remainder of
+    each line has to fit in the available balance.
+
+    Args:
+        lines: Lines as returned by `get_commitment_lines`
+    """
+    required = {}
+    for line in lines:
+        if not get_project_budget(line["construction_project"])["block_purchases_over_budget"]:
+            continue
+        key = (line["construction_project"], line["item_code"])
+        required[key] = required.get(key, 0) + flt(line["amount"]) - flt(line["transferred_amount"])
+
+    if not required:
+        return
+
+    # Lock the balance rows so concurrent documents cannot both pass against the same balance;
+    # the lock is held until the reservation is posted and committed
+    available = get_available_budget({key[0] for key in required}, {key[1] for key in required}, for_update=True)
+
+    exceeded = []
+    for (construction_project, item_code), amount in sorted(required.items()):
+        remaining = available.get((construction_project, item_code), 0)
+        if flt(amount, 2) > flt(remaining, 2):
+            exceeded.append(_("{0} / {1}: requires {2}, available budget {3}").format(
+                construction_project, item_code,
+                frappe.format(amount, {"fieldtype": "Currency"}),
+                frappe.format(max(remaining, 0), {"fieldtype": "Currency"})
+            ))
+
+    if exceeded:
+        frappe.throw(_("Budget exceeded:") + "<br>" + "<br>".join(exceeded), title=_("Budget Exceeded"))
+
+
+def get_available_budget(projects, item_codes, for_update=False):
+    """
+    Get the available budget per project and item from the balance table
+
+    Args:
+        projects: Construction Project names
+        item_codes: Item codes
+        for_update: Lock the balance rows read
+
+    Returns:
+        Dict of (project, item code) -> available amount
+    """
+    return {(project, item_code): flt(amount) for project, item_code, amount in frappe.db.sql("""
+        SELECT construction_project, item_code, SUM(available_amount)
+        FROM `tabConstruction Budget Balance`
+        WHERE construction_project IN %(projects)s AND item_code IN %(items)s
+        GROUP BY construction_project, item_code
+        {for_update}
+    """.format(for_update="FOR UPDATE" if for_update else ""), {"projects": list(projects), "items": list(item_codes)})}
+
+
+def post_commitments(entries, posting_date=None):
+    """
+    Insert commitment entries and apply them to the balance rows
+
+    Args:
+        entries: List of dicts with construction_project, budget_category, item_code, voucher_type,
+            voucher_no, amount and optionally against_voucher_type, against_voucher_no and is_reversal
+        posting_date: Posting date of the entries (defaults to today)
+    """
+    if not entries:
+        return
+
+    timestamp = now_datetime()
+    posting_date = posting_date or nowdate()
+    user = frappe.session.user
+
+    frappe.db.bulk_insert("Construction Budget Commitment", COMMITMENT_COLUMNS, [
+        (frappe.generate_hash(length=12), timestamp, timestamp, user, user, 0,
+            entry["construction_project"], entry.get("budget_category"), entry["item_code"], posting_date,
+            entry["voucher_type"], entry["voucher_no"], entry.get("against_voucher_type"),
+            entry.get("against_voucher_no"), flt(entry["amount"]), entry.get("is_reversal", 0))
+        for entry in entries
+    ])
+
+    deltas = {}
+    for entry in entries:
+        key = (entry["construction_project"], entry.get("budget_category"), entry["item_code"])
+        deltas[key] = deltas.get(key, 0) + flt(entry["amount"])
+
+    frappe.db.sql("""
+        INSERT INTO `tabConstruction Budget Balance`
+            (name, creation, modified, owner, modified_by, docstatus,
+            construction_project, budget_category, item_code, budgeted_amount, committed_amount, available_amount)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE
+            committed_amount = committed_amount + VALUES(committed_amount),
+            available_amount = available_amount - VALUES(committed_amount),
+            modified = VALUES(modified)
+    """.format(values=", ".join(["(%s, %s, %s, %s, %s, 0, %s, %s, %s, 0, %s, %s)"] * len(deltas))), [
+        value
+        for (construction_project, budget_category, item_code), delta in deltas.items()
+        for value in (get_balance_name(construction_project, budget_category, item_code), timestamp, timestamp,
+            user, user, construction_project, budget_category, item_code, delta, -delta)
+    ])
+
+
+def refresh_budgeted_amounts(construction_project):
+    """
+    Write the budgeted amounts of a project's budget lines to its balance rows
+
+    Called when the project's budget changes; committed amounts are kept.
+
+    Args:
+        construction_project: The name of the Construction Project
+    """
+    timestamp = now_datetime()
+    user = frappe.session.user
+    budget = frappe.db.sql("""
+        SELECT budget_category, item_code, SUM(amount)
+        FROM `tabConstruction Project Budget`
+        WHERE parenttype = 'Construction Project' AND parent = %s AND IFNULL(item_code, '') != ''
+        GROUP BY budget_category, item_code
+    """, construction_project)
+
+    names = [get_balance_name(construction_project, category, item_code) for category, item_code, amount in budget]
+
+    # Lines removed from the budget keep their commitments but no longer have budget
+    frappe.db.sql("""
+        UPDATE `tabConstruction Budget Balance`
+        SET budgeted_amount = 0, available_amount = -committed_amount, modified = %(modified)s
+        WHERE construction_project = %(project)s AND budgeted_amount != 0 AND name NOT IN %(names)s
+    """, {"project": construction_project, "names": names or [""], "modified": timestamp})
+
+    if not budget:
+        return
+
+    frappe.db.sql("""
+        INSERT INTO `tabConstruction Budget Balance`
+            (name, creation, modified, owner, modified_by, docstatus,
+            construction_project, budget_category, item_code, budgeted_amount, committed_amount, available_amount)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE
+            budgeted_amount = VALUES(budgeted_amount),
+            available_amount = VALUES(budgeted_amount) - committed_amount,
+            modified = VALUES(modified)
+    """.format(values=", ".join(["(%s, %s, %s, %s, %s, 0, %s, %s, %s, %s, 0, %s)"] * len(budget))), [
+        value
+        for name, (budget_category, item_code, amount) in zip(names, budget)
+        for value in (name, timestamp, timestamp, user, user, construction_project, budget_category, item_code,
+            flt(amount), flt(amount))
+    ])
+
+
+@frappe.whitelist()
+def get_budget_balances(construction_project):
+    """
+    Get the budget balance rows of a Construction Project
+
+    Args:
+        construction_project: The name of the Construction Project
+    """
+    frappe.has_permission("Construction Project", "read", construction_project, throw=True)
+
+    return frappe.get_all("Construction Budget Balance",
+        filters={"construction_project": construction_project},
+        fields=["budget_category", "item_code", "budgeted_amount", "committed_amount", "available_amount"],
+        order_by="budget_category, item_code"
+    )
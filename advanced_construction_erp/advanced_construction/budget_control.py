@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Cached budget lookups for purchase validation.
+
+Each Construction Project's budget (item code -> budgeted amount) is kept in a
+Redis hash keyed by project, so validating a Purchase Order does not load the
+project document. The entry is dropped whenever the project or one of its
+budget lines changes. Remaining budget is tracked by the commitment ledger in
+`budget_commitment`.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt
+
+BUDGET_KEY = "construction_project_budget_items"
+
+
+def get_project_budget(construction_project):
+    """
+    Get the cached budget of a Construction Project
+
+    Args:
+        construction_project: The name of the Construction Project
+
+    Returns:
+        Dict with `project` (the ERPNext Project), `block_purchases_over_budget` and
+        `items` (item code -> budgeted amount)
+    """
+    return frappe.cache().hget(BUDGET_KEY, construction_project,
+        generator=lambda: _load_project_budget(construction_project))
+
+
+def _load_project_budget(construction_project):
+    project, block = frappe.db.get_value("Construction Project", construction_project,
+        ["project", "block_purchases_over_budget"]) or (None, 0)
+
+    items = dict(frappe.db.sql("""
+        SELECT item_code, SUM(amount)
+        FROM `tabConstruction Project Budget`
+        WHERE parenttype = 'Construction Project' AND parent = %s AND IFNULL(item_code, '') != ''
+        GROUP BY item_code
+    """, construction_project))
+
+    return {
+        "project": project,
+        "block_purchases_over_budget": cint(block),
+        "items": {item_code: flt(amount) for item_code, amount in items.items()}
+    }
+
+
+def clear_project_budget_cache(construction_project):
+    """Drop the cached budget of a Construction Project"""
+    frappe.cache().hdel(BUDGET_KEY, construction_project)
+
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Keeps Project Budget categories aligned with their Project Estimation.
+
+Each budget category mirrors one cost component of the estimation
+(CATEGORY_FIELD_MAP). When estimation components change, the affected
+estimations are queued for the transaction and every linked budget that is not
+yet approved is updated with field-level diffs and bulk writes just before
+commit. Approving a budget marks its estimation with a targeted update. Neither
+direction loads or saves the other document, so no validate cascades run.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt
+
+from advanced_construction_erp.utils import enqueue_before_commit
+
+# Budget category -> Project Estimation cost component
+CATEGORY_FIELD_MAP = (
+    ("Materials", "material_costs"),
+    ("Labor", "labor_costs"),
+    ("Equipment", "equipment_costs"),
+    ("Subcontractors", "subcontractor_costs"),
+    ("Project Management", "project_management_costs"),
+    ("Engineering & Design", "engineering_design_costs"),
+    ("Permits & Fees", "permit_fees"),
+    ("Insurance", "insurance_costs"),
+    ("Temporary Facilities", "temporary_facilities_costs"),
+    ("General Conditions", "general_conditions"),
+    ("Contingency", "contingency_amount"),
+    ("Escalation", "escalation_amount"),
+    ("Overhead", "overhead_amount"),
+    ("Profit", "profit_amount"),
+    ("Risk Contingency", "risk_contingency_amount"),
+)
+
+SYNC_BATCH_SIZE = 500
+
+
+def get_budget_category_rows(estimation):
+    """
+    Build the budget category rows for a Project Estimation
+
+    Args:
+        estimation: Project Estimation document or dict
+
+    Returns:
+        List of dicts with category and amount, in CATEGORY_FIELD_MAP order
+    """
+    return [
+        {"category": category, "amount": flt(estimation.get(field))}
+        for category, field in CATEGORY_FIELD_MAP
+    ]
+
+
+def get_changed_components(estimation):
+    """Return the cost components of a Project Estimation changed by the current save"""
+    return [field for category, field in CATEGORY_FIELD_MAP if estimation.has_value_changed(field)]
+
+
+def queue_budget_sync(project_estimation):
+    """Sync the budgets of a Project Estimation once, just before the transaction commits"""
+    enqueue_before_commit("project_estimation_budget_sync", [project_estimation], sync_budgets_from_estimations)
+
+
+def queue_estimation_approval(project_estimation):
+    """Mark a Project Estimation's budget as approved, just before the transaction commits"""
+    if frappe.get_meta("Project Estimation").has_field("budget_status"):
+        enqueue_before_commit("project_estimation_budget_approval", [project_estimation], mark_budgets_approved)
+
+
+def mark_budgets_approved(project_estimations):
+    """Set the budget status of several Project Estimations in one statement"""
+    frappe.db.set_value("Project Estimation", {"name": ["in", list(project_estimations)]},
+        "budget_status", "Approved")
+
+
+def sync_budgets_from_estimations(project_estimations):
+    """
+    Align the categories of every unapproved Project Budget with its Project Estimation
+
+    Only category rows whose amount changed are written, followed by the budget totals of the
+    budgets that had changes.
+
+    Args:
+        project_estimations: Iterable of Project Estimation names
+
+    Returns:
+        Dict with the number of category rows and budgets updated
+    """
+    project_estimations = list(project_estimations)
+    result = {"categories": 0, "budgets": 0}
+
+    for start in range(0, len(project_estimations), SYNC_BATCH_SIZE):
+        batch = _sync_batch(project_estimations[start:start + SYNC_BATCH_SIZE])
+        result["categories"] += batch["categories"]
+        result["budgets"] += batch["budgets"]
+
+    return result
+
+
+def _sync_batch(project_estimations):
+    field_by_category = dict(CATEGORY_FIELD_MAP)
+    estimations = {
+        row.name: row for row in frappe.get_all("Project Estimation",
+            filters={"name": ["in", project_estimations]},
+            fields=["name", "total_project_cost"] + list(field_by_category.values())
+        )
+    }
+
+    budgets = {
+        row.name: row for row in frappe.get_all("Project Budget",
+            filters={
+                "project_estimation": ["in", list(estimations)],
+                "docstatus": ["<", 2],
+                "approval_status": ["!=", "Approved"]
+            },
+            fields=["name", "project_estimation", "total_budget"]
+        )
+    } if estimations else {}
+
+    if not budgets:
+        return {"categories": 0, "budgets": 0}
+
+    rows = frappe.get_all("Project Budget Category",
+        filters={"parenttype": "Project Budget", "parent": ["in", list(budgets)]},
+        fields=["name", "parent", "category", "amount", "actual_spent", "variance", "percentage_of_total"]
+    )
+
+    category_updates = {}
+    rows_by_budget = {}
+    for row in rows:
+        budget = budgets[row.parent]
+        estimation = estimations[budget.project_estimation]
+        total_budget = flt(estimation.total_project_cost)
+
+        values = {}
+        if row.category in field_by_category:
+            amount = flt(estimation[field_by_category[row.category]])
+            if flt(row.amount) != amount:
+                values["amount"] = row.amount = amount
+
+            # Same derivations as ProjectBudget.calculate_budget_totals
+            percentage = amount / total_budget * 100 if amount and total_budget else row.percentage_of_total
+            if flt(percentage) != flt(row.percentage_of_total):
+                values["percentage_of_total"] = percentage
+            if amount and row.actual_spent and flt(row.variance) != flt(row.actual_spent) - amount:
+                values["variance"] = row.variance = flt(row.actual_spent) - amount
+
+        if values:
+            category_updates[row.name] = values
+        rows_by_budget.setdefault(row.parent, []).append(row)
+
+    changed_budgets = {row.parent for row in rows if row.name in category_updates}
+    changed_budgets.update(
+        name for name, budget in budgets.items()
+        if flt(budget.total_budget) != flt(estimations[budget.project_estimation].total_project_cost)
+    )
+
+    budget_updates = {}
+    for name in changed_budgets:
+        budget_rows = rows_by_budget.get(name, [])
+        total_budgeted = sum(flt(row.amount) for row in budget_rows)
+        total_variance = sum(flt(row.variance) for row in budget_rows)
+        budget_updates[name] = {
+            "total_budget": flt(estimations[budgets[name].project_estimation].total_project_cost),
+            "total_budgeted_amount": total_budgeted,
+            "total_actual_spent": sum(flt(row.actual_spent) for row in budget_rows),
+            "total_variance": total_variance,
+            "variance_percentage": total_variance / total_budgeted * 100 if total_budgeted else 0
+        }
+
+    if category_updates:
+        frappe.db.bulk_update("Project Budget Category", category_updates, update_modified=False)
+    if budget_updates:
+        frappe.db.bulk_update("Project Budget", budget_updates)
+
+    return {"categories": len(category_updates), "budgets": len(budget_updates)}
+
+
+@frappe.whitelist()
+def sync_project_budgets(project_estimations):
+    """
+    Sync the budgets of one or more Project Estimations on demand
+
+    Args:
+        project_estimations: Project Estimation name or JSON list of names
+    """
+    if isinstance(project_estimations, str):
+        project_estimations = frappe.parse_json(project_estimations) if project_estimations.startswith("[") \
+            else [project_estimations]
+
+    frappe.has_permission("Project Budget", "write", throw=True)
+    return sync_budgets_from_estimations(project_estimations)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Change-data capture for Construction Project budget lines.
+
+Budget line changes are compared with the values before save and only the
+changed fields are captured. Captured rows are queued for the transaction and
+written with one bulk insert just before it commits, so a project save that
+touches hundreds of lines costs a single INSERT.
+
+A daily job compacts old history: individual changes older than
+DAILY_AFTER_DAYS are folded into one row per budget line and day, and daily rows
+of whole months older than MONTHLY_AFTER_DAYS into one row per month. Rows
+already compacted for a period are folded again with the new ones, so each
+line keeps one row per period. Folding keeps the last value of every field, so
+the state at the end of each period is preserved.
+"""
+
+from __future__ import unicode_literals
+import json
+
+import frappe
+from frappe.utils import getdate, add_days, flt, nowdate, now_datetime, get_first_day
+
+from advanced_construction_erp.utils import enqueue_before_commit
+
+TRACKED_FIELDS = ("quantity", "rate", "amount", "actual_amount", "variance")
+HISTORY_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "construction_project", "budget_item", "item_code", "item_name", "date", "period_type",
+    "change_count", "changed_fields"] + list(TRACKED_FIELDS)
+
+DAILY_AFTER_DAYS = 7
+MONTHLY_AFTER_DAYS = 90
+
+
+def capture_budget_change(doc, before=None):
+    """
+    Queue a history row for the fields of a budget line that changed
+
+    Args:
+        doc: The Construction Project Budget row
+        before: The row as it was before the save (defaults to `doc.get_doc_before_save()`)
+    """
+    if not doc.name or doc.parenttype != "Construction Project":
+        return
+
+    if before is None:
+        before = doc.get_doc_before_save()
+
+    changed = {
+        field: flt(doc.get(field))
+        for field in TRACKED_FIELDS
+        if before is None or flt(doc.get(field)) != flt(before.get(field))
+    }
+    if not changed:
+        return
+
+    record_budget_changes([{
+        "construction_project": doc.parent,
+        "budget_item": doc.name,
+        "item_code": doc.item_code,
+        "item_name": doc.item_name,
+        "changes": changed
+    }])
+
+
+def capture_project_budget_changes(project):
+    """
+    Queue history rows for every budget line of a Construction Project changed by this save
+
+    Args:
+        project: The Construction Project document being saved
+    """
+    before = project.get_doc_before_save()
+    before_rows = {row.name: row for row in before.get("budget_items", [])} if before else {}
+
+    for item in project.get("budget_items", []):
+        capture_budget_change(item, before_rows.get(item.name))
+
+
+def record_budget_changes(changes):
+    """
+    Queue history rows to be written just before the transaction commits
+
+    Args:
+        changes: List of dicts with construction_project, budget_item, item_code, item_name and
+            `changes` (field -> new value)
+    """
+    timestamp = now_datetime()
+    user = frappe.session.user
+
+    enqueue_before_commit("construction_project_budget_history", [
+        (str(timestamp), user, row["construction_project"], row["budget_item"], row.get("item_code"),
+            row.get("item_name"), json.dumps(row["changes"], sort_keys=True))
+        for row in changes
+    ], _insert_history_rows)
+
+
+def _insert_history_rows(rows):
+    values = []
+    for timestamp, user, construction_project, budget_item, item_code, item_name, changes in sorted(rows):
+        changed = json.loads(changes)
+        values.append(
+            (frappe.generate_hash(length=12), timestamp, timestamp, user, user, 0,
+                construction_project, budget_item, item_code, item_name, getdate(timestamp), "Change",
+                1, ",".join(sorted(changed)))
+            + tuple(changed.get(field) for field in TRACKED_FIELDS)
+        )
+
+    frappe.db.bulk_insert("Construction Project Budget History", HISTORY_COLUMNS, values)
+
+
+def compact_budget_history(chunk_size=500):
+    """
+    Daily scheduled job that folds old changes into daily and monthly summary rows
+    """
+    today = getdate(nowdate())
+    _compact("Change", "Daily", add_days(today, -DAILY_AFTER_DAYS), chunk_size)
+    # Only whole months, so each month is folded once instead of a day at a time
+    _compact("Daily", "Monthly", get_first_day(add_days(today, -MONTHLY_AFTER_DAYS)), chunk_size)
+
+
+def _compact(source_type, target_type, before_date, chunk_size):
+    """
+    Fold `source_type` rows dated before `before_date` into one `target_type` row per line and period
+
+    Existing `target_type` rows of the periods being folded are merged in and replaced.
+    """
+    budget_items = frappe.db.sql_list("""
+        SELECT DISTINCT budget_item
+        FROM `tabConstruction Project Budget History`
+        WHERE IFNULL(period_type, 'Change') = %s AND date < %s
+    """, (source_type, before_date))
+
+    for start in range(0, len(budget_items), chunk_size):
+        chunk = budget_items[start:start + chunk_size]
+        rows = frappe.db.sql("""
+            SELECT name, creation, construction_project, budget_item, item_code, item_name, date,
+                IFNULL(period_type, 'Change') as period_type, change_count, changed_fields, {fields}
+            FROM `tabConstruction Project Budget History`
+            WHERE budget_item IN %(items)s AND IFNULL(period_type, 'Change') IN %(period_types)s
+                AND date < %(before_date)s
+            ORDER BY date, creation
+        """.format(fields=", ".join(TRACKED_FIELDS)),
+            {"items": chunk, "period_types": (source_type, target_type), "before_date": before_date}, as_dict=1)
+
+        summaries = {}
+        for row in rows:
+            period = row.date.strftime("%Y-%m") if target_type == "Monthly" else row.date
+            summary = summaries.get((row.budget_item, period))
+            if not summary:
+                summary = summaries[(row.budget_item, period)] = frappe._dict(row, change_count=0, fields=set(),
+                    names=[], has_source=False)
+
+            # Later rows win; fields a row did not capture keep the earlier value
+            summary.update({field: row[field] for field in TRACKED_FIELDS if row[field] is not None})
+            summary.update({"date": row.date, "creation": row.creation, "item_code": row.item_code,
+                "item_name": row.item_name, "construction_project": row.construction_project or summary.construction_project})
+            summary.change_count += row.change_count or 1
+            summary.fields.update(field for field in (row.changed_fields or ",".join(TRACKED_FIELDS)).split(",") if field)
+            summary.names.append(row.name)
+            summary.has_source = summary.has_source or row.period_type == source_type
+
+        # Periods with no new rows keep their existing summary untouched
+        summaries = [summary for summary in summaries.values() if summary.has_source]
+
+        timestamp = now_datetime()
+        frappe.db.bulk_insert("Construction Project Budget History", HISTORY_COLUMNS, [
+            (frappe.generate_hash(length=12), summary.creation, timestamp, "Administrator", "Administrator", 0,
+                summary.construction_project, summary.budget_item, summary.item_code, summary.item_name,
+                summary.date, target_type, summary.change_count, ",".join(sorted(summary.fields)))
+            + tuple(summary[field] for field in TRACKED_FIELDS)
+            for summary in summaries
+        ])
+        folded = [name for summary in summaries for name in summary.names]
+        if folded:
+            frappe.db.delete("Construction Project Budget History", {"name": ["in", folded]})
+        frappe.db.commit()
+
+
+def get_budget_history(budget_items=None, construction_project=None, from_date=None, to_date=None):
+    """
+    Get the state of budget lines after each recorded change within a date range
+
+    Rows only hold the fields that changed, so values are carried forward from earlier rows.
+    Compaction keeps the number of rows per line small, so earlier rows are read in full.
+
+    Args:
+        budget_items: List of Construction Project Budget names
+        construction_project: Alternatively, every budget line of a Construction Project
+        from_date: Start of the range (inclusive)
+        to_date: End of the range (inclusive)
+
+    Returns:
+        Dict of budget line -> list of rows with date, period_type and the tracked fields
+    """
+    filters = {}
+    if budget_items:
+        filters["budget_item"] = ["in", budget_items]
+    elif construction_project:
+        filters["construction_project"] = construction_project
+    else:
+        return {}
+
+    if to_date:
+        filters["date"] = ["<=", getdate(to_date)]
+
+    from_date = getdate(from_date) if from_date else None
+    history = {}
+    state = {}
+    for row in frappe.get_all("Construction Project Budget History",
+        filters=filters,
+        fields=["budget_item", "date", "period_type"] + list(TRACKED_FIELDS),
+        order_by="date, creation"
+    ):
+        current = state.setdefault(row.budget_item, {})
+        current.update({field: row[field] for field in TRACKED_FIELDS if row[field] is not None})
+
+        if from_date and row.date < from_date:
+            continue
+
+        entry = frappe._dict(current, date=row.date, period_type=row.period_type or "Change")
+        history.setdefault(row.budget_item, []).append(entry)
+
+    return history
+
+
+@frappe.whitelist()
+def get_project_budget_history(construction_project, from_date=None, to_date=None):
+    """
+    Get the budget history of every line of a Construction Project
+
+    Args:
+        construction_project: The name of the Construction Project
+        from_date: Start of the range (inclusive)
+        to_date: End of the range (inclusive)
+    """
+    frappe.has_permission("Construction Project", "read", construction_project, throw=True)
+    return get_budget_history(construction_project=construction_project, from_date=from_date, to_date=to_date)
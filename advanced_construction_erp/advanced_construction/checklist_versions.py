@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Versioned Quality Checklist item storage.
+
+Every checklist item's content is stored once in Quality Checklist Item
+Content, named by a hash of the content, so versions share unchanged items. On
+submit a version records its item_manifest: the content hashes in sequence.
+
+Only the working versions keep their own item rows. When a new version is
+submitted, the previous active versions are marked Obsolete with one UPDATE
+and their item rows are dropped with one DELETE. Their items stay available
+through the manifest. `resolve_checklist_items` returns the item set of any
+version and caches it for submitted versions.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now_datetime
+
+CONTENT_FIELDS = ["check_name", "specification", "inspection_method", "expected_value",
+    "acceptance_criteria", "is_critical", "reference_standard"]
+CONTENT_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + CONTENT_FIELDS
+
+# Resolved item sets of submitted versions, which never change
+ITEMS_KEY = "quality_checklist_items"
+
+
+def get_content_hash(item):
+    """Hash identifying the content of a checklist item"""
+    content = [str(cint(item.get(field))) if field == "is_critical" else (item.get(field) or "")
+        for field in CONTENT_FIELDS]
+    return hashlib.md5(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def store_checklist_items(checklist):
+    """
+    Store the item contents of a checklist version and record its manifest
+
+    Contents already stored by another version are not written again.
+
+    Args:
+        checklist: The Quality Checklist being submitted
+    """
+    items = sorted(checklist.items or [], key=lambda item: (cint(item.sequence), item.idx))
+    contents = {get_content_hash(item): item for item in items}
+
+    existing = set(frappe.get_all("Quality Checklist Item Content",
+        filters={"name": ["in", list(contents)]}, pluck="name")) if contents else set()
+
+    timestamp = now_datetime()
+    frappe.db.bulk_insert("Quality Checklist Item Content", CONTENT_COLUMNS, [
+        (content_hash, timestamp, timestamp, frappe.session.user, frappe.session.user, 0)
+        + tuple(cint(item.get(field)) if field == "is_critical" else item.get(field) for field in CONTENT_FIELDS)
+        for content_hash, item in contents.items()
+        if content_hash not in existing
+    ], ignore_duplicates=True)
+
+    checklist.db_set("item_manifest", json.dumps([get_content_hash(item) for item in items]), update_modified=False)
+
+
+def deactivate_previous_versions(checklist):
+    """
+    Mark the other active versions of a checklist Obsolete and drop their item rows
+
+    Args:
+        checklist: The Quality Checklist version becoming active
+
+    Returns:
+        List of the deactivated version names
+    """
+    previous = frappe.get_all("Quality Checklist",
+        filters={
+            "checklist_name": checklist.checklist_name,
+            "status": "Active",
+            # Versions created before checklists were submittable are still drafts
+            "docstatus": ["<", 2],
+            "name": ["!=", checklist.name]
+        },
+        pluck="name"
+    )
+    if not previous:
+        return []
+
+    frappe.db.set_value("Quality Checklist", {"name": ["in", previous]}, "status", "Obsolete")
+
+    # Versions with a manifest resolve their items from the shared content store
+    with_manifest = frappe.get_all("Quality Checklist",
+        filters={"name": ["in", previous], "item_manifest": ["is", "set"]}, pluck="name")
+    if with_manifest:
+        frappe.db.delete("Quality Checklist Item", {"parenttype": "Quality Checklist", "parent": ["in", with_manifest]})
+
+    for name in previous:
+        frappe.cache().hdel(ITEMS_KEY, name)
+
+    return previous
+
+
+def resolve_checklist_items(checklist):
+    """
+    Get the items of any checklist version in sequence, without loading the document
+
+    Args:
+        checklist: The name of the Quality Checklist
+
+    Returns:
+        List of dicts with the fields in CONTENT_FIELDS
+    """
+    docstatus = frappe.db.get_value("Quality Checklist", checklist, "docstatus")
+    if docstatus is None:
+        frappe.throw(_("Quality Checklist {0} not found").format(checklist))
+
+    if cint(docstatus) == 1:
+        return frappe.cache().hget(ITEMS_KEY, checklist, generator=lambda: _load_items(checklist))
+
+    return _load_items(checklist)
+
+
+def _load_items(checklist):
+    items = frappe.get_all("Quality Checklist Item",
+        filters={"parenttype": "Quality Checklist", "parent": checklist},
+        fields=CONTENT_FIELDS,
+        order_by="sequence, idx"
+    )
+    if items:
+        return items
+
+    manifest = json.loads(frappe.db.get_value("Quality Checklist", checklist, "item_manifest") or "[]")
+    if not manifest:
+        return []
+
+    contents = {row.name: row for row in frappe.get_all("Quality Checklist Item Content",
+        filters={"name": ["in", list(set(manifest))]},
+        fields=["name"] + CONTENT_FIELDS
+    )}
+
+    return [
+        frappe._dict({field: contents[content_hash][field] for field in CONTENT_FIELDS})
+        for content_hash in manifest
+        if content_hash in contents
+    ]
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Time-phased cost and progress snapshots.
+
+A daily job copies project, budget line and WBS metrics into the append-only
+Construction Cost Snapshot table. Trend charts and month-end reports read the
+snapshots by date range instead of scanning the live documents.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import getdate, add_days, flt, nowdate, now_datetime
+
+from advanced_construction_erp.advanced_construction.earned_value import ACTIVE_STATUSES
+
+LEVELS = ("Project", "Budget Item", "WBS")
+SNAPSHOT_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "snapshot_date", "period", "level", "construction_project", "reference_name", "item_code",
+    "budgeted_amount", "actual_amount", "variance", "progress"]
+VALUE_FIELDS = ["snapshot_date", "construction_project", "reference_name", "item_code",
+    "budgeted_amount", "actual_amount", "variance", "progress"]
+
+# How far back an as-of query looks for the last snapshot of each entity
+AS_OF_LOOKBACK_DAYS = 31
+
+
+def take_cost_snapshots(snapshot_date=None, chunk_size=500):
+    """
+    Daily scheduled job that snapshots every active project, its budget lines and its WBS
+
+    Re-running for the same date replaces that day's rows.
+
+    Args:
+        snapshot_date: Date of the snapshot (defaults to today)
+        chunk_size: Number of projects written per commit
+    """
+    snapshot_date = getdate(snapshot_date or nowdate())
+    projects = frappe.get_all("Construction Project",
+        filters={"status": ["in", ACTIVE_STATUSES]},
+        fields=["name", "project", "total_budget", "actual_cost", "cost_variance", "progress"],
+        order_by="name"
+    )
+
+    for start in range(0, len(projects), chunk_size):
+        chunk = projects[start:start + chunk_size]
+        rows = get_snapshot_rows(chunk)
+
+        frappe.db.delete("Construction Cost Snapshot", {
+            "construction_project": ["in", [project.name for project in chunk]],
+            "snapshot_date": snapshot_date
+        })
+
+        timestamp = now_datetime()
+        period = snapshot_date.strftime("%Y-%m")
+        frappe.db.bulk_insert("Construction Cost Snapshot", SNAPSHOT_COLUMNS, [
+            (frappe.generate_hash(length=12), timestamp, timestamp, "Administrator", "Administrator", 0,
+                snapshot_date, period) + row
+            for row in rows
+        ])
+        frappe.db.commit()
+
+
+def get_snapshot_rows(projects):
+    """
+    Collect snapshot values for a chunk of projects with one query per level
+
+    Args:
+        projects: List of Construction Project rows with name, project, total_budget,
+            actual_cost, cost_variance and progress
+
+    Returns:
+        List of (level, construction_project, reference_name, item_code, budgeted_amount,
+        actual_amount, variance, progress) tuples
+    """
+    names = [project.name for project in projects]
+    rows = [
+        ("Project", project.name, None, None, flt(project.total_budget), flt(project.actual_cost),
+            flt(project.cost_variance), flt(project.progress))
+        for project in projects
+    ]
+
+    for line in frappe.get_all("Construction Project Budget",
+        filters={"parenttype": "Construction Project", "parent": ["in", names]},
+        fields=["name", "parent", "item_code", "amount", "actual_amount", "variance"]
+    ):
+        rows.append(("Budget Item", line.parent, line.name, line.item_code, flt(line.amount),
+            flt(line.actual_amount), flt(line.variance), None))
+
+    # WBS documents point at the ERPNext Project behind the Construction Project
+    construction_project_by_project = {project.project: project.name for project in projects if project.project}
+    if construction_project_by_project:
+        for wbs in frappe.get_all("Work Breakdown Structure",
+            filters={"project": ["in", list(construction_project_by_project)]},
+            fields=["name", "project", "estimated_cost", "actual_cost", "progress"]
+        ):
+            rows.append(("WBS", construction_project_by_project[wbs.project], wbs.name, None,
+                flt(wbs.estimated_cost), flt(wbs.actual_cost),
+                flt(wbs.actual_cost) - flt(wbs.estimated_cost), flt(wbs.progress)))
+
+    return rows
+
+
+@frappe.whitelist()
+def get_snapshot_as_of(as_of, level="Project", projects=None):
+    """
+    Get the portfolio as it looked on a date
+
+    Returns the latest snapshot on or before `as_of` for each entity, looking back at most
+    AS_OF_LOOKBACK_DAYS so the query stays on a bounded index range.
+
+    Args:
+        as_of: The reporting date
+        level: Project, Budget Item or WBS
+        projects: Optional Construction Project name or JSON list of names (defaults to every
+            project the user can read)
+
+    Returns:
+        List of snapshot rows
+    """
+    frappe.has_permission("Construction Cost Snapshot", "read", throw=True)
+    _validate_level(level)
+
+    projects = _get_permitted_projects(projects)
+    if not projects:
+        return []
+
+    as_of = getdate(as_of)
+    values = {"level": level, "from_date": add_days(as_of, -AS_OF_LOOKBACK_DAYS), "as_of": as_of,
+        "projects": projects}
+
+    return frappe.db.sql("""
+        SELECT {fields}
+        FROM `tabConstruction Cost Snapshot` s
+        JOIN (
+            SELECT construction_project AS project, IFNULL(reference_name, '') AS reference, MAX(snapshot_date) AS last_date
+            FROM `tabConstruction Cost Snapshot`
+            WHERE level = %(level)s AND snapshot_date BETWEEN %(from_date)s AND %(as_of)s
+                AND construction_project IN %(projects)s
+            GROUP BY construction_project, IFNULL(reference_name, '')
+        ) latest
+            ON latest.project = s.construction_project
+            AND latest.reference = IFNULL(s.reference_name, '')
+            AND latest.last_date = s.snapshot_date
+        WHERE s.level = %(level)s
+        ORDER BY s.construction_project, s.reference_name
+    """.format(
+        fields=", ".join("s.{0}".format(field) for field in VALUE_FIELDS)
+    ), values, as_dict=1)
+
+
+@frappe.whitelist()
+def get_snapshot_series(from_date, to_date, level="Project", projects=None, reference_names=None, granularity="Daily"):
+    """
+    Get snapshot series over a date range
+
+    Args:
+        from_date: Start of the range (inclusive)
+        to_date: End of the range (inclusive)
+        level: Project, Budget Item or WBS
+        projects: Optional Construction Project name or JSON list of names (defaults to every
+            project the user can read)
+        reference_names: Optional JSON list of budget line or WBS names
+        granularity: Daily, or Monthly to keep only the last snapshot of each month
+
+    Returns:
+        Dict of entity key -> list of rows ordered by date. The key is the project name for
+        project rows and the budget line or WBS name otherwise
+    """
+    frappe.has_permission("Construction Cost Snapshot", "read", throw=True)
+    _validate_level(level)
+
+    projects = _get_permitted_projects(projects)
+    if not projects:
+        return {}
+
+    filters = {"level": level, "snapshot_date": ["between", [getdate(from_date), getdate(to_date)]],
+        "construction_project": ["in", projects]}
+    if reference_names:
+        filters["reference_name"] = ["in", frappe.parse_json(reference_names)]
+
+    series = {}
+    for row in frappe.get_all("Construction Cost Snapshot",
+        filters=filters,
+        fields=VALUE_FIELDS + ["period"],
+        order_by="snapshot_date"
+    ):
+        key = row.reference_name if level != "Project" else row.construction_project
+        entity = series.setdefault(key, [])
+
+        # Rows arrive in date order, so the last row seen for a month is its month-end value
+        if granularity == "Monthly" and entity and entity[-1].period == row.period:
+            entity[-1] = row
+        else:
+            entity.append(row)
+
+    return series
+
+
+def _validate_level(level):
+    if level not in LEVELS:
+        frappe.throw(_("Level must be one of {0}").format(", ".join(LEVELS)))
+
+
+def _parse_projects(projects):
+    if not projects:
+        return None
+    if isinstance(projects, str):
+        return frappe.parse_json(projects) if projects.startswith("[") else [projects]
+    return projects
+
+
+def _get_permitted_projects(projects):
+    """
+    Construction Projects whose snapshots the user may read
+
+    Requested projects must all be readable; without a request, every project the user can
+    read is returned.
+    """
+    projects = _parse_projects(projects)
+    if not projects:
+        return frappe.get_list("Construction Project", pluck="name", limit_page_length=0)
+
+    for project in projects:
+        frappe.has_permission("Construction Project", "read", project, throw=True)
+
+    return projects
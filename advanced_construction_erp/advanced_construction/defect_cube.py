@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Quality defect analytics cube.
+
+Quality Defect Cube holds one row per combination of DIMENSIONS with additive
+MEASURES. Rows are named by a hash of their dimensions and maintained
+incrementally: submitting a Quality Inspection adds its failed checks,
+submitting a Non Conformance Report adds its issues and cost of rework, and
+cancelling either adds the same deltas negated, all with one
+INSERT ... ON DUPLICATE KEY UPDATE. Slice and dice queries group the compact
+cube instead of scanning inspections, reports and their child tables.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, flt, cint, now_datetime
+
+DIMENSIONS = ("project", "period", "inspection_type", "check_name", "supplier", "severity")
+MEASURES = ("fail_count", "critical_fail_count", "ncr_issue_count", "cost_of_rework")
+CHECK_NAME_LENGTH = 140
+UPSERT_CHUNK_SIZE = 500
+MAX_ROWS = 1000
+
+
+def get_cube_name(key):
+    """Deterministic name of the cube row for a tuple of DIMENSIONS values"""
+    return hashlib.md5("\n".join(value or "" for value in key).encode("utf-8")).hexdigest()
+
+
+def get_period(date):
+    return getdate(date).strftime("%Y-%m") if date else None
+
+
+def get_supplier(reference_type, reference_name):
+    """Supplier of the received material an inspection or report refers to"""
+    if reference_type == "Purchase Receipt" and reference_name:
+        return frappe.db.get_value("Purchase Receipt", reference_name, "supplier")
+
+
+def apply_deltas(deltas):
+    """
+    Add measure deltas to the cube
+
+    Args:
+        deltas: Dict of DIMENSIONS tuple -> dict of measure -> delta
+    """
+    timestamp = now_datetime()
+    rows = [
+        (get_cube_name(key), timestamp, timestamp, "Administrator", "Administrator", 0) + tuple(key)
+        + tuple(values.get(measure, 0) for measure in MEASURES)
+        for key, values in deltas.items()
+    ]
+
+    columns = ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + list(DIMENSIONS) + list(MEASURES)
+    updates = ", ".join("`{0}` = `{0}` + VALUES(`{0}`)".format(measure) for measure in MEASURES)
+    placeholder = "({0})".format(", ".join(["%s"] * len(columns)))
+
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+        frappe.db.sql("""
+            INSERT INTO `tabQuality Defect Cube` ({columns})
+            VALUES {values}
+            ON DUPLICATE KEY UPDATE {updates}, modified = VALUES(modified)
+        """.format(
+            columns=", ".join("`{0}`".format(column) for column in columns),
+            values=", ".join([placeholder] * len(chunk)),
+            updates=updates
+        ), [value for row in chunk for value in row])
+
+
+def record_inspection_defects(inspection, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) the failed checks of a Quality Inspection
+
+    Args:
+        inspection: The Quality Inspection
+        sign: 1 on submit, -1 on cancel
+    """
+    supplier = get_supplier(inspection.reference_type, inspection.reference_name)
+    period = get_period(inspection.inspection_date)
+
+    deltas = {}
+    for item in inspection.checklist_items or []:
+        if item.status != "Fail":
+            continue
+
+        key = (inspection.project, period, inspection.inspection_type, (item.check_name or "")[:CHECK_NAME_LENGTH],
+            supplier, "Critical" if cint(item.is_critical) else None)
+        values = deltas.setdefault(key, {})
+        values["fail_count"] = values.get("fail_count", 0) + sign
+        values["critical_fail_count"] = values.get("critical_fail_count", 0) + sign * cint(item.is_critical)
+
+    if deltas:
+        apply_deltas(deltas)
+
+
+def record_ncr_defects(ncr, sign=1, cost_of_rework=None):
+    """
+    Add (sign=1) or remove (sign=-1) the issues and cost of rework of a Non Conformance Report
+
+    The cost of rework is spread evenly over the report's issues.
+
+    Args:
+        ncr: The Non Conformance Report
+        sign: 1 on submit, -1 on cancel
+        cost_of_rework: Cost to record instead of `ncr.cost_of_rework`, with issue counts left
+            unchanged (used for cost corrections after submit)
+    """
+    issues = ncr.issues or []
+    if not issues:
+        return
+
+    inspection_type = frappe.db.get_value("Quality Inspection", ncr.inspection, "inspection_type") \
+        if ncr.inspection else None
+    supplier = get_supplier(ncr.reference_type, ncr.reference_name)
+    period = get_period(ncr.date_identified)
+    cost = flt(ncr.cost_of_rework if cost_of_rework is None else cost_of_rework) / len(issues)
+
+    deltas = {}
+    for issue in issues:
+        key = (ncr.project, period, inspection_type, (issue.issue_description or "")[:CHECK_NAME_LENGTH],
+            supplier, ncr.severity)
+        values = deltas.setdefault(key, {})
+        if cost_of_rework is None:
+            values["ncr_issue_count"] = values.get("ncr_issue_count", 0) + sign
+        values["cost_of_rework"] = values.get("cost_of_rework", 0) + sign * cost
+
+    apply_deltas(deltas)
+
+
+def update_ncr_rework_cost(ncr):
+    """Record a change of the cost of rework on a submitted Non Conformance Report"""
+    before = ncr.get_doc_before_save()
+    if not before:
+        return
+
+    delta = flt(ncr.cost_of_rework) - flt(before.cost_of_rework)
+    if delta:
+        record_ncr_defects(ncr, cost_of_rework=delta)
+
+
+def rebuild_defect_cube():
+    """Rebuild the cube from every submitted Quality Inspection and Non Conformance Report"""
+    params = {"month_format": "%Y-%m", "length": CHECK_NAME_LENGTH}
+    deltas = {}
+
+    for row in frappe.db.sql("""
+        SELECT qi.project, DATE_FORMAT(qi.inspection_date, %(month_format)s), qi.inspection_type,
+            LEFT(IFNULL(qii.check_name, ''), %(length)s), pr.supplier, IF(qii.is_critical = 1, 'Critical', NULL),
+            COUNT(*), SUM(qii.is_critical = 1)
+        FROM `tabQuality Inspection` qi
+        JOIN `tabQuality Inspection Item` qii ON qii.parent = qi.name AND qii.parenttype = 'Quality Inspection'
+        LEFT JOIN `tabPurchase Receipt` pr ON qi.reference_type = 'Purchase Receipt' AND pr.name = qi.reference_name
+        WHERE qi.docstatus = 1 AND qii.status = 'Fail'
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """, params):
+        values = deltas.setdefault(tuple(row[:6]), {})
+        values["fail_count"] = cint(row[6])
+        values["critical_fail_count"] = cint(row[7])
+
+    for row in frappe.db.sql("""
+        SELECT ncr.project, DATE_FORMAT(ncr.date_identified, %(month_format)s), qi.inspection_type,
+            LEFT(IFNULL(nci.issue_description, ''), %(length)s), pr.supplier, ncr.severity,
+            COUNT(*), SUM(IFNULL(ncr.cost_of_rework, 0) / ic.issue_count)
+        FROM `tabNon Conformance Report` ncr
+        JOIN `tabNon Conformance Issue` nci ON nci.parent = ncr.name AND nci.parenttype = 'Non Conformance Report'
+        JOIN (
+            SELECT parent, COUNT(*) as issue_count
+            FROM `tabNon Conformance Issue`
+            WHERE parenttype = 'Non Conformance Report'
+            GROUP BY parent
+        ) ic ON ic.parent = ncr.name
+        LEFT JOIN `tabQuality Inspection` qi ON qi.name = ncr.inspection
+        LEFT JOIN `tabPurchase Receipt` pr ON ncr.reference_type = 'Purchase Receipt' AND pr.name = ncr.reference_name
+        WHERE ncr.docstatus = 1
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """, params):
+        values = deltas.setdefault(tuple(row[:6]), {})
+        values["ncr_issue_count"] = cint(row[6])
+        values["cost_of_rework"] = flt(row[7])
+
+    frappe.db.delete("Quality Defect Cube")
+    apply_deltas(deltas)
+
+
+@frappe.whitelist()
+def rebuild_quality_defect_cube():
+    """Rebuild the defect cube on demand"""
+    frappe.only_for("System Manager")
+    rebuild_defect_cube()
+
+
+@frappe.whitelist()
+def get_defect_analytics(dimensions, filters=None, order_by="fail_count", limit=100):
+    """
+    Slice and dice the defect cube
+
+    Args:
+        dimensions: JSON list of DIMENSIONS to group by, e.g. ["supplier", "period"]
+        filters: JSON dict of dimension -> value or list of values; `from_period` and
+            `to_period` (YYYY-MM) bound the period
+        order_by: Measure to sort by, descending
+        limit: Maximum number of rows (at most MAX_ROWS)
+
+    Returns:
+        List of dicts with the requested dimensions and every measure
+    """
+    frappe.has_permission("Quality Defect Cube", "read", throw=True)
+
+    dimensions = frappe.parse_json(dimensions) if isinstance(dimensions, str) else dimensions
+    filters = (frappe.parse_json(filters) if isinstance(filters, str) else filters) or {}
+
+    invalid = [d for d in list(dimensions) + [f for f in filters if f not in ("from_period", "to_period")]
+        if d not in DIMENSIONS]
+    if invalid:
+        frappe.throw(_("Unknown dimensions: {0}").format(", ".join(invalid)))
+    if order_by not in MEASURES:
+        frappe.throw(_("Cannot sort by {0}").format(order_by))
+
+    conditions = ["1=1"]
+    values = {"limit": min(cint(limit) or MAX_ROWS, MAX_ROWS)}
+    for field, value in filters.items():
+        if field == "from_period":
+            conditions.append("period >= %(from_period)s")
+        elif field == "to_period":
+            conditions.append("period <= %(to_period)s")
+        elif isinstance(value, (list, tuple)):
+            conditions.append("`{0}` IN %({0})s".format(field))
+        else:
+            conditions.append("`{0}` = %({0})s".format(field))
+        values[field] = value
+
+    group_by = ", ".join("`{0}`".format(d) for d in dimensions)
+    return frappe.db.sql("""
+        SELECT {select}{measures}
+        FROM `tabQuality Defect Cube`
+        WHERE {conditions}
+        {group_by}
+        HAVING {having}
+        ORDER BY `{order_by}` DESC
+        LIMIT %(limit)s
+    """.format(
+        select=group_by + ", " if group_by else "",
+        measures=", ".join("SUM(`{0}`) as `{0}`".format(measure) for measure in MEASURES),
+        conditions=" AND ".join(conditions),
+        group_by="GROUP BY " + group_by if group_by else "",
+        # Rows whose deltas cancelled out are not defects
+        having=" OR ".join("SUM(`{0}`) != 0".format(measure) for measure in MEASURES),
+        order_by=order_by
+    ), values, as_dict=1)
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Material demand planning from Master BOQ quantities.
+
+Each line of a project's latest approved Master BOQ is exploded through the
+material components of its Comprehensive Rate Analysis, grossed up for waste
+and reduced by the progress of the task that executes it. The requirement is
+due `lead_time_days` before the task starts and bucketed by week (Monday).
+
+Requirements are netted first against the project's open Construction
+Material Requests, then against the shared supply of each item (stock on hand,
+open purchase orders and open Material Requests, from Bin), earliest week
+first across the whole portfolio. What remains becomes one draft Construction
+Material Request per project and week, flagged `is_demand_suggestion`, which
+replaces the previous run's drafts. All inputs are read with a fixed number of
+set-based queries, so the nightly run stays cheap as projects grow.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import getdate, add_days, flt, nowdate
+
+from advanced_construction_erp.advanced_construction.earned_value import ACTIVE_STATUSES
+
+HORIZON_WEEKS = 12
+CHUNK_SIZE = 50
+
+
+def get_week_start(date):
+    date = getdate(date)
+    return add_days(date, -date.weekday())
+
+
+def get_boq_lines(projects):
+    """Leaf lines of the latest approved Master BOQ of each project"""
+    return frappe.db.sql("""
+        SELECT mb.project as construction_project, bi.name, bi.item_code, bi.rate_analysis, bi.task, bi.quantity
+        FROM `tabMaster BOQ` mb
+        JOIN `tabBOQ Item` bi ON bi.parent = mb.name AND bi.parenttype = 'Master BOQ'
+        WHERE mb.project IN %(projects)s AND mb.status = 'Approved' AND IFNULL(bi.is_group, 0) = 0
+            AND bi.quantity > 0
+            AND mb.revision_number = (
+                SELECT MAX(latest.revision_number) FROM `tabMaster BOQ` latest
+                WHERE latest.project = mb.project AND latest.status = 'Approved'
+            )
+    """, {"projects": projects}, as_dict=1)
+
+
+def get_requirements(projects, today=None):
+    """
+    Explode BOQ lines into weekly material requirements
+
+    Args:
+        projects: List of Construction Project names
+        today: Planning date (defaults to today)
+
+    Returns:
+        Dict of (construction_project, week start, item_code) -> dict with qty and unit_rate
+    """
+    today = getdate(today or nowdate())
+    horizon = add_days(get_week_start(today), 7 * HORIZON_WEEKS)
+
+    lines = get_boq_lines(projects)
+    if not lines:
+        return {}
+
+    analysis_by_work_item = dict(frappe.get_all("Comprehensive Rate Analysis",
+        filters={"status": "Approved", "work_item": ["in", list({line.item_code for line in lines if line.item_code})]},
+        fields=["work_item", "name"],
+        order_by="analysis_date",
+        as_list=1
+    ))
+
+    materials = {}
+    analyses = {line.rate_analysis or analysis_by_work_item.get(line.item_code) for line in lines} - {None, ""}
+    for row in frappe.get_all("Rate Analysis Material",
+        filters={"parenttype": "Comprehensive Rate Analysis", "parent": ["in", list(analyses)]},
+        fields=["parent", "material_item", "quantity_required", "waste_percentage", "lead_time_days", "unit_rate"]
+    ) if analyses else []:
+        if row.material_item and flt(row.quantity_required) > 0:
+            materials.setdefault(row.parent, []).append(row)
+
+    tasks = {
+        (row.parent, row.name): row for row in frappe.get_all("Construction Project Task",
+            filters={"parenttype": "Construction Project", "parent": ["in", projects]},
+            fields=["name", "parent", "start_date", "status", "progress"]
+        )
+    }
+    start_dates = dict(frappe.get_all("Construction Project",
+        filters={"name": ["in", projects]},
+        fields=["name", "expected_start_date"],
+        as_list=1
+    ))
+
+    requirements = {}
+    for line in lines:
+        task = tasks.get((line.construction_project, line.task)) if line.task else None
+        if task and task.status in ("Completed", "Cancelled"):
+            continue
+
+        remaining = flt(line.quantity) * (1 - flt(task.progress if task else 0) / 100)
+        start_date = getdate((task and task.start_date) or start_dates.get(line.construction_project) or today)
+
+        for material in materials.get(line.rate_analysis or analysis_by_work_item.get(line.item_code), []):
+            qty = remaining * flt(material.quantity_required) * (1 + flt(material.waste_percentage) / 100)
+            required_date = max(add_days(start_date, -int(material.lead_time_days or 0)), today)
+            week = get_week_start(required_date)
+            if qty <= 0 or week >= horizon:
+                continue
+
+            row = requirements.setdefault((line.construction_project, week, material.material_item),
+                {"qty": 0, "unit_rate": flt(material.unit_rate)})
+            row["qty"] += qty
+
+    return requirements
+
+
+def get_supply(item_codes):
+    """Stock on hand plus open purchase orders and Material Requests per item"""
+    return {
+        item_code: flt(qty) for item_code, qty in frappe.db.sql("""
+            SELECT item_code, SUM(actual_qty + ordered_qty + requested_qty)
+            FROM `tabBin`
+            WHERE item_code IN %(items)s
+            GROUP BY item_code
+        """, {"items": item_codes})
+    }
+
+
+def get_open_requests(projects, item_codes):
+    """Quantities on Construction Material Requests not yet turned into Material Requests"""
+    return {
+        (project, item_code): flt(qty) for project, item_code, qty in frappe.db.sql("""
+            SELECT cmr.construction_project, cmri.item, SUM(cmri.quantity)
+            FROM `tabConstruction Material Request` cmr
+            JOIN `tabConstruction Material Request Item` cmri
+                ON cmri.parent = cmr.name AND cmri.parenttype = 'Construction Material Request'
+            WHERE cmr.construction_project IN %(projects)s AND cmri.item IN %(items)s AND cmr.docstatus < 2
+                AND cmr.status NOT IN ('Ordered', 'Received', 'Rejected', 'Cancelled')
+                AND IFNULL(cmr.is_demand_suggestion, 0) = 0
+            GROUP BY cmr.construction_project, cmri.item
+        """, {"projects": projects, "items": item_codes})
+    }
+
+
+def net_requirements(requirements, supply, open_requests):
+    """
+    Net requirements against open requests, then shared supply, earliest week first
+
+    Returns:
+        Dict of (construction_project, week start, item_code) -> dict with net qty and unit_rate
+    """
+    supply = dict(supply)
+    open_requests = dict(open_requests)
+    net = {}
+
+    for key in sorted(requirements, key=lambda key: (key[1], key[0], key[2])):
+        project, week, item_code = key
+        qty = requirements[key]["qty"]
+
+        for pool, pool_key in ((open_requests, (project, item_code)), (supply, item_code)):
+            covered = min(qty, max(pool.get(pool_key, 0), 0))
+            pool[pool_key] = pool.get(pool_key, 0) - covered
+            qty -= covered
+
+        if qty > 1e-6:
+            net[key] = {"qty": qty, "unit_rate": requirements[key]["unit_rate"]}
+
+    return net
+
+
+def plan_material_demand(projects, today=None):
+    """
+    Compute net weekly material demand for a set of projects
+
+    Returns:
+        Dict of (construction_project, week start, item_code) -> dict with qty and unit_rate
+    """
+    requirements = get_requirements(projects, today)
+    if not requirements:
+        return {}
+
+    item_codes = list({key[2] for key in requirements})
+    return net_requirements(requirements, get_supply(item_codes), get_open_requests(projects, item_codes))
+
+
+def make_suggested_requests(demand, today=None):
+    """
+    Insert one draft Construction Material Request per project and week of net demand
+
+    Drafts are inserted as documents so titles, totals and the ERPNext project are set by
+    the controller. Items without an enabled Construction Material are left out.
+
+    Returns:
+        List of the Construction Material Request names created
+    """
+    today = getdate(today or nowdate())
+
+    materials = {
+        row.item: row for row in frappe.get_all("Construction Material",
+            filters={"item": ["in", list({key[2] for key in demand})], "disabled": 0},
+            fields=["name", "material_name", "item", "unit_of_measure", "default_warehouse", "standard_rate"]
+        )
+    } if demand else {}
+
+    grouped = {}
+    for (project, week, item_code), row in sorted(demand.items()):
+        material = materials.get(item_code)
+        if material:
+            grouped.setdefault((project, week), []).append({
+                "material": material.name,
+                "material_name": material.material_name,
+                "item": item_code,
+                "quantity": flt(row["qty"], 3),
+                "uom": material.unit_of_measure,
+                "estimated_price": flt(material.standard_rate) or row["unit_rate"],
+                "schedule_date": week,
+                "warehouse": material.default_warehouse
+            })
+
+    names = []
+    for count, ((project, week), items) in enumerate(sorted(grouped.items()), 1):
+        doc = frappe.get_doc({
+            "doctype": "Construction Material Request",
+            "title": _("Suggested materials for {0}, week of {1}").format(project, frappe.format(week, "Date")),
+            "construction_project": project,
+            "transaction_date": today,
+            "required_by_date": max(week, today),
+            "priority": "Medium",
+            "requested_by": frappe.session.user,
+            "purpose": "Construction",
+            "is_demand_suggestion": 1,
+            "items": items
+        })
+        doc.insert(ignore_permissions=True)
+        names.append(doc.name)
+
+        if count % CHUNK_SIZE == 0:
+            frappe.db.commit()
+
+    return names
+
+
+def clear_suggested_requests(projects):
+    """Delete the draft suggestions of the given projects"""
+    names = frappe.get_all("Construction Material Request",
+        filters={"construction_project": ["in", projects], "is_demand_suggestion": 1, "docstatus": 0},
+        pluck="name"
+    )
+    if names:
+        frappe.db.delete("Construction Material Request Item",
+            {"parenttype": "Construction Material Request", "parent": ["in", names]})
+        frappe.db.delete("Construction Material Request", {"name": ["in", names]})
+
+
+def run_demand_planning(projects=None, today=None):
+    """
+    Nightly scheduled job that replans material demand for every active project
+
+    Supply is shared between projects, so the whole portfolio is netted in one pass.
+
+    Args:
+        projects: List of Construction Project names (defaults to every active project)
+        today: Planning date (defaults to today)
+
+    Returns:
+        List of the Construction Material Request drafts created
+    """
+    projects = projects or frappe.get_all("Construction Project",
+        filters={"status": ["in", ACTIVE_STATUSES]},
+        pluck="name"
+    )
+    if not projects:
+        return []
+
+    demand = plan_material_demand(projects, today)
+    clear_suggested_requests(projects)
+    names = make_suggested_requests(demand, today)
+    frappe.db.commit()
+
+    frappe.logger("construction_project").info(
+        "Material demand planning: {0} projects, {1} net requirements, {2} suggested requests".format(
+            len(projects), len(demand), len(names)))
+
+    return names
+
+
+@frappe.whitelist()
+def get_material_demand(construction_project):
+    """
+    Get the net weekly material demand of a Construction Project without creating requests
+
+    Netting only considers this project, so shared supply may be counted more generously
+    than in the nightly portfolio run.
+    """
+    frappe.has_permission("Construction Project", "read", construction_project, throw=True)
+
+    return [
+        {"week": week, "item_code": item_code, "qty": flt(row["qty"], 3), "unit_rate": row["unit_rate"]}
+        for (project, week, item_code), row in sorted(plan_material_demand([construction_project]).items())
+    ]
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionBudgetBalance(Document):
+    pass
+
+def on_doctype_update():
+    """Budget checks read the balances of one project by item"""
+    frappe.db.add_index("Construction Budget Balance", ["construction_project", "item_code"])
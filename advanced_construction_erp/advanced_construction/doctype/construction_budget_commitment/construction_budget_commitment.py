@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionBudgetCommitment(Document):
+    pass
+
+def on_doctype_update():
+    """Releases look up the entries of a voucher and the entries made against it"""
+    frappe.db.add_index("Construction Budget Commitment", ["voucher_type", "voucher_no"])
+    frappe.db.add_index("Construction Budget Commitment", ["against_voucher_type", "against_voucher_no"])
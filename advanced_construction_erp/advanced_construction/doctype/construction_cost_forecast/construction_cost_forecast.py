@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionCostForecast(Document):
+    pass
+
+def on_doctype_update():
+    """Dashboards read the latest forecast of one project"""
+    frappe.db.add_index("Construction Cost Forecast", ["construction_project", "forecast_date"])
+    frappe.db.add_index("Construction Cost Forecast", ["forecast_date", "level"])
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionCostSnapshot(Document):
+    pass
+
+def on_doctype_update():
+    """Snapshots are always read by level and date range, optionally for a set of projects"""
+    frappe.db.add_index("Construction Cost Snapshot", ["level", "snapshot_date"])
+    frappe.db.add_index("Construction Cost Snapshot", ["construction_project", "level", "snapshot_date"])
+    frappe.db.add_index("Construction Cost Snapshot", ["period", "level"])
@@ -7,6 +7,10 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 
+from advanced_construction_erp.advanced_construction.material_master import (
+    ITEM_SYNC_FIELDS, STOCK_FROZEN_FIELDS, get_item_updates, get_material_usage
+)
+
 class ConstructionMaterial(Document):
     def validate(self):
         self.validate_fixed_asset_settings()
@@ -31,36 +35,20 @@ class ConstructionMaterial(Document):
     def sync_with_item(self):
         """Sync with ERPNext Item if linked"""
         if self.item:
-            # Get the Item document
-            item = frappe.get_doc("Item", self.item)
-            
-            # Update the Item with Construction Material data
-            update_needed = False
-            
-            if item.item_name != self.material_name:
-                item.item_name = self.material_name
-                update_needed = True
-            
-            if item.description != self.description:
-                item.description = self.description
-                update_needed = True
-            
-            if item.disabled != self.disabled:
-                item.disabled = self.disabled
-                update_needed = True
-            
-            if item.is_stock_item != self.is_stock_item:
-                item.is_stock_item = self.is_stock_item
-                update_needed = True
-            
-            if item.stock_uom != self.unit_of_measure:
-                item.stock_uom = self.unit_of_measure
-                update_needed = True
-            
-            if update_needed:
-                item.flags.ignore_validate = True
-                item.flags.ignore_mandatory = True
-                item.save(ignore_permissions=True)
+            item = frappe.db.get_value("Item", self.item, list(ITEM_SYNC_FIELDS), as_dict=1)
+            if not item:
+                return
+
+            # The stock UOM and stock item flag of an Item with stock movements cannot change
+            updates = get_item_updates(self, item)
+            frozen = [field for field in STOCK_FROZEN_FIELDS if field in updates]
+            if frozen and frappe.db.exists("Stock Ledger Entry", {"item_code": self.item}):
+                updates = get_item_updates(self, item, has_stock=True)
+                frappe.msgprint(_("{0} of ERPNext Item {1} cannot be changed because it has stock transactions").format(
+                    ", ".join(_(frappe.get_meta("Item").get_label(field)) for field in frozen), self.item))
+
+            if updates:
+                frappe.db.set_value("Item", self.item, updates)
                 frappe.msgprint(_("ERPNext Item {0} has been updated").format(self.item))
     
     def on_trash(self):
@@ -70,9 +58,10 @@ class ConstructionMaterial(Document):
     
     def check_if_used_in_transactions(self):
         """Check if material is used in any transactions"""
-        # This is a placeholder for actual implementation
-        # In a real scenario, you would check various doctypes that might reference this material
-        pass
+        usage = get_material_usage([self.name]).get(self.name)
+        if usage:
+            frappe.throw(_("Cannot delete Construction Material {0} because it is used in {1}").format(
+                self.name, ", ".join("{0} ({1})".format(_(doctype), count) for doctype, count in usage.items())))
     
     @frappe.whitelist()
     def create_item(self):
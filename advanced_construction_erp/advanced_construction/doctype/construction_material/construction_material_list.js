@@ -0,0 +1,44 @@
+// Copyright (c) 2024, Your Company and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings['Construction Material'] = {
+	onload: function(listview) {
+		listview.page.add_inner_button(__('Import Catalogue'), function() {
+			let d = new frappe.ui.Dialog({
+				title: __('Import Construction Materials'),
+				fields: [
+					{
+						fieldname: 'file_url',
+						label: __('CSV File'),
+						fieldtype: 'Attach',
+						reqd: 1,
+						description: __('Columns: Material Code, Material Name, Material Type, Unit of Measure and any other material field, plus an optional Item Group')
+					},
+					{
+						fieldname: 'create_items',
+						label: __('Create ERPNext Items'),
+						fieldtype: 'Check',
+						default: 1
+					}
+				],
+				primary_action_label: __('Import'),
+				primary_action: function(values) {
+					frappe.call({
+						method: 'advanced_construction_erp.advanced_construction.material_master.import_construction_materials',
+						args: values,
+						callback: function(r) {
+							if (r.message) {
+								d.hide();
+								frappe.show_alert({
+									message: __('Importing {0} materials in the background', [r.message]),
+									indicator: 'blue'
+								});
+							}
+						}
+					});
+				}
+			});
+			d.show();
+		});
+	}
+};
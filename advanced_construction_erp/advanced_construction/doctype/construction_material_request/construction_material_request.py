@@ -8,6 +8,8 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import getdate, nowdate
 
+from advanced_construction_erp.advanced_construction.budget_commitment import reserve_budget, release_budget
+
 class ConstructionMaterialRequest(Document):
     def validate(self):
         self.validate_dates()
@@ -48,10 +50,12 @@ class ConstructionMaterialRequest(Document):
     def on_submit(self):
         """Actions on document submission"""
         self.update_status("Submitted")
+        reserve_budget(self)
     
     def on_cancel(self):
         """Actions on document cancellation"""
         self.update_status("Cancelled")
+        release_budget(self)
     
     def update_status(self, status):
         """Update the document status"""
@@ -0,0 +1,43 @@
+// Copyright (c) 2024, Your Company and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings['Construction Material Request'] = {
+	onload: function(listview) {
+		listview.page.add_inner_button(__('Consolidate into Material Requests'), function() {
+			let d = new frappe.ui.Dialog({
+				title: __('Consolidate Approved Requests'),
+				fields: [
+					{
+						fieldname: 'from_date',
+						label: __('Required From'),
+						fieldtype: 'Date'
+					},
+					{
+						fieldname: 'to_date',
+						label: __('Required To'),
+						fieldtype: 'Date',
+						default: frappe.datetime.get_today(),
+						reqd: 1
+					}
+				],
+				primary_action_label: __('Consolidate'),
+				primary_action: function(values) {
+					frappe.call({
+						method: 'advanced_construction_erp.advanced_construction.material_request_consolidation.consolidate_material_requests',
+						args: values,
+						callback: function(r) {
+							if (r.message) {
+								d.hide();
+								frappe.show_alert({
+									message: __('Consolidation {0} started in the background', [r.message]),
+									indicator: 'blue'
+								});
+							}
+						}
+					});
+				}
+			});
+			d.show();
+		});
+	}
+};
@@ -1,9 +1,21 @@
 from __future__ import unicode_literals
+import time
+
 import frappe
 from frappe import _
 from frappe.model.document import Document
 from frappe.model.naming import make_autoname
-from frappe.utils import getdate, add_days, cint, nowdate
+from frappe.utils import getdate, add_days, cint, flt, nowdate
+
+from advanced_construction_erp.advanced_construction.budget_commitment import refresh_budgeted_amounts
+from advanced_construction_erp.advanced_construction.budget_control import clear_project_budget_cache
+from advanced_construction_erp.advanced_construction.budget_history import capture_project_budget_changes
+from advanced_construction_erp.advanced_construction.earned_value import compute_project_evm
+from advanced_construction_erp.advanced_construction.events.purchase_order import get_ledger_balances
+from advanced_construction_erp.advanced_construction.project_progress import recompute_project_progress
+from advanced_construction_erp.advanced_construction.project_status_summary import (
+    queue_status_summary_refresh, rebuild_status_summary
+)
 
 class ConstructionProject(Document):
     def autoname(self):
@@ -11,6 +23,7 @@ class ConstructionProject(Document):
 
     def validate(self):
         self.validate_dates()
+        self.validate_budget_items()
         self.validate_budget()
         self.update_project_status()
 
@@ -18,6 +31,39 @@ class ConstructionProject(Document):
         if getdate(self.expected_start_date) > getdate(self.expected_end_date):
             frappe.throw(_("Expected Start Date cannot be after Expected End Date"))
 
+    def validate_budget_items(self):
+        """Calculate the budget lines, check category limits and set the budget totals in one pass"""
+        if not self.budget_items:
+            return
+
+        item_codes = list({item.item_code for item in self.budget_items if item.item_code})
+        item_details = {
+            row.name: row for row in frappe.get_all("Item",
+                filters={"name": ["in", item_codes]},
+                fields=["name", "item_name", "stock_uom"]
+            )
+        } if item_codes else {}
+
+        category_totals = {}
+        for item in self.budget_items:
+            details = item_details.get(item.item_code)
+            if details:
+                item.item_name = details.item_name
+                if not item.unit:
+                    item.unit = details.stock_uom
+
+            item.calculate_amount()
+            item.calculate_variance()
+
+            if item.get("budget_category"):
+                category_totals[item.budget_category] = category_totals.get(item.budget_category, 0) + flt(item.amount)
+
+        check_category_limits(category_totals)
+
+        self.total_budget = sum(flt(item.amount) for item in self.budget_items)
+        # Actual cost is maintained by the cost ledger
+        self.cost_variance = flt(self.actual_cost) - flt(self.total_budget)
+
     def validate_budget(self):
         if self.total_budget and self.total_budget < 0:
             frappe.throw(_("Total Budget cannot be negative"))
@@ -29,6 +75,16 @@ class ConstructionProject(Document):
         elif self.status == "In Progress":
             self.actual_start_date = getdate()
 
+    def on_update(self):
+        clear_project_budget_cache(self.name)
+        refresh_budgeted_amounts(self.name)
+        capture_project_budget_changes(self)
+        queue_status_summary_refresh(self)
+
+    def on_trash(self):
+        clear_project_budget_cache(self.name)
+        queue_status_summary_refresh(self)
+
     def on_submit(self):
         self.create_project_tasks()
         self.create_initial_budget()
@@ -72,20 +128,57 @@ class ConstructionProject(Document):
         return (completed_tasks / total_tasks) * 100 if total_tasks > 0 else 0
 
     def update_costs(self):
-        # Update actual costs from related documents
-        pass
+        """Update actual cost and variance from the cost ledger balance"""
+        self.actual_cost = get_ledger_balances([self.name]).get(self.name, 0)
+        self.cost_variance = flt(self.actual_cost) - flt(self.total_budget)
+
+    def get_evm(self, as_of=None):
+        """Project and task level earned value figures for the document as loaded"""
+        bac = sum(flt(item.amount) for item in self.budget_items) or flt(self.total_budget)
+        return compute_project_evm(bac, self.actual_cost, [task.as_dict() for task in self.project_tasks],
+            as_of, self.expected_start_date, self.expected_end_date)
 
     def get_earned_value(self):
-        # Calculate earned value based on progress and budget
-        pass
+        return self.get_evm()["ev"]
 
     def get_schedule_variance(self):
-        # Calculate schedule variance
-        pass
+        return self.get_evm()["sv"]
 
     def get_cost_variance(self):
-        # Calculate cost variance
-        pass
+        return self.get_evm()["cv"]
+
+def check_category_limits(category_totals):
+    """
+    Warn once about every budget category whose total exceeds its limit
+
+    Args:
+        category_totals: Dict of budget category -> total budgeted amount
+    """
+    if not category_totals:
+        return
+
+    limits = frappe.get_all("Project Budget Category",
+        filters={"name": ["in", list(category_totals)]},
+        fields=["name", "budget_limit"]
+    )
+
+    exceeded = [
+        _("Budget for category {0} exceeds the limit of {1}").format(
+            row.name, frappe.format(row.budget_limit, {"fieldtype": "Currency"}))
+        for row in limits
+        if flt(row.budget_limit) and flt(category_totals[row.name]) > flt(row.budget_limit)
+    ]
+
+    if exceeded:
+        frappe.msgprint("<br>".join(exceeded), alert=True)
+
+def on_doctype_update():
+    """Indexes matching the Construction Project Status report filters and ordering"""
+    frappe.db.add_index("Construction Project", ["project"])
+    frappe.db.add_index("Construction Project", ["expected_start_date"])
+    frappe.db.add_index("Construction Project", ["status", "expected_start_date"])
+    frappe.db.add_index("Construction Project", ["construction_type", "status", "expected_start_date"])
+    frappe.db.add_index("Construction Project", ["project_manager", "status", "expected_start_date"])
 
 @frappe.whitelist()
 def get_project_status(project):
@@ -93,10 +186,8 @@ def get_project_status(project):
 
 @frappe.whitelist()
 def update_project_progress(project):
-    doc = frappe.get_doc("Construction Project", project)
-    doc.progress = doc.get_progress()
-    doc.save()
-    return doc.progress
+    frappe.has_permission("Construction Project", "write", project, throw=True)
+    return recompute_project_progress([project]).get(project)
 
 def has_permission(doc, user=None, permission_type=None):
     """Check if user has permission for the Construction Project"""
@@ -114,70 +205,137 @@ def has_permission(doc, user=None, permission_type=None):
     
     return False
 
-def update_project_status():
-    """Daily scheduled task to update project status based on dates and progress"""
+# Daily status transitions: current status -> (new status, date fields stamped with today)
+STATUS_TRANSITIONS = {
+    "Not Started": ("In Progress", ("actual_start_date",)),
+    "In Progress": ("Completed", ("actual_end_date", "completion_date"))
+}
+STATUS_CURSOR_KEY = "construction_project_status_cursor"
+STATUS_HOOK_EVENTS = ("validate", "before_save", "on_update", "on_change")
+
+
+def update_project_status(chunk_size=1000):
+    """
+    Daily scheduled task to update project status based on dates and progress
+
+    Candidates are read in keyset-paginated chunks and moved with one UPDATE per transition
+    and chunk. Each chunk is committed and the last processed name is kept in cache, so an
+    interrupted run resumes where it stopped. Projects are only loaded and saved when
+    document hooks are registered for Construction Project.
+    """
+    started = time.perf_counter()
     today = nowdate()
-    
-    # Find projects that should be started
-    projects_to_start = frappe.get_all(
-        "Construction Project",
-        filters={
-            "status": "Not Started",
-            "expected_start_date": ("<=", today)
-        },
-        fields=["name"]
-    )
-    
-    for project in projects_to_start:
-        doc = frappe.get_doc("Construction Project", project.name)
-        doc.status = "In Progress"
-        doc.actual_start_date = today
-        doc.save()
-        
-    # Find projects that should be completed
-    projects_to_complete = frappe.get_all(
-        "Construction Project",
-        filters={
-            "status": "In Progress",
-            "expected_end_date": ("<=", today),
-            "progress": (">=", 95)
-        },
-        fields=["name"]
-    )
-    
-    for project in projects_to_complete:
-        doc = frappe.get_doc("Construction Project", project.name)
-        doc.status = "Completed"
-        doc.actual_end_date = today
-        doc.completion_date = today
-        doc.save()
-
-def generate_weekly_reports():
+    stats = {"chunks": 0, "scanned": 0, "saved": 0}
+    stats.update({new_status: 0 for new_status, _fields in STATUS_TRANSITIONS.values()})
+
+    cursor = frappe.cache().get_value(STATUS_CURSOR_KEY) or {}
+    last_name = cursor.get("last_name") if cursor.get("date") == today else ""
+    fire_hooks = has_document_hooks()
+
+    while True:
+        candidates = frappe.db.sql("""
+            SELECT name, status
+            FROM `tabConstruction Project`
+            WHERE name > %(last_name)s
+                AND (
+                    (status = 'Not Started' AND expected_start_date <= %(today)s)
+                    OR (status = 'In Progress' AND expected_end_date <= %(today)s AND progress >= 95)
+                )
+            ORDER BY name
+            LIMIT %(chunk_size)s
+        """, {"last_name": last_name, "today": today, "chunk_size": chunk_size}, as_dict=1)
+
+        if not candidates:
+            break
+
+        by_status = {}
+        for row in candidates:
+            by_status.setdefault(row.status, []).append(row.name)
+
+        for status, names in by_status.items():
+            new_status, date_fields = STATUS_TRANSITIONS[status]
+            if fire_hooks:
+                for name in names:
+                    doc = frappe.get_doc("Construction Project", name)
+                    doc.status = new_status
+                    for fieldname in date_fields:
+                        doc.set(fieldname, today)
+                    doc.save(ignore_permissions=True)
+                stats["saved"] += len(names)
+            else:
+                values = {"status": new_status}
+                values.update({fieldname: today for fieldname in date_fields})
+                frappe.db.set_value("Construction Project", {"name": ["in", names]}, values)
+                for name in names:
+                    frappe.clear_document_cache("Construction Project", name)
+
+            stats[new_status] += len(names)
+
+        last_name = candidates[-1].name
+        stats["chunks"] += 1
+        stats["scanned"] += len(candidates)
+
+        frappe.db.commit()
+        frappe.cache().set_value(STATUS_CURSOR_KEY, {"date": today, "last_name": last_name}, expires_in_sec=86400)
+
+    frappe.cache().delete_value(STATUS_CURSOR_KEY)
+
+    # Bulk transitions bypass on_update, so refresh the report summary in one pass
+    if stats["chunks"] and not fire_hooks:
+        rebuild_status_summary()
+        frappe.db.commit()
+
+    stats["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    frappe.logger("construction_project").info({"job": "update_project_status", **stats})
+    return stats
+
+
+def has_document_hooks():
+    """Check whether other apps hook into saving a Construction Project"""
+    hooks = frappe.get_hooks("doc_events").get("Construction Project") or {}
+    return any(hooks.get(event) for event in STATUS_HOOK_EVENTS)
+
+
+def generate_weekly_reports(chunk_size=1000):
     """Weekly scheduled task to generate project status reports"""
     from datetime import datetime
-    
-    # Get all active projects
-    active_projects = frappe.get_all(
-        "Construction Project",
-        filters={
-            "status": ["in", ["Not Started", "In Progress"]]
-        },
-        fields=["name", "project_name", "progress", "expected_start_date", "expected_end_date"]
-    )
-    
-    # Create weekly report
+
+    # Insert the header alone and bulk-insert its rows, instead of building one large document
     report = frappe.new_doc("Construction Project Status")
     report.report_date = nowdate()
     report.report_name = f"Weekly Status Report - {datetime.now().strftime('%Y-%m-%d')}"
-    
-    for project in active_projects:
-        report.append("projects", {
-            "project": project.name,
-            "project_name": project.project_name,
-            "progress": project.progress,
-            "expected_start_date": project.expected_start_date,
-            "expected_end_date": project.expected_end_date
-        })
-    
     report.insert()
-    return report.name 
\ No newline at end of file
+
+    row_doctype = frappe.get_meta("Construction Project Status").get_field("projects").options
+    fields = ["name", "creation", "modified", "owner", "modified_by", "docstatus", "parent", "parenttype",
+        "parentfield", "idx", "project", "project_name", "progress", "expected_start_date", "expected_end_date"]
+
+    last_name = ""
+    idx = 0
+    while True:
+        # Get active projects
+        active_projects = frappe.get_all(
+            "Construction Project",
+            filters={
+                "status": ["in", ["Not Started", "In Progress"]],
+                "name": [">", last_name]
+            },
+            fields=["name", "project_name", "progress", "expected_start_date", "expected_end_date"],
+            order_by="name",
+            limit_page_length=chunk_size
+        )
+
+        if not active_projects:
+            break
+
+        values = []
+        for project in active_projects:
+            idx += 1
+            values.append((frappe.generate_hash(length=10), report.creation, report.modified, report.owner,
+                report.modified_by, 0, report.name, report.doctype, "projects", idx, project.name,
+                project.project_name, project.progress, project.expected_start_date, project.expected_end_date))
+
+        frappe.db.bulk_insert(row_doctype, fields, values)
+        last_name = active_projects[-1].name
+
+    return report.name
@@ -4,6 +4,14 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import flt, cint, getdate, nowdate, add_days, add_months
 
+from advanced_construction_erp.advanced_construction.actual_cost import get_actual_costs, update_budget_actuals
+from advanced_construction_erp.advanced_construction.budget_commitment import refresh_budgeted_amounts
+from advanced_construction_erp.advanced_construction.budget_control import clear_project_budget_cache
+from advanced_construction_erp.advanced_construction.budget_history import capture_budget_change, get_budget_history
+from advanced_construction_erp.advanced_construction.doctype.construction_project.construction_project import check_category_limits
+from advanced_construction_erp.advanced_construction.forecasting import compute_eac
+from advanced_construction_erp.advanced_construction.project_status_summary import queue_project_summary_refresh
+
 class ConstructionProjectBudget(Document):
     def validate(self):
         self.validate_item()
@@ -34,71 +42,43 @@ class ConstructionProjectBudget(Document):
 
     def check_budget_limits(self):
         """Check if budget exceeds limits and send alerts"""
-        if self.parent and self.parenttype == "Construction Project":
-            project = frappe.get_doc("Construction Project", self.parent)
+        if self.parent and self.parenttype == "Construction Project" and self.budget_category:
+            # Get total budget for this category, counting this line as currently edited
+            total_category_budget = frappe.db.sql("""
+                SELECT SUM(amount)
+                FROM `tabConstruction Project Budget`
+                WHERE parent = %s AND parenttype = 'Construction Project'
+                AND budget_category = %s AND name != %s
+            """, (self.parent, self.budget_category, self.name or ""))[0][0] or 0
             
-            # Check if this budget item exceeds its category limit
-            if self.budget_category:
-                category_budget = frappe.get_value("Project Budget Category", 
-                    self.budget_category, "budget_limit")
-                
-                if category_budget:
-                    # Get total budget for this category
-                    total_category_budget = frappe.db.sql("""
-                        SELECT SUM(amount)
-                        FROM `tabConstruction Project Budget`
-                        WHERE parent = %s AND parenttype = 'Construction Project'
-                        AND budget_category = %s
-                    """, (self.parent, self.budget_category))[0][0] or 0
-                    
-                    if total_category_budget > flt(category_budget):
-                        frappe.msgprint(
-                            _("Budget for category {0} exceeds the limit of {1}").format(
-                                self.budget_category, 
-                                frappe.format(category_budget, {"fieldtype": "Currency"})
-                            ),
-                            alert=True
-                        )
+            check_category_limits({self.budget_category: flt(total_category_budget) + flt(self.amount)})
 
     def on_update(self):
+        if self.parent:
+            clear_project_budget_cache(self.parent)
+            refresh_budgeted_amounts(self.parent)
         self.update_project_budget()
         self.track_budget_history()
 
     def update_project_budget(self):
+        """Set the project budget totals from its budget lines without saving the project"""
         if self.parent and self.parenttype == "Construction Project":
-            project = frappe.get_doc("Construction Project", self.parent)
-            total_budget = sum(flt(item.amount) for item in project.budget_items)
-            total_actual = sum(flt(item.actual_amount) for item in project.budget_items if item.actual_amount)
-            
-            project.total_budget = total_budget
-            project.actual_cost = total_actual
-            project.cost_variance = total_actual - total_budget
+            total_budget = frappe.db.sql("""
+                SELECT SUM(amount)
+                FROM `tabConstruction Project Budget`
+                WHERE parent = %s AND parenttype = 'Construction Project'
+            """, self.parent)[0][0] or 0
             
-            project.save()
+            actual_cost = frappe.db.get_value("Construction Project", self.parent, "actual_cost")
+            frappe.db.set_value("Construction Project", self.parent, {
+                "total_budget": total_budget,
+                "cost_variance": flt(actual_cost) - flt(total_budget)
+            })
+            queue_project_summary_refresh([self.parent])
 
     def track_budget_history(self):
         """Track budget changes over time"""
-        if not self.name:
-            return
-            
-        # Check if there's a previous version with different amount
-        previous_amount = frappe.db.get_value("Construction Project Budget History",
-            {"budget_item": self.name}, "amount")
-            
-        if previous_amount is None or flt(previous_amount) != flt(self.amount):
-            # Create a budget history record
-            history = frappe.new_doc("Construction Project Budget History")
-            history.budget_item = self.name
-            history.item_code = self.item_code
-            history.item_name = self.item_name
-            history.quantity = self.quantity
-            history.rate = self.rate
-            history.amount = self.amount
-            history.actual_amount = self.actual_amount
-            history.variance = self.variance
-            history.date = nowdate()
-            history.modified_by = frappe.session.user
-            history.insert(ignore_permissions=True)
+        capture_budget_change(self)
 
     def get_purchase_orders(self):
         """Get purchase orders related to this budget item"""
@@ -116,49 +96,41 @@ class ConstructionProjectBudget(Document):
 
     def get_actual_cost(self):
         """Calculate actual cost from purchase orders and other sources"""
-        purchase_orders = self.get_purchase_orders()
-        
-        total_po_cost = sum(flt(po.amount) for po in purchase_orders)
-        
-        # TODO: Add costs from other sources like timesheets, expense claims, etc.
-        
-        return total_po_cost
+        if not self.item_code or not self.parent:
+            return 0
+            
+        costs = get_actual_costs([self.parent]).get(self.parent, {})
+        return sum((costs.get(self.item_code) or {}).values())
 
     def update_actual_cost(self):
-        """Update actual cost based on purchase orders and other sources"""
-        actual_cost = self.get_actual_cost()
+        """Update actual cost of every budget line of the project from invoices, stock issues and other sources"""
+        if not self.parent:
+            return
+            
+        update_budget_actuals([self.parent])
         
-        if flt(self.actual_amount) != flt(actual_cost):
-            self.actual_amount = actual_cost
-            self.calculate_variance()
-            self.save()
+        values = frappe.db.get_value("Construction Project Budget", self.name,
+            ["actual_amount", "variance", "variance_percentage"], as_dict=1)
+        if values:
+            self.update(values)
 
     def forecast_cost_to_completion(self):
         """Forecast the final cost based on current progress and spending"""
         if not self.parent:
             return 0
             
-        project = frappe.get_doc("Construction Project", self.parent)
-        if not project.progress or project.progress == 0:
+        progress = frappe.db.get_value("Construction Project", self.parent, "progress")
+        if not flt(progress) or not self.actual_amount:
             return self.amount
             
-        # Simple forecasting based on current spending and progress
-        if self.actual_amount and project.progress:
-            # Estimate total cost = (Actual Cost / Progress) * 100
-            forecast = (flt(self.actual_amount) / flt(project.progress)) * 100
-            return forecast
-        
-        return self.amount
+        # CPI based estimate, as computed for the whole portfolio by the forecasting engine
+        forecast = compute_eac([self.amount], [self.actual_amount], [flt(self.amount) * flt(progress) / 100],
+            [None], [None])
+        return forecast["eac_cpi"][0]
 
     def get_cost_trend(self):
         """Get the cost trend over time"""
         if not self.name:
             return []
             
-        history = frappe.get_all("Construction Project Budget History",
-            filters={"budget_item": self.name},
-            fields=["date", "amount", "actual_amount", "variance"],
-            order_by="date"
-        )
-        
-        return history 
\ No newline at end of file
+        return get_budget_history([self.name]).get(self.name, [])
@@ -18,4 +18,9 @@ class ConstructionProjectBudgetHistory(Document):
         """Get the budget item this history record is linked to"""
         if self.budget_item:
             return frappe.get_doc("Construction Project Budget", self.budget_item)
-        return None 
\ No newline at end of file
+        return None
+
+def on_doctype_update():
+    """Trends read one budget line or one project over a date range"""
+    frappe.db.add_index("Construction Project Budget History", ["budget_item", "date"])
+    frappe.db.add_index("Construction Project Budget History", ["construction_project", "date"])
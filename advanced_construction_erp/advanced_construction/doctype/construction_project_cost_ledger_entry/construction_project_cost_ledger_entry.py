@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionProjectCostLedgerEntry(Document):
+    pass
+
+def on_doctype_update():
+    """Entries are looked up per voucher to keep postings idempotent"""
+    frappe.db.add_index("Construction Project Cost Ledger Entry", ["voucher_type", "voucher_no"])
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionProjectEVMSnapshot(Document):
+    pass
+
+def on_doctype_update():
+    """S-curves read one project over a date range"""
+    frappe.db.add_index("Construction Project EVM Snapshot", ["construction_project", "snapshot_date"])
+    frappe.db.add_index("Construction Project EVM Snapshot", ["snapshot_date"])
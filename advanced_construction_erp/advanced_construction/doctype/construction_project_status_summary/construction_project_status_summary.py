@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class ConstructionProjectStatusSummary(Document):
+    pass
+
+def on_doctype_update():
+    """The status report filters summary rows by status, type and manager"""
+    frappe.db.add_index("Construction Project Status Summary", ["status", "construction_type", "start_month"])
+    frappe.db.add_index("Construction Project Status Summary", ["project_manager", "start_month"])
@@ -4,6 +4,8 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import getdate, date_diff, add_days, flt, nowdate
 
+from advanced_construction_erp.advanced_construction.project_progress import mark_project_dirty
+
 class ConstructionProjectTask(Document):
     def validate(self):
         self.validate_dates()
@@ -136,10 +138,9 @@ class ConstructionProjectTask(Document):
         self.update_dependent_tasks()
 
     def update_project_progress(self):
+        """Mark the parent project for a progress recompute before the transaction commits"""
         if self.parent and self.parenttype == "Construction Project":
-            project = frappe.get_doc("Construction Project", self.parent)
-            project.progress = project.get_progress()
-            project.save()
+            mark_project_dirty(self.parent)
 
     def update_dependent_tasks(self):
         """Update tasks that depend on this task"""
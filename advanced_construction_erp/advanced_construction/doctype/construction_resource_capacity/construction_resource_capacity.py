@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt
+
+class ConstructionResourceCapacity(Document):
+    def validate(self):
+        self.validate_capacity()
+        self.validate_duplicate()
+
+    def validate_capacity(self):
+        """Daily capacity must be a positive number"""
+        if flt(self.daily_capacity) <= 0:
+            frappe.throw(_("Daily Capacity must be greater than zero"))
+
+    def validate_duplicate(self):
+        """Only one capacity record is allowed per resource"""
+        existing = frappe.db.exists("Construction Resource Capacity", {
+            "resource_type": self.resource_type,
+            "resource_name": self.resource_name,
+            "name": ["!=", self.name]
+        })
+
+        if existing:
+            frappe.throw(_("Capacity for {0} {1} is already defined in {2}").format(
+                self.resource_type, self.resource_name, existing
+            ))
@@ -8,6 +8,8 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import getdate, flt, add_days, add_months, nowdate
 
+from advanced_construction_erp.advanced_construction.milestone_billing import get_invoice_item
+
 class ContractManagement(Document):
     def validate(self):
         self.validate_dates()
@@ -102,8 +104,12 @@ class ContractManagement(Document):
         """Create tasks for contract milestones"""
         if not self.project:
             return
-            
+        
+        links = {}
         for milestone in self.milestones:
+            if milestone.task:
+                continue
+            
             task = frappe.new_doc("Task")
             task.subject = milestone.milestone_name
             task.description = milestone.description
@@ -114,9 +120,12 @@ class ContractManagement(Document):
             task.milestone = 1  # Mark as milestone task
             task.insert()
             
-            # Link the task to the milestone
             milestone.task = task.name
-            milestone.db_update()
+            links[milestone.name] = {"task": task.name}
+        
+        # Link the tasks to the milestones in one statement
+        if links:
+            frappe.db.bulk_update("Contract Milestone", links, update_modified=False)
     
     def get_payment_schedule(self):
         """Get payment schedule based on milestones"""
@@ -164,28 +173,28 @@ class ContractManagement(Document):
             
         if milestone.payment_status == "Paid":
             frappe.throw(_("Invoice already paid for milestone {0}").format(milestone.milestone_name))
+        
+        if milestone.sales_invoice:
+            frappe.throw(_("Milestone {0} is already billed on Sales Invoice {1}").format(
+                milestone.milestone_name, milestone.sales_invoice))
             
         # Create a sales invoice
         invoice = frappe.new_doc("Sales Invoice")
         invoice.customer = self.client
-        invoice.project = self.project
+        invoice.project = frappe.db.get_value("Construction Project", self.project, "project") if self.project else None
         invoice.construction_contract = self.name
         invoice.contract_milestone = milestone.name
         invoice.due_date = add_days(nowdate(), 30)  # Due in 30 days
         
         # Add invoice item
-        invoice.append("items", {
-            "item_code": "Construction Service",  # This should be a valid item code in your system
-            "qty": 1,
-            "rate": milestone.payment_amount,
-            "amount": milestone.payment_amount,
-            "description": f"Payment for milestone: {milestone.milestone_name}"
-        })
+        invoice.append("items", get_invoice_item(self.contract_number, milestone.milestone_name,
+            milestone.payment_amount))
         
         invoice.insert()
         
         # Update milestone status
         milestone.payment_status = "Invoiced"
+        milestone.sales_invoice = invoice.name
         milestone.db_update()
         
         return invoice.name 
\ No newline at end of file
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class MaterialRequestConsolidationLog(Document):
+    pass
+
+def on_doctype_update():
+    """Traceability is looked up from either side of the consolidation"""
+    frappe.db.add_index("Material Request Consolidation Log", ["construction_material_request_item"])
+    frappe.db.add_index("Material Request Consolidation Log", ["material_request", "material_request_item"])
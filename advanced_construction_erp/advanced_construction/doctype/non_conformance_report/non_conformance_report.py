@@ -8,6 +8,9 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import getdate, nowdate
 
+from advanced_construction_erp.advanced_construction.defect_cube import record_ncr_defects, update_ncr_rework_cost
+from advanced_construction_erp.advanced_construction.ncr_task_sync import create_action_tasks, sync_action_status
+
 class NonConformanceReport(Document):
     def validate(self):
         self.validate_dates()
@@ -91,72 +94,34 @@ class NonConformanceReport(Document):
             inspection.ncr_created = 1
             inspection.ncr = self.name
             inspection.save()
+        
+        record_ncr_defects(self)
+    
+    def on_cancel(self):
+        """Actions on cancel"""
+        self.db_set("status", "Cancelled")
+        record_ncr_defects(self, sign=-1)
+    
+    def before_update_after_submit(self):
+        """Analysis, actions and verification are worked on after submit; keep the status in step"""
+        self.validate_dates()
+        self.validate_actions()
+        self.update_status()
+    
+    def on_update_after_submit(self):
+        """Actions on update after submit"""
+        # Actions added after submit get their tasks too
+        self.create_action_tasks()
+        update_ncr_rework_cost(self)
     
     def create_action_tasks(self):
         """Create tasks for corrective and preventive actions"""
-        if not self.project:
-            return
-            
-        # Create tasks for corrective actions
-        if self.corrective_actions:
-            for action in self.corrective_actions:
-                self.create_task(action, "Corrective")
-        
-        # Create tasks for preventive actions
-        if self.preventive_actions:
-            for action in self.preventive_actions:
-                self.create_task(action, "Preventive")
-    
-    def create_task(self, action, action_type):
-        """Create a task for an action"""
-        task = frappe.new_doc("Task")
-        task.subject = f"{action_type} Action: {action.action_description[:50]}"
-        task.description = action.action_description
-        task.project = self.project
-        task.expected_start_date = nowdate()
-        task.expected_end_date = action.due_date
-        task.status = "Open"
-        task.priority = "High" if self.severity in ["High", "Critical"] else "Medium"
-        task.reference_type = "Non Conformance Report"
-        task.reference_name = self.name
-        
-        # Assign to user
-        if action.assigned_to:
-            task._assign = action.assigned_to
-        
-        task.insert()
-        
-        # Link task to action
-        action.task = task.name
-        action.db_update()
-        
-        frappe.msgprint(_("Task {0} created for action").format(task.name))
+        create_action_tasks(self)
     
     def update_action_status(self):
         """Update action status based on linked tasks"""
-        # Update corrective actions
-        if self.corrective_actions:
-            for action in self.corrective_actions:
-                if action.task:
-                    task = frappe.get_doc("Task", action.task)
-                    if task.status == "Completed" and action.status != "Completed":
-                        action.status = "Completed"
-                        action.completion_date = task.completed_on
-                        action.db_update()
-        
-        # Update preventive actions
-        if self.preventive_actions:
-            for action in self.preventive_actions:
-                if action.task:
-                    task = frappe.get_doc("Task", action.task)
-                    if task.status == "Completed" and action.status != "Completed":
-                        action.status = "Completed"
-                        action.completion_date = task.completed_on
-                        action.db_update()
-        
-        # Update NCR status
-        self.update_status()
-        self.save()
+        sync_action_status(ncrs=[self.name])
+        self.reload()
     
     @frappe.whitelist()
     def verify_actions(self):
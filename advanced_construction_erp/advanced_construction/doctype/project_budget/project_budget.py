@@ -6,6 +6,8 @@ from frappe.model.document import Document
 from frappe.model.mapper import get_mapped_doc
 from frappe import _
 
+from advanced_construction_erp.advanced_construction.budget_estimation_sync import queue_estimation_approval
+
 class ProjectBudget(Document):
 	def validate(self):
 		# Validate dates
@@ -63,9 +65,7 @@ class ProjectBudget(Document):
 			
 			# Update linked Project Estimation status if this budget is approved
 			if self.approval_status == "Approved" and self.project_estimation:
-				project_estimation = frappe.get_doc("Project Estimation", self.project_estimation)
-				project_estimation.budget_status = "Approved"
-				project_estimation.save()
+				queue_estimation_approval(self.project_estimation)
 
 @frappe.whitelist()
 def make_budget_monitoring(source_name, target_doc=None):
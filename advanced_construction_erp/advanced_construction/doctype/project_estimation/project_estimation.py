@@ -6,6 +6,10 @@ from frappe.model.document import Document
 from frappe.model.mapper import get_mapped_doc
 from frappe import _
 
+from advanced_construction_erp.advanced_construction.budget_estimation_sync import (
+	get_budget_category_rows, get_changed_components, queue_budget_sync
+)
+
 class ProjectEstimation(Document):
 	def validate(self):
 		# Validate dates
@@ -90,6 +94,9 @@ class ProjectEstimation(Document):
 	
 	def on_update(self):
 		"""Add comments on status and approval changes"""
+		if get_changed_components(self):
+			queue_budget_sync(self.name)
+		
 		if self.has_value_changed('status'):
 			self.add_comment('Info', _(f"Status changed to: {self.status}"))
 		
@@ -147,80 +154,7 @@ def make_project_budget(source_name, target_doc=None):
 		target.expected_completion_date = source.expected_completion_date
 		
 		# Map cost categories
-		target.append("budget_categories", {
-			"category": "Materials",
-			"amount": source.material_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Labor",
-			"amount": source.labor_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Equipment",
-			"amount": source.equipment_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Subcontractors",
-			"amount": source.subcontractor_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Project Management",
-			"amount": source.project_management_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Engineering & Design",
-			"amount": source.engineering_design_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Permits & Fees",
-			"amount": source.permit_fees or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Insurance",
-			"amount": source.insurance_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Temporary Facilities",
-			"amount": source.temporary_facilities_costs or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "General Conditions",
-			"amount": source.general_conditions or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Contingency",
-			"amount": source.contingency_amount or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Escalation",
-			"amount": source.escalation_amount or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Overhead",
-			"amount": source.overhead_amount or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Profit",
-			"amount": source.profit_amount or 0
-		})
-		
-		target.append("budget_categories", {
-			"category": "Risk Contingency",
-			"amount": source.risk_contingency_amount or 0
-		})
+		target.extend("budget_categories", get_budget_category_rows(source))
 	
 	doclist = get_mapped_doc("Project Estimation", source_name, {
 		"Project Estimation": {
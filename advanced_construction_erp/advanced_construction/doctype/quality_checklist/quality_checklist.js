@@ -17,6 +17,10 @@ frappe.ui.form.on('Quality Checklist', {
                 frm.add_custom_button(__('Create Inspection'), function() {
                     create_inspection(frm);
                 }, __('Actions'));
+                
+                frm.add_custom_button(__('Create Inspections in Bulk'), function() {
+                    create_inspection_batch(frm);
+                }, __('Actions'));
             }
             
             // Add button to sort items
@@ -108,6 +112,86 @@ function create_inspection(frm) {
     });
 }
 
+function create_inspection_batch(frm) {
+    let d = new frappe.ui.Dialog({
+        title: __("Create Inspections in Bulk"),
+        fields: [
+            {
+                fieldname: "project",
+                label: __("Project"),
+                fieldtype: "Link",
+                options: "Construction Project",
+                reqd: 1
+            },
+            {
+                fieldname: "inspection_date",
+                label: __("Inspection Date"),
+                fieldtype: "Date",
+                default: frappe.datetime.get_today(),
+                reqd: 1
+            },
+            {
+                fieldname: "inspector",
+                label: __("Inspector"),
+                fieldtype: "Link",
+                options: "User",
+                default: frappe.session.user,
+                reqd: 1
+            },
+            {
+                fieldname: "reference_type",
+                label: __("Inspect"),
+                fieldtype: "Select",
+                options: "Location\nTask\nPurchase Receipt",
+                default: "Location",
+                reqd: 1
+            },
+            {
+                fieldname: "location",
+                label: __("Location"),
+                fieldtype: "Data",
+                depends_on: "eval:doc.reference_type !== 'Location'",
+                mandatory_depends_on: "eval:doc.reference_type !== 'Location'"
+            },
+            {
+                fieldname: "targets",
+                label: __("Locations / Documents (one per line)"),
+                fieldtype: "Small Text",
+                reqd: 1
+            }
+        ],
+        primary_action_label: __("Create"),
+        primary_action: function(values) {
+            let targets = values.targets.split("\n").map(t => t.trim()).filter(t => t).map(function(t) {
+                return values.reference_type === "Location"
+                    ? {location: t}
+                    : {reference_type: values.reference_type, reference_name: t, location: values.location};
+            });
+            
+            frappe.call({
+                method: "advanced_construction_erp.advanced_construction.inspection_batch.make_inspection_batch",
+                args: {
+                    checklist: frm.doc.name,
+                    targets: targets,
+                    project: values.project,
+                    inspection_date: values.inspection_date,
+                    inspector: values.inspector
+                },
+                callback: function(r) {
+                    if (r.message) {
+                        d.hide();
+                        frappe.show_alert({
+                            message: __("Creating {0} inspections in the background", [r.message]),
+                            indicator: 'blue'
+                        });
+                    }
+                }
+            });
+        }
+    });
+    d.show();
+}
+
 function sort_items(frm) {
     if (!frm.doc.items || frm.doc.items.length === 0) {
         frappe.msgprint(__("No items to sort"));
@@ -8,6 +8,10 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import getdate, nowdate
 
+from advanced_construction_erp.advanced_construction.checklist_versions import (
+    store_checklist_items, deactivate_previous_versions, resolve_checklist_items
+)
+
 class QualityChecklist(Document):
     def validate(self):
         self.validate_dates()
@@ -40,24 +44,26 @@ class QualityChecklist(Document):
         if not self.created_by:
             self.created_by = frappe.session.user
     
+    def onload(self):
+        """Show the items of obsolete versions, which are kept only in the content store"""
+        if not self.items and self.item_manifest:
+            for item in resolve_checklist_items(self.name):
+                self.append("items", item)
+    
+    def before_submit(self):
+        """Only active versions are submitted; status cannot change after submit"""
+        if self.status != "Active":
+            frappe.throw(_("Set the status to Active before submitting checklist version {0}").format(self.version))
+    
     def on_submit(self):
         """Actions on submit"""
-        # If this is a new version of an existing checklist, mark the old one as obsolete
-        if self.version != "1.0" and self.status == "Active":
-            # Find previous versions of this checklist
-            prev_versions = frappe.get_all("Quality Checklist", 
-                filters={
-                    "checklist_name": self.checklist_name,
-                    "version": ["<", self.version],
-                    "status": "Active"
-                })
-            
-            # Mark previous versions as obsolete
-            for prev in prev_versions:
-                prev_doc = frappe.get_doc("Quality Checklist", prev.name)
-                prev_doc.status = "Obsolete"
-                prev_doc.save()
-                frappe.msgprint(_("Previous version {0} marked as Obsolete").format(prev_doc.version))
+        # Store the item contents, shared with every other version that has the same items
+        store_checklist_items(self)
+        
+        # If this is a new version of an existing checklist, mark the old ones as obsolete
+        previous = deactivate_previous_versions(self)
+        if previous:
+            frappe.msgprint(_("Previous versions {0} marked as Obsolete").format(", ".join(previous)))
     
     @frappe.whitelist()
     def create_new_version(self):
@@ -93,7 +99,7 @@ class QualityChecklist(Document):
         inspection.inspection_date = nowdate()
         
         # Copy checklist items
-        for item in self.items:
+        for item in self.items or resolve_checklist_items(self.name):
             inspection.append("checklist_items", {
                 "check_name": item.check_name,
                 "specification": item.specification,
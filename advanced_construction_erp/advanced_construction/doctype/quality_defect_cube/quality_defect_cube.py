@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class QualityDefectCube(Document):
+    pass
+
+def on_doctype_update():
+    """Dashboards slice the cube by period first, then by one of the other dimensions"""
+    frappe.db.add_index("Quality Defect Cube", ["period", "project"])
+    frappe.db.add_index("Quality Defect Cube", ["project", "period"])
+    frappe.db.add_index("Quality Defect Cube", ["supplier", "period"])
+    frappe.db.add_index("Quality Defect Cube", ["inspection_type", "period"])
+    frappe.db.add_index("Quality Defect Cube", ["check_name", "period"])
@@ -8,6 +8,20 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import getdate, nowdate
 
+from advanced_construction_erp.advanced_construction.defect_cube import record_inspection_defects
+from advanced_construction_erp.advanced_construction.inspection_batch import get_checklist_items
+from advanced_construction_erp.advanced_construction.inspection_reference_update import (
+    queue_reference_update, cancel_reference_update
+)
+from advanced_construction_erp.advanced_construction.inspection_facts import (
+    count_results, write_inspection_fact, delete_inspection_fact
+)
+from advanced_construction_erp.advanced_construction.reports.quality_inspection_summary.quality_inspection_summary import (
+    clear_cache as clear_summary_cache
+)
+
+FINAL_STATUSES = ("Approved", "Rejected")
+
 class QualityInspection(Document):
     def validate(self):
         self.validate_dates()
@@ -34,22 +48,22 @@ class QualityInspection(Document):
         """Calculate inspection results"""
         if not self.checklist_items:
             return
-            
-        total = len(self.checklist_items)
-        passed = len([item for item in self.checklist_items if item.status == "Pass"])
-        failed = len([item for item in self.checklist_items if item.status == "Fail"])
-        na = len([item for item in self.checklist_items if item.status == "Not Applicable"])
         
-        self.total_checks = total
-        self.passed_checks = passed
-        self.failed_checks = failed
+        # One pass over the items; the counts are reused by update_status and the fact row
+        self._results = count_results(self.checklist_items)
         
-        # Calculate quality score (excluding N/A items)
-        applicable_items = total - na
-        if applicable_items > 0:
-            self.quality_score = (passed / applicable_items) * 100
-        else:
-            self.quality_score = 0
+        self.total_checks = self._results["total"]
+        self.passed_checks = self._results["passed"]
+        self.failed_checks = self._results["failed"]
+        
+        # Quality score excludes N/A items
+        self.quality_score = self._results["quality_score"]
+    
+    def get_results(self):
+        """Item result counts, computed once per request"""
+        if not getattr(self, "_results", None):
+            self._results = count_results(self.checklist_items or [])
+        return self._results
     
     def update_status(self):
         """Update inspection status based on results"""
@@ -58,9 +72,7 @@ class QualityInspection(Document):
             
         if self.status == "Inspection Completed" and self.checklist_items:
             # Check if any critical items failed
-            critical_failures = any(item.status == "Fail" and item.is_critical for item in self.checklist_items)
-            
-            if critical_failures:
+            if self.get_results()["critical_failures"]:
                 self.status = "Rejected"
                 frappe.msgprint(_("Inspection rejected due to critical item failure"))
             elif self.quality_score >= 90:
@@ -70,6 +82,11 @@ class QualityInspection(Document):
                 self.status = "Rejected"
                 frappe.msgprint(_("Inspection rejected with quality score of {0}%").format(round(self.quality_score, 2)))
     
+    def before_submit(self):
+        """Only inspections with a final result are submitted; the result cannot change after submit"""
+        if self.status not in FINAL_STATUSES:
+            frappe.throw(_("Inspection {0} can only be submitted once it is Approved or Rejected").format(self.name))
+    
     def on_submit(self):
         """Actions on submit"""
         # Update reference document if applicable
@@ -79,41 +96,24 @@ class QualityInspection(Document):
         # Create non-conformance report if rejected
         if self.status == "Rejected":
             self.create_nonconformance_report()
+        
+        write_inspection_fact(self, self.get_results())
+        record_inspection_defects(self)
+        clear_summary_cache()
+    
+    def on_cancel(self):
+        self.db_set("status", "Cancelled")
+        cancel_reference_update(self)
+        delete_inspection_fact(self)
+        record_inspection_defects(self, sign=-1)
+        clear_summary_cache()
     
     def update_reference_document(self):
-        """Update the reference document with inspection results"""
+        """Queue the inspection results for the reference document; they are applied in the background"""
         if not self.reference_type or not self.reference_name:
             return
-            
-        try:
-            # Check if reference document exists
-            if not frappe.db.exists(self.reference_type, self.reference_name):
-                return
-                
-            ref_doc = frappe.get_doc(self.reference_type, self.reference_name)
-            
-            # Update reference document based on type
-            if self.reference_type == "Purchase Receipt":
-                # Update item quality inspection status
-                for item in ref_doc.items:
-                    if item.item_code == self.item_code:
-                        item.quality_inspection = self.name
-                        item.qa_status = self.status
-                ref_doc.save()
-                frappe.msgprint(_("Updated Purchase Receipt with inspection results"))
-                
-            elif self.reference_type == "Task":
-                # Update task status based on inspection
-                if self.status == "Approved":
-                    ref_doc.status = "Completed"
-                elif self.status == "Rejected":
-                    ref_doc.status = "Failed QC"
-                ref_doc.quality_inspection = self.name
-                ref_doc.save()
-                frappe.msgprint(_("Updated Task with inspection results"))
-                
-        except Exception as e:
-            frappe.msgprint(_("Could not update reference document: {0}").format(str(e)))
+        
+        queue_reference_update(self)
     
     def create_nonconformance_report(self):
         """Create non-conformance report if inspection is rejected"""
@@ -154,12 +154,25 @@ class QualityInspection(Document):
     
     def get_inspection_summary(self):
         """Get inspection summary for dashboard"""
+        if self.docstatus == 1:
+            fact = frappe.db.get_value("Quality Inspection Fact", self.name,
+                ["total_checks", "passed_checks", "failed_checks", "quality_score", "critical_failures"], as_dict=1)
+            if fact:
+                return {
+                    "total": fact.total_checks,
+                    "passed": fact.passed_checks,
+                    "failed": fact.failed_checks,
+                    "quality_score": fact.quality_score,
+                    "critical_failures": fact.critical_failures
+                }
+        
+        results = self.get_results()
         return {
             "total": self.total_checks,
             "passed": self.passed_checks,
             "failed": self.failed_checks,
             "quality_score": self.quality_score,
-            "critical_failures": len([item for item in self.checklist_items if item.status == "Fail" and item.is_critical]) if self.checklist_items else 0
+            "critical_failures": results["critical_failures"]
         }
     
     @frappe.whitelist()
@@ -168,22 +181,16 @@ class QualityInspection(Document):
         if not checklist:
             frappe.throw(_("Please select a checklist"))
             
-        # Get checklist
-        checklist_doc = frappe.get_doc("Quality Checklist", checklist)
-        
         # Clear existing items
         self.checklist_items = []
         
         # Copy items from checklist
-        for item in checklist_doc.items:
-            self.append("checklist_items", {
-                "check_name": item.check_name,
-                "specification": item.specification,
-                "inspection_method": item.inspection_method,
-                "expected_value": item.expected_value,
-                "acceptance_criteria": item.acceptance_criteria,
-                "is_critical": item.is_critical,
-                "status": "Pending"
-            })
+        for item in get_checklist_items(checklist):
+            self.append("checklist_items", dict(item, status="Pending"))
         
-        return self.checklist_items 
\ No newline at end of file
+        return self.checklist_items 
+
+def on_doctype_update():
+    """Indexes for the Quality Inspection Summary report"""
+    frappe.db.add_index("Quality Inspection", ["docstatus", "inspection_date"])
+    frappe.db.add_index("Quality Inspection", ["project", "inspection_type"])
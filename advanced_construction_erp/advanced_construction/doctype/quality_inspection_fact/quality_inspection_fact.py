@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class QualityInspectionFact(Document):
+    pass
+
+def on_doctype_update():
+    """QA reports filter facts by date, project and inspection type"""
+    frappe.db.add_index("Quality Inspection Fact", ["inspection_date", "project", "inspection_type"])
+    frappe.db.add_index("Quality Inspection Fact", ["project", "inspection_type", "inspection_date"])
+    frappe.db.add_index("Quality Inspection Fact", ["quality_inspection"])
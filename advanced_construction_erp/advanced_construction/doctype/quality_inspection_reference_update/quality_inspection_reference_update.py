@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+
+class QualityInspectionReferenceUpdate(Document):
+    pass
+
+def on_doctype_update():
+    """The queue is drained per reference document, oldest first"""
+    frappe.db.add_index("Quality Inspection Reference Update", ["status", "reference_type", "reference_name"])
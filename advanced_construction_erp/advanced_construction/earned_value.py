@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Earned Value Management for Construction Projects.
+
+Budget at Completion (BAC) comes from the project's budget items and is spread
+over tasks by their total cost (or evenly when tasks carry no cost). Planned
+value is phased linearly over each task's planned dates, earned value follows
+task progress and actual cost comes from the project and task actuals.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import getdate, flt, nowdate, now_datetime
+
+ACTIVE_STATUSES = ("Not Started", "In Progress", "On Hold")
+SNAPSHOT_FIELDS = ("bac", "pv", "ev", "ac", "sv", "cv", "spi", "cpi", "eac", "etc", "vac")
+
+
+def compute_evm(bac, ac, pv, ev):
+    """
+    Derive the EVM indices and forecasts from the four base values
+
+    Args:
+        bac: Budget at completion
+        ac: Actual cost
+        pv: Planned value
+        ev: Earned value
+
+    Returns:
+        Dict of bac, pv, ev, ac, sv, cv, spi, cpi, eac, etc and vac
+    """
+    bac, ac, pv, ev = flt(bac), flt(ac), flt(pv), flt(ev)
+    cpi = ev / ac if ac else None
+    spi = ev / pv if pv else None
+    eac = bac / cpi if cpi else ac + max(bac - ev, 0)
+
+    return {
+        "bac": bac,
+        "pv": pv,
+        "ev": ev,
+        "ac": ac,
+        "sv": ev - pv,
+        "cv": ev - ac,
+        "spi": spi,
+        "cpi": cpi,
+        "eac": eac,
+        "etc": max(eac - ac, 0),
+        "vac": bac - eac
+    }
+
+
+def compute_project_evm(bac, ac, tasks, as_of=None, start_date=None, end_date=None):
+    """
+    Compute project and task level EVM
+
+    Args:
+        bac: Budget at completion of the project
+        ac: Actual cost of the project
+        tasks: Iterable of task rows with name, task_name, start_date, end_date, status,
+            progress, total_cost and actual_cost
+        as_of: Status date (defaults to today)
+        start_date: Expected start of the project, used to phase PV when it has no tasks
+        end_date: Expected end of the project, used to phase PV when it has no tasks
+
+    Returns:
+        Dict with the project values and a `tasks` dict of per-task values
+    """
+    as_of = getdate(as_of or nowdate())
+    tasks = [task for task in tasks if task.get("status") != "Cancelled"]
+    bac = flt(bac)
+
+    total_cost = sum(flt(task.get("total_cost")) for task in tasks)
+    task_values = {}
+    project_pv = project_ev = 0
+
+    for task in tasks:
+        if total_cost:
+            task_bac = bac * flt(task.get("total_cost")) / total_cost
+        else:
+            task_bac = bac / len(tasks)
+
+        progress = 100 if task.get("status") == "Completed" else flt(task.get("progress"))
+        pv = task_bac * _planned_fraction(task, as_of)
+        ev = task_bac * min(max(progress, 0), 100) / 100
+
+        project_pv += pv
+        project_ev += ev
+
+        values = compute_evm(task_bac, task.get("actual_cost"), pv, ev)
+        values["task_name"] = task.get("task_name")
+        task_values[task.get("name")] = values
+
+    if not tasks:
+        project_pv = bac * _planned_fraction({"start_date": start_date, "end_date": end_date}, as_of)
+
+    values = compute_evm(bac, ac, project_pv, project_ev)
+    values["progress"] = project_ev / bac * 100 if bac else 0
+    values["tasks"] = task_values
+    return values
+
+
+def _planned_fraction(task, as_of):
+    """Share of a task's planned work scheduled on or before `as_of`"""
+    if not task.get("start_date") or not task.get("end_date"):
+        return 0
+
+    start = getdate(task.get("start_date"))
+    end = getdate(task.get("end_date"))
+    if as_of < start:
+        return 0
+    if as_of >= end:
+        return 1
+
+    return ((as_of - start).days + 1) / ((end - start).days + 1)
+
+
+def get_projects_evm(projects=None, as_of=None, include_tasks=False):
+    """
+    Compute EVM for many projects with three set-based queries
+
+    Args:
+        projects: List of Construction Project names (defaults to all active projects)
+        as_of: Status date (defaults to today)
+        include_tasks: Keep the per-task breakdown in the result
+
+    Returns:
+        Dict of project name -> EVM values
+    """
+    filters = {"name": ["in", projects]} if projects else {"status": ["in", ACTIVE_STATUSES]}
+    project_rows = frappe.get_all("Construction Project",
+        filters=filters,
+        fields=["name", "total_budget", "actual_cost", "expected_start_date", "expected_end_date"]
+    )
+    if not project_rows:
+        return {}
+
+    names = [row.name for row in project_rows]
+
+    budgets = dict(frappe.db.sql("""
+        SELECT parent, SUM(amount)
+        FROM `tabConstruction Project Budget`
+        WHERE parenttype = 'Construction Project' AND parent IN %(projects)s
+        GROUP BY parent
+    """, {"projects": names}))
+
+    tasks_by_project = {}
+    for task in frappe.get_all("Construction Project Task",
+        filters={"parenttype": "Construction Project", "parent": ["in", names]},
+        fields=["name", "parent", "task_name", "start_date", "end_date", "status",
+            "progress", "total_cost", "actual_cost"]
+    ):
+        tasks_by_project.setdefault(task.parent, []).append(task)
+
+    result = {}
+    for row in project_rows:
+        bac = flt(budgets.get(row.name)) or flt(row.total_budget)
+        values = compute_project_evm(bac, row.actual_cost, tasks_by_project.get(row.name, []), as_of,
+            row.expected_start_date, row.expected_end_date)
+        if not include_tasks:
+            values.pop("tasks")
+        result[row.name] = values
+
+    return result
+
+
+@frappe.whitelist()
+def get_project_evm(project, as_of=None):
+    """
+    Get project and task level EVM for a Construction Project
+
+    Args:
+        project: The name of the Construction Project
+        as_of: Status date (defaults to today)
+    """
+    frappe.has_permission("Construction Project", "read", project, throw=True)
+    return get_projects_evm([project], as_of, include_tasks=True).get(project)
+
+
+def take_evm_snapshots(snapshot_date=None, chunk_size=500):
+    """
+    Daily scheduled job that stores one EVM row per active project
+
+    Re-running for the same date replaces that day's rows.
+
+    Args:
+        snapshot_date: Date of the snapshot (defaults to today)
+        chunk_size: Number of projects computed and written per commit
+    """
+    snapshot_date = getdate(snapshot_date or nowdate())
+    projects = frappe.get_all("Construction Project",
+        filters={"status": ["in", ACTIVE_STATUSES]},
+        pluck="name",
+        order_by="name"
+    )
+
+    fields = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+        "construction_project", "snapshot_date", "progress"] + list(SNAPSHOT_FIELDS)
+
+    for start in range(0, len(projects), chunk_size):
+        chunk = projects[start:start + chunk_size]
+        evm = get_projects_evm(chunk, snapshot_date)
+        timestamp = now_datetime()
+
+        frappe.db.delete("Construction Project EVM Snapshot", {
+            "construction_project": ["in", chunk],
+            "snapshot_date": snapshot_date
+        })
+
+        values = []
+        for project, row in evm.items():
+            values.append(
+                (frappe.generate_hash(length=12), timestamp, timestamp, "Administrator", "Administrator", 0,
+                    project, snapshot_date, flt(row["progress"]))
+                + tuple(flt(row[field]) if row[field] is not None else None for field in SNAPSHOT_FIELDS)
+            )
+
+        frappe.db.bulk_insert("Construction Project EVM Snapshot", fields, values)
+        frappe.db.commit()
+
+
+@frappe.whitelist()
+def get_evm_s_curve(projects, from_date=None, to_date=None):
+    """
+    Get snapshot series for S-curve charts
+
+    Args:
+        projects: Construction Project name or JSON list of names
+        from_date: Start of the range (inclusive)
+        to_date: End of the range (inclusive)
+
+    Returns:
+        Dict of project name -> list of daily rows ordered by date
+    """
+    projects = frappe.parse_json(projects) if isinstance(projects, str) and projects.startswith("[") else projects
+    if isinstance(projects, str):
+        projects = [projects]
+
+    for project in projects:
+        frappe.has_permission("Construction Project", "read", project, throw=True)
+
+    filters = {"construction_project": ["in", projects]}
+    if from_date and to_date:
+        filters["snapshot_date"] = ["between", [from_date, to_date]]
+    elif from_date:
+        filters["snapshot_date"] = [">=", from_date]
+    elif to_date:
+        filters["snapshot_date"] = ["<=", to_date]
+
+    series = {project: [] for project in projects}
+    for row in frappe.get_all("Construction Project EVM Snapshot",
+        filters=filters,
+        fields=["construction_project", "snapshot_date", "progress"] + list(SNAPSHOT_FIELDS),
+        order_by="construction_project, snapshot_date"
+    ):
+        series[row.pop("construction_project")].append(row)
+
+    return series
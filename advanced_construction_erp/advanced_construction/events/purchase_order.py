@@ -5,6 +5,18 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
+from frappe.utils import flt, nowdate, now_datetime
+
+from advanced_construction_erp.advanced_construction.budget_commitment import (
+    get_commitment_lines, check_available_budget
+)
+from advanced_construction_erp.advanced_construction.budget_control import get_project_budget
+from advanced_construction_erp.advanced_construction.project_status_summary import (
+    queue_project_summary_refresh, refresh_project_summaries
+)
+
+LEDGER_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "construction_project", "posting_date", "amount", "is_reversal", "is_adjustment", "remarks"]
 
 def validate_purchase_order(doc, method):
     """
@@ -14,10 +26,14 @@ def validate_purchase_order(doc, method):
         doc: The Purchase Order document being validated
         method: The method being called
     """
-    # Check if this Purchase Order is linked to a Construction Project
-    if doc.construction_project:
+    # Check if this Purchase Order is linked to a Construction Project, directly or through its Project
+    construction_project = doc.get("construction_project")
+    if not construction_project and doc.project:
+        construction_project = frappe.db.get_value("Construction Project", {"project": doc.project}, "name")
+    
+    if construction_project:
         # Validate that the items in the Purchase Order are allowed for the project
-        validate_items_for_project(doc, doc.construction_project)
+        validate_items_for_project(doc, construction_project)
 
 def on_purchase_order_submit(doc, method):
     """
@@ -32,13 +48,9 @@ def on_purchase_order_submit(doc, method):
         # Check if there's a Construction Project linked to this Project
         construction_project = frappe.db.get_value("Construction Project", {"project": doc.project}, "name")
         
-        if construction_project:
-            # Update the Construction Project's actual cost
-            update_construction_project_cost(construction_project)
-            
+        if construction_project and post_project_cost(construction_project, doc, flt(doc.grand_total)):
             # Log the Purchase Order in the Construction Project's timeline
-            frappe.get_doc("Construction Project", construction_project).add_comment(
-                "Info", 
+            add_project_comment(construction_project,
                 _("Purchase Order {0} for {1} has been submitted").format(
                     "<a href='/app/purchase-order/{0}'>{0}</a>".format(doc.name),
                     frappe.format(doc.grand_total, {"fieldtype": "Currency"})
@@ -58,67 +70,188 @@ def on_cancel(doc, method):
         # Check if there's a Construction Project linked to this Project
         construction_project = frappe.db.get_value("Construction Project", {"project": doc.project}, "name")
         
-        if construction_project:
-            # Update the Construction Project's actual cost
-            update_construction_project_cost(construction_project)
-            
+        if construction_project and post_project_cost(construction_project, doc, -flt(doc.grand_total), is_reversal=1):
             # Log the Purchase Order cancellation in the Construction Project's timeline
-            frappe.get_doc("Construction Project", construction_project).add_comment(
-                "Info", 
+            add_project_comment(construction_project,
                 _("Purchase Order {0} for {1} has been cancelled").format(
                     "<a href='/app/purchase-order/{0}'>{0}</a>".format(doc.name),
                     frappe.format(doc.grand_total, {"fieldtype": "Currency"})
                 )
             )
 
-def update_construction_project_cost(construction_project_name):
+def post_project_cost(construction_project, doc, amount, is_reversal=0):
     """
-    Update the actual cost of a Construction Project based on all linked Purchase Orders
+    Post a signed cost ledger entry for a voucher and apply it to the project's actual cost
+    
+    The cost is applied as an atomic increment, so the work done does not depend on how many
+    vouchers the project already has. Posting the same voucher twice is a no-op.
     
     Args:
-        construction_project_name: The name of the Construction Project to update
+        construction_project: The name of the Construction Project
+        doc: The voucher causing the cost change
+        amount: Signed change to the actual cost
+        is_reversal: Set when the entry reverses an earlier posting
+    
+    Returns:
+        True if the entry was posted
     """
-    # Get the Construction Project document
-    construction_project = frappe.get_doc("Construction Project", construction_project_name)
+    if frappe.db.exists("Construction Project Cost Ledger Entry", {
+        "voucher_type": doc.doctype,
+        "voucher_no": doc.name,
+        "is_reversal": is_reversal,
+        "is_adjustment": 0
+    }):
+        return False
     
-    # Get the linked ERPNext Project
-    if not construction_project.project:
-        return
+    frappe.get_doc({
+        "doctype": "Construction Project Cost Ledger Entry",
+        "construction_project": construction_project,
+        "posting_date": doc.get("transaction_date") or nowdate(),
+        "voucher_type": doc.doctype,
+        "voucher_no": doc.name,
+        "amount": amount,
+        "is_reversal": is_reversal
+    }).insert(ignore_permissions=True)
+    
+    increment_project_cost(construction_project, amount)
+    return True
+
+def increment_project_cost(construction_project, amount):
+    """
+    Atomically add a signed amount to the actual cost of a Construction Project
+    
+    Args:
+        construction_project: The name of the Construction Project
+        amount: Signed change to the actual cost
+    """
+    frappe.db.sql("""
+        UPDATE `tabConstruction Project`
+        SET actual_cost = IFNULL(actual_cost, 0) + %(amount)s, modified = %(modified)s
+        WHERE name = %(name)s
+    """, {"amount": amount, "modified": now_datetime(), "name": construction_project})
+    queue_project_summary_refresh([construction_project])
+
+def get_ledger_balances(construction_projects):
+    """
+    Get the cost ledger balance, i.e. the actual cost, of Construction Projects
+    
+    Returns:
+        Dict of Construction Project name -> balance, for projects with ledger entries
+    """
+    return {project: flt(balance) for project, balance in frappe.db.sql("""
+        SELECT construction_project, SUM(amount)
+        FROM `tabConstruction Project Cost Ledger Entry`
+        WHERE construction_project IN %(projects)s
+        GROUP BY construction_project
+    """, {"projects": list(construction_projects)})}
+
+def add_project_comment(construction_project, content):
+    """Add an Info comment to the Construction Project timeline without loading the project"""
+    frappe.get_doc({
+        "doctype": "Comment",
+        "comment_type": "Info",
+        "reference_doctype": "Construction Project",
+        "reference_name": construction_project,
+        "content": content
+    }).insert(ignore_permissions=True)
+
+def reconcile_project_costs(chunk_size=500):
+    """
+    Daily scheduled job that reconciles the cost ledger against submitted Purchase Orders
     
-    # Calculate the total cost from all submitted Purchase Orders linked to the project
-    total_po_cost = frappe.db.sql("""
-        SELECT SUM(grand_total)
-        FROM `tabPurchase Order`
-        WHERE project = %s AND docstatus = 1
-    """, construction_project.project)[0][0] or 0
+    Missing or stale postings are corrected with adjustment entries, and a project's actual cost
+    is then set to its ledger balance. The chunk's projects are locked before the ledger is read,
+    so a posting made while the job runs either is already in the balance or waits for the lock
+    and increments the reconciled cost afterwards; it is never counted twice.
     
-    # Update the Construction Project's actual cost
-    construction_project.db_set('actual_cost', total_po_cost, update_modified=True)
+    Args:
+        chunk_size: Number of projects reconciled per commit
+    """
+    projects = frappe.get_all("Construction Project",
+        filters={"project": ["is", "set"]},
+        fields=["name", "project"],
+        order_by="name"
+    )
+    
+    adjusted = corrected = 0
+    for start in range(0, len(projects), chunk_size):
+        chunk = projects[start:start + chunk_size]
+        
+        # Start a fresh transaction so the ledger reads below see every posting committed
+        # before the lock was taken
+        frappe.db.commit()
+        actual_costs = dict(frappe.db.sql("""
+            SELECT name, IFNULL(actual_cost, 0)
+            FROM `tabConstruction Project`
+            WHERE name IN %(projects)s
+            FOR UPDATE
+        """, {"projects": [row.name for row in chunk]}))
+        
+        po_totals = dict(frappe.db.sql("""
+            SELECT project, SUM(grand_total)
+            FROM `tabPurchase Order`
+            WHERE docstatus = 1 AND project IN %(projects)s
+            GROUP BY project
+        """, {"projects": [row.project for row in chunk]}))
+        
+        ledger_totals = get_ledger_balances([row.name for row in chunk])
+        
+        timestamp = now_datetime()
+        adjustments = []
+        drifted = []
+        for row in chunk:
+            balance = flt(ledger_totals.get(row.name))
+            difference = flt(flt(po_totals.get(row.project)) - balance, 2)
+            if difference:
+                adjustments.append((frappe.generate_hash(length=12), timestamp, timestamp,
+                    "Administrator", "Administrator", 0, row.name, timestamp.date(),
+                    difference, 0, 1, _("Reconciliation against submitted Purchase Orders")))
+                balance += difference
+            
+            if flt(balance - flt(actual_costs.get(row.name)), 2):
+                drifted.append(row.name)
+                frappe.db.sql("""
+                    UPDATE `tabConstruction Project`
+                    SET actual_cost = %(balance)s, modified = %(modified)s
+                    WHERE name = %(name)s
+                """, {"balance": balance, "modified": timestamp, "name": row.name})
+                corrected += 1
+        
+        frappe.db.bulk_insert("Construction Project Cost Ledger Entry", LEDGER_COLUMNS, adjustments)
+        refresh_project_summaries(drifted)
+        adjusted += len(adjustments)
+        frappe.db.commit()
+    
+    frappe.logger("construction_project").info(
+        "Cost ledger reconciliation: {0} projects, {1} adjustment entries, {2} actual costs corrected".format(
+            len(projects), adjusted, corrected))
     
 def validate_items_for_project(doc, construction_project):
     """
     Validate that the items in the Purchase Order are allowed for the project
     
+    Items outside the budget are reported in one warning. When the project blocks purchases
+    over budget, the order is rejected if any item exceeds its available budget balance.
+    
     Args:
         doc: The Purchase Order document
         construction_project: The name of the Construction Project
     """
-    # Get the Construction Project document
-    construction_project_doc = frappe.get_doc("Construction Project", construction_project)
+    budget = get_project_budget(construction_project)
     
     # Check if there's a budget for this project
-    if not construction_project_doc.budget_items:
+    if not budget["items"]:
+        return
+    
+    if budget["block_purchases_over_budget"]:
+        check_available_budget(get_commitment_lines(doc))
         return
     
-    # Create a list of allowed items from the budget
-    allowed_items = [item.item_code for item in construction_project_doc.budget_items]
-    
-    # Check each item in the Purchase Order
-    for item in doc.items:
-        if item.item_code and item.item_code not in allowed_items:
-            frappe.msgprint(
-                _("Item {0} is not in the budget for Construction Project {1}").format(
-                    item.item_code, construction_project
-                ),
-                alert=True
-            )
\ No newline at end of file
+    not_in_budget = sorted({item.item_code for item in doc.items if item.item_code} - set(budget["items"]))
+    if not_in_budget:
+        frappe.msgprint(
+            _("Items {0} are not in the budget for Construction Project {1}").format(
+                ", ".join(not_in_budget), construction_project
+            ),
+            alert=True
+        )
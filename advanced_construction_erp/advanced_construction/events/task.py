@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+from advanced_construction_erp.advanced_construction.ncr_task_sync import queue_task_sync
+
+def on_task_update(doc, method):
+    """
+    Handler for Task document on_update event
+    
+    Args:
+        doc: The Task document being updated
+        method: The method being called
+    """
+    # Push status changes to the Non Conformance Report actions linked to this task
+    if doc.has_value_changed("status") and doc.status == "Completed":
+        queue_task_sync([doc.name])
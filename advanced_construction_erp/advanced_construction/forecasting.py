@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Portfolio cost forecasting for Construction Projects.
+
+Estimates at completion (EAC) are computed per budget line, budget category
+and project with three methods:
+
+- CPI: remaining work performed at the cost efficiency achieved so far
+- CPI x SPI: remaining work also penalised by schedule slippage
+- Regression: the actual cost trend of the last REGRESSION_DAYS of cost
+  snapshots extrapolated to the expected end date
+
+Projects are processed a chunk at a time: each chunk is loaded with a handful
+of set-based queries and every level is computed column-wise over the chunk.
+The nightly job spreads the chunks over the long queue workers and the results
+are stored in Construction Cost Forecast for dashboards.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import getdate, add_days, flt, nowdate, now_datetime
+
+from advanced_construction_erp.advanced_construction.earned_value import ACTIVE_STATUSES, get_projects_evm
+
+REGRESSION_DAYS = 90
+REGRESSION_MIN_POINTS = 3
+FORECAST_FIELDS = ("bac", "ac", "ev", "cpi", "spi", "eac_cpi", "eac_cpi_spi", "eac_regression", "eac", "vac")
+FORECAST_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "forecast_date", "level", "construction_project", "reference_name", "budget_category"] + list(FORECAST_FIELDS)
+
+
+def compute_eac(bac, ac, ev, spi, eac_regression):
+    """
+    Compute the EAC columns for equally long lists of inputs
+
+    Args:
+        bac: Budgets at completion
+        ac: Actual costs
+        ev: Earned values
+        spi: Schedule performance indices (None where unknown)
+        eac_regression: Regression estimates (None where unavailable)
+
+    Returns:
+        Dict of column name -> list, for every field in FORECAST_FIELDS
+    """
+    columns = {field: [] for field in FORECAST_FIELDS}
+
+    for row_bac, row_ac, row_ev, row_spi, row_regression in zip(bac, ac, ev, spi, eac_regression):
+        row_bac, row_ac, row_ev = flt(row_bac), flt(row_ac), flt(row_ev)
+        cpi = row_ev / row_ac if row_ac else None
+        remaining = max(row_bac - row_ev, 0)
+
+        eac_cpi = row_ac + remaining / cpi if cpi else row_ac + remaining
+        eac_cpi_spi = row_ac + remaining / (cpi * row_spi) if cpi and row_spi else eac_cpi
+
+        # The regression reflects the recorded trend; otherwise fall back to the CPI estimate
+        eac = row_regression if row_regression is not None else eac_cpi
+
+        for field, value in (("bac", row_bac), ("ac", row_ac), ("ev", row_ev), ("cpi", cpi), ("spi", row_spi),
+                ("eac_cpi", eac_cpi), ("eac_cpi_spi", eac_cpi_spi), ("eac_regression", row_regression),
+                ("eac", eac), ("vac", row_bac - eac)):
+            columns[field].append(value)
+
+    return columns
+
+
+def linear_trend(points, at):
+    """
+    Least-squares fit of value against day number, evaluated at `at`
+
+    Args:
+        points: List of (date, value)
+        at: Date to evaluate the trend at
+
+    Returns:
+        The estimated value, or None with fewer than REGRESSION_MIN_POINTS points
+    """
+    if len(points) < REGRESSION_MIN_POINTS:
+        return None
+
+    xs = [getdate(date).toordinal() for date, value in points]
+    ys = [flt(value) for date, value in points]
+    n = len(points)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if not sxx:
+        return None
+
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sxx
+    return mean_y + slope * (getdate(at).toordinal() - mean_x)
+
+
+def forecast_projects(projects, forecast_date=None):
+    """
+    Compute line, category and project forecasts for a chunk of Construction Projects
+
+    Args:
+        projects: List of Construction Project names
+        forecast_date: Status date (defaults to today)
+
+    Returns:
+        List of forecast rows with level, construction_project, reference_name, budget_category
+        and the fields in FORECAST_FIELDS
+    """
+    forecast_date = getdate(forecast_date or nowdate())
+    evm = get_projects_evm(projects, forecast_date)
+    if not evm:
+        return []
+
+    projects = list(evm)
+    end_dates = dict(frappe.get_all("Construction Project",
+        filters={"name": ["in", projects]},
+        fields=["name", "expected_end_date"],
+        as_list=1
+    ))
+
+    lines = frappe.get_all("Construction Project Budget",
+        filters={"parenttype": "Construction Project", "parent": ["in", projects]},
+        fields=["name", "parent", "budget_category", "amount", "actual_amount"],
+        order_by="parent, idx"
+    )
+
+    trends = get_cost_trends(projects, forecast_date)
+
+    def regression(project, key, ac):
+        end_date = end_dates.get(project)
+        if not end_date or getdate(end_date) <= forecast_date:
+            return None
+        estimate = linear_trend(trends.get(key, []), end_date)
+        return max(estimate, flt(ac)) if estimate is not None else None
+
+    rows = []
+
+    # Budget lines earn value in step with their project
+    line_ev = [flt(line.amount) * flt(evm[line.parent]["progress"]) / 100 for line in lines]
+    line_regression = [regression(line.parent, ("Budget Item", line.name), line.actual_amount) for line in lines]
+    columns = compute_eac(
+        [line.amount for line in lines],
+        [line.actual_amount for line in lines],
+        line_ev,
+        [evm[line.parent]["spi"] for line in lines],
+        line_regression
+    )
+    rows.extend(_to_rows(columns, "Budget Item", [(line.parent, line.name, line.budget_category) for line in lines]))
+
+    categories = {}
+    for line, ev, estimate in zip(lines, line_ev, line_regression):
+        totals = categories.setdefault((line.parent, line.budget_category), {"bac": 0, "ac": 0, "ev": 0, "regression": 0})
+        totals["bac"] += flt(line.amount)
+        totals["ac"] += flt(line.actual_amount)
+        totals["ev"] += ev
+        # A category only has a regression estimate when all of its lines have one
+        totals["regression"] = totals["regression"] + estimate if estimate is not None and totals["regression"] is not None else None
+
+    keys = [key for key in categories if key[1]]
+    columns = compute_eac(
+        [categories[key]["bac"] for key in keys],
+        [categories[key]["ac"] for key in keys],
+        [categories[key]["ev"] for key in keys],
+        [evm[key[0]]["spi"] for key in keys],
+        [categories[key]["regression"] for key in keys]
+    )
+    rows.extend(_to_rows(columns, "Category", [(project, None, category) for project, category in keys]))
+
+    columns = compute_eac(
+        [evm[project]["bac"] for project in projects],
+        [evm[project]["ac"] for project in projects],
+        [evm[project]["ev"] for project in projects],
+        [evm[project]["spi"] for project in projects],
+        [regression(project, ("Project", project), evm[project]["ac"]) for project in projects]
+    )
+    rows.extend(_to_rows(columns, "Project", [(project, None, None) for project in projects]))
+
+    return rows
+
+
+def _to_rows(columns, level, keys):
+    return [
+        dict({field: columns[field][i] for field in FORECAST_FIELDS},
+            level=level, construction_project=project, reference_name=reference_name, budget_category=category)
+        for i, (project, reference_name, category) in enumerate(keys)
+    ]
+
+
+def get_cost_trends(projects, forecast_date):
+    """
+    Load actual cost snapshots for regression
+
+    Returns:
+        Dict of ("Project", project) or ("Budget Item", line) -> list of (date, actual amount)
+    """
+    trends = {}
+    for level, project, reference_name, snapshot_date, actual_amount in frappe.db.sql("""
+        SELECT level, construction_project, reference_name, snapshot_date, actual_amount
+        FROM `tabConstruction Cost Snapshot`
+        WHERE construction_project IN %(projects)s AND level IN ('Project', 'Budget Item')
+            AND snapshot_date BETWEEN %(from_date)s AND %(to_date)s
+        ORDER BY snapshot_date
+    """, {"projects": projects, "from_date": add_days(forecast_date, -REGRESSION_DAYS), "to_date": forecast_date}):
+        key = (level, project if level == "Project" else reference_name)
+        trends.setdefault(key, []).append((snapshot_date, actual_amount))
+
+    return trends
+
+
+def save_forecasts(projects, forecast_date=None):
+    """
+    Compute and store the forecasts of a chunk of projects, replacing that day's rows
+
+    Args:
+        projects: List of Construction Project names
+        forecast_date: Status date (defaults to today)
+    """
+    forecast_date = getdate(forecast_date or nowdate())
+    rows = forecast_projects(projects, forecast_date)
+
+    frappe.db.delete("Construction Cost Forecast", {
+        "construction_project": ["in", projects],
+        "forecast_date": forecast_date
+    })
+
+    timestamp = now_datetime()
+    frappe.db.bulk_insert("Construction Cost Forecast", FORECAST_COLUMNS, [
+        (frappe.generate_hash(length=12), timestamp, timestamp, "Administrator", "Administrator", 0,
+            forecast_date, row["level"], row["construction_project"], row["reference_name"], row["budget_category"])
+        + tuple(flt(row[field], 6) if row[field] is not None else None for field in FORECAST_FIELDS)
+        for row in rows
+    ])
+    frappe.db.commit()
+
+
+def run_portfolio_forecast(chunk_size=100, forecast_date=None):
+    """
+    Nightly scheduled job that forecasts every active project
+
+    Each chunk is enqueued as its own job on the long queue, so the chunks run in parallel
+    across the available workers.
+
+    Args:
+        chunk_size: Number of projects forecast per job
+        forecast_date: Status date (defaults to today)
+    """
+    forecast_date = str(getdate(forecast_date or nowdate()))
+    projects = frappe.get_all("Construction Project",
+        filters={"status": ["in", ACTIVE_STATUSES]},
+        pluck="name",
+        order_by="name"
+    )
+
+    for start in range(0, len(projects), chunk_size):
+        frappe.enqueue(
+            "advanced_construction_erp.advanced_construction.forecasting.save_forecasts",
+            queue="long",
+            job_name="construction_cost_forecast:{0}:{1}".format(forecast_date, start),
+            projects=projects[start:start + chunk_size],
+            forecast_date=forecast_date
+        )
+
+
+@frappe.whitelist()
+def get_project_forecast(construction_project, forecast_date=None):
+    """
+    Get the stored forecast of a Construction Project
+
+    Args:
+        construction_project: The name of the Construction Project
+        forecast_date: Forecast date (defaults to the latest one)
+
+    Returns:
+        Dict with the forecast date and the Project, Category and Budget Item rows
+    """
+    frappe.has_permission("Construction Project", "read", construction_project, throw=True)
+
+    if not forecast_date:
+        forecast_date = frappe.db.get_value("Construction Cost Forecast",
+            {"construction_project": construction_project}, "MAX(forecast_date)")
+    if not forecast_date:
+        return {}
+
+    result = {"forecast_date": forecast_date}
+    for row in frappe.get_all("Construction Cost Forecast",
+        filters={"construction_project": construction_project, "forecast_date": forecast_date},
+        fields=["level", "reference_name", "budget_category"] + list(FORECAST_FIELDS),
+        order_by="level, budget_category, reference_name"
+    ):
+        result.setdefault(row.pop("level"), []).append(row)
+
+    return result
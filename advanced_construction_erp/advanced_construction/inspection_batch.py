@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Batch creation of draft Quality Inspections from a Quality Checklist.
+
+A pour, floor or delivery often needs the same checklist inspected at many
+locations, tasks or receipts. The checklist is read once, names are taken from
+the Quality Inspection naming rule up front, and headers and items are written
+with bulk inserts in chunks from a background job that reports its progress to
+the requesting user. Bulk inserts skip validation, so the mandatory fields are
+checked before the job is queued.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.model.naming import make_autoname
+from frappe.utils import getdate, nowdate, now_datetime
+
+from advanced_construction_erp.advanced_construction.checklist_versions import resolve_checklist_items
+
+CHUNK_SIZE = 200
+
+CHECKLIST_ITEM_FIELDS = ["check_name", "specification", "inspection_method", "expected_value",
+    "acceptance_criteria", "is_critical"]
+
+INSPECTION_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "inspection_type", "project", "inspection_date", "location", "status", "reference_type",
+    "reference_name", "item_code", "quality_checklist", "total_checks", "passed_checks",
+    "failed_checks", "quality_score", "inspector"]
+
+INSPECTION_ITEM_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "parent", "parentfield", "parenttype", "idx"] + CHECKLIST_ITEM_FIELDS + ["status"]
+
+TARGET_FIELDS = ("location", "reference_type", "reference_name", "item_code")
+
+
+def get_checklist_items(checklist):
+    """
+    Get the items of any Quality Checklist version in sequence, without loading the document
+
+    Args:
+        checklist: The name of the Quality Checklist
+
+    Returns:
+        List of dicts with the fields copied to inspection items
+    """
+    return [
+        frappe._dict({field: item.get(field) for field in CHECKLIST_ITEM_FIELDS})
+        for item in resolve_checklist_items(checklist)
+    ]
+
+
+def reserve_inspection_names(inspections):
+    """
+    Take a name for each inspection from the Quality Inspection naming rule
+
+    Names come from the same series counter a regular insert uses, so batches and single
+    inspections never collide.
+
+    Args:
+        inspections: List of dicts with the inspection fields the naming rule may refer to
+
+    Returns:
+        List of names
+    """
+    autoname = frappe.get_meta("Quality Inspection").autoname
+    return [make_autoname(autoname, "Quality Inspection", frappe._dict(inspection)) for inspection in inspections]
+
+
+def validate_batch(targets, project, inspector):
+    """Check the mandatory inspection fields that the bulk insert does not validate"""
+    if not project:
+        frappe.throw(_("Please select the Project of the inspections"))
+    if not frappe.db.exists("Construction Project", project):
+        frappe.throw(_("Construction Project {0} not found").format(project))
+
+    if not inspector:
+        frappe.throw(_("Please select the Inspector of the inspections"))
+    if not frappe.db.exists("User", inspector):
+        frappe.throw(_("User {0} not found").format(inspector))
+
+    missing = [str(idx) for idx, target in enumerate(targets, 1) if not target.get("location")]
+    if missing:
+        frappe.throw(_("Location is required for every inspection; missing in rows {0}").format(", ".join(missing)))
+
+
+@frappe.whitelist()
+def make_inspection_batch(checklist, targets, project=None, inspection_date=None, inspector=None):
+    """
+    Queue the creation of one draft Quality Inspection per target
+
+    Args:
+        checklist: The name of the Quality Checklist
+        targets: JSON list of dicts with any of location, reference_type, reference_name and item_code
+        project: Construction Project for every inspection
+        inspection_date: Inspection date (defaults to today)
+        inspector: Inspector for every inspection
+
+    Returns:
+        Number of inspections queued
+    """
+    frappe.has_permission("Quality Inspection", "create", throw=True)
+
+    targets = frappe.parse_json(targets) if isinstance(targets, str) else targets
+    if not targets:
+        frappe.throw(_("Please add at least one location, task or receipt"))
+    validate_batch(targets, project, inspector)
+
+    status = frappe.db.get_value("Quality Checklist", checklist, "status")
+    if status is None:
+        frappe.throw(_("Quality Checklist {0} not found").format(checklist))
+    if status == "Obsolete":
+        frappe.throw(_("Cannot create inspections from an obsolete checklist"))
+
+    frappe.enqueue(
+        "advanced_construction_erp.advanced_construction.inspection_batch.create_inspection_batch",
+        queue="long",
+        timeout=3600,
+        checklist=checklist,
+        targets=targets,
+        project=project,
+        inspection_date=inspection_date,
+        inspector=inspector,
+        user=frappe.session.user
+    )
+
+    return len(targets)
+
+
+def create_inspection_batch(checklist, targets, project=None, inspection_date=None, inspector=None, user=None):
+    """
+    Create one draft Quality Inspection per target with bulk inserts
+
+    Args:
+        checklist: The name of the Quality Checklist
+        targets: List of dicts with any of location, reference_type, reference_name and item_code
+        project: Construction Project for every inspection
+        inspection_date: Inspection date (defaults to today)
+        inspector: Inspector for every inspection
+        user: User the inspections are created for and progress is reported to
+
+    Returns:
+        List of the created inspection names
+    """
+    user = user or frappe.session.user
+    inspection_date = getdate(inspection_date or nowdate())
+    inspection_type = frappe.db.get_value("Quality Checklist", checklist, "checklist_type")
+    items = get_checklist_items(checklist)
+    if not items:
+        frappe.throw(_("Quality Checklist {0} has no items").format(checklist))
+    validate_batch(targets, project, inspector)
+
+    targets = [{field: target.get(field) for field in TARGET_FIELDS} for target in targets]
+    names = reserve_inspection_names([
+        dict(target, inspection_type=inspection_type, project=project, inspection_date=inspection_date,
+            inspector=inspector, quality_checklist=checklist)
+        for target in targets
+    ])
+    # Persist the reservation even if a later chunk fails
+    frappe.db.commit()
+
+    for start in range(0, len(targets), CHUNK_SIZE):
+        timestamp = now_datetime()
+        headers = []
+        rows = []
+
+        for name, target in zip(names[start:start + CHUNK_SIZE], targets[start:start + CHUNK_SIZE]):
+            headers.append((name, timestamp, timestamp, user, user, 0,
+                inspection_type, project, inspection_date, target["location"], "Draft", target["reference_type"],
+                target["reference_name"], target["item_code"], checklist, len(items), 0, 0, 0, inspector))
+
+            for idx, item in enumerate(items, 1):
+                rows.append((frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0,
+                    name, "checklist_items", "Quality Inspection", idx)
+                    + tuple(item[field] for field in CHECKLIST_ITEM_FIELDS) + ("Pending",))
+
+        frappe.db.bulk_insert("Quality Inspection", INSPECTION_COLUMNS, headers)
+        frappe.db.bulk_insert("Quality Inspection Item", INSPECTION_ITEM_COLUMNS, rows)
+        frappe.db.commit()
+
+        done = min(start + CHUNK_SIZE, len(targets))
+        frappe.publish_progress(done * 100.0 / len(targets), title=_("Creating Quality Inspections"),
+            description=_("{0} of {1} inspections created").format(done, len(targets)))
+
+    frappe.publish_realtime("msgprint",
+        _("{0} Quality Inspections created from checklist {1}").format(len(names), checklist), user=user)
+
+    return names
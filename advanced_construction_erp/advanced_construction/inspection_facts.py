@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Denormalized Quality Inspection results for analytics.
+
+Each submitted Quality Inspection has one Quality Inspection Fact row named
+after it, holding its check counts, critical failures, score and the dimensions
+QA reports filter on. The row is written once on submit and removed on cancel,
+so dashboards and reports aggregate compact facts instead of scanning
+inspection items.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt, now_datetime
+
+from advanced_construction_erp.advanced_construction.reports.quality_inspection_summary.quality_inspection_summary import (
+    clear_cache as clear_summary_cache
+)
+
+FACT_FIELDS = ["quality_inspection", "project", "inspection_type", "location", "inspection_date", "status",
+    "quality_checklist", "item_code", "total_checks", "passed_checks", "failed_checks", "na_checks",
+    "critical_failures", "has_critical_failure", "quality_score"]
+FACT_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + FACT_FIELDS
+
+
+def count_results(items):
+    """
+    Count inspection item results in a single pass
+
+    Args:
+        items: Quality Inspection Item rows
+
+    Returns:
+        Dict with total, passed, failed, na, critical_failures and quality_score
+        (passed share of the applicable checks)
+    """
+    counts = {"total": 0, "passed": 0, "failed": 0, "na": 0, "critical_failures": 0}
+
+    for item in items:
+        counts["total"] += 1
+        if item.status == "Pass":
+            counts["passed"] += 1
+        elif item.status == "Fail":
+            counts["failed"] += 1
+            if cint(item.is_critical):
+                counts["critical_failures"] += 1
+        elif item.status == "Not Applicable":
+            counts["na"] += 1
+
+    applicable = counts["total"] - counts["na"]
+    counts["quality_score"] = counts["passed"] / applicable * 100 if applicable > 0 else 0
+    return counts
+
+
+def write_inspection_fact(doc, counts=None):
+    """
+    Write the fact row of a submitted Quality Inspection
+
+    Args:
+        doc: The Quality Inspection
+        counts: Result of `count_results` for its items (computed when not given)
+    """
+    counts = counts or count_results(doc.checklist_items or [])
+    timestamp = now_datetime()
+
+    frappe.db.delete("Quality Inspection Fact", {"name": doc.name})
+    frappe.db.bulk_insert("Quality Inspection Fact", FACT_COLUMNS, [(
+        doc.name, timestamp, timestamp, frappe.session.user, frappe.session.user, 0,
+        doc.name, doc.project, doc.inspection_type, doc.location, doc.inspection_date, doc.status,
+        doc.quality_checklist, doc.item_code, counts["total"], counts["passed"], counts["failed"], counts["na"],
+        counts["critical_failures"], 1 if counts["critical_failures"] else 0, flt(counts["quality_score"])
+    )])
+
+
+def delete_inspection_fact(doc):
+    """Remove the fact row of a cancelled Quality Inspection"""
+    frappe.db.delete("Quality Inspection Fact", {"name": doc.name})
+
+
+def rebuild_inspection_facts():
+    """Rebuild every fact row from the submitted inspections with one INSERT ... SELECT"""
+    frappe.db.delete("Quality Inspection Fact")
+    frappe.db.sql("""
+        INSERT INTO `tabQuality Inspection Fact` ({columns})
+        SELECT qi.name, NOW(), NOW(), 'Administrator', 'Administrator', 0,
+            qi.name, qi.project, qi.inspection_type, qi.location, qi.inspection_date, qi.status,
+            qi.quality_checklist, qi.item_code,
+            COUNT(qii.name),
+            SUM(qii.status = 'Pass'),
+            SUM(qii.status = 'Fail'),
+            SUM(qii.status = 'Not Applicable'),
+            SUM(qii.status = 'Fail' AND qii.is_critical = 1),
+            IF(SUM(qii.status = 'Fail' AND qii.is_critical = 1) > 0, 1, 0),
+            IFNULL(SUM(qii.status = 'Pass') * 100 / NULLIF(COUNT(qii.name) - SUM(qii.status = 'Not Applicable'), 0), 0)
+        FROM `tabQuality Inspection` qi
+        LEFT JOIN `tabQuality Inspection Item` qii
+            ON qii.parent = qi.name AND qii.parenttype = 'Quality Inspection'
+        WHERE qi.docstatus = 1
+        GROUP BY qi.name
+    """.format(columns=", ".join("`{0}`".format(column) for column in FACT_COLUMNS)))
+
+    # The report aggregates the fact table; results cached before the rebuild are stale
+    clear_summary_cache()
+
+
+@frappe.whitelist()
+def rebuild_quality_inspection_facts():
+    """Rebuild the inspection facts on demand"""
+    frappe.only_for("System Manager")
+    rebuild_inspection_facts()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Deferred updates of the documents a Quality Inspection refers to.
+
+Submitting an inspection only records a Quality Inspection Reference Update
+row; the Purchase Receipt or Task is updated later by a background job.
+Cancelling it drops the row if it has not been applied yet. The
+job applies every queued result of a reference document in one save, so a
+receipt inspected item by item is saved once instead of once per inspection.
+Lock contention leaves the rows queued for a retry; other errors and rows out
+of attempts are marked Failed with the traceback and can be replayed.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import now_datetime, cint
+
+from advanced_construction_erp.utils import enqueue_before_commit
+
+QUEUE_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "quality_inspection", "reference_type", "reference_name", "item_code", "inspection_status",
+    "status", "attempts"]
+
+SUPPORTED_REFERENCES = ("Purchase Receipt", "Task")
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 100
+
+# Errors caused by another transaction holding the reference document
+LOCK_ERRORS = (frappe.QueryDeadlockError, frappe.QueryTimeoutError, frappe.DocumentLockedError,
+    frappe.TimestampMismatchError)
+
+
+def queue_reference_update(inspection):
+    """
+    Queue the result of a submitted Quality Inspection for its reference document
+
+    Args:
+        inspection: The Quality Inspection
+    """
+    if inspection.reference_type not in SUPPORTED_REFERENCES or not inspection.reference_name:
+        return
+
+    timestamp = now_datetime()
+    frappe.db.bulk_insert("Quality Inspection Reference Update", QUEUE_COLUMNS, [(
+        frappe.generate_hash(length=12), timestamp, timestamp, frappe.session.user, frappe.session.user, 0,
+        inspection.name, inspection.reference_type, inspection.reference_name, inspection.item_code,
+        inspection.status, "Queued", 0
+    )])
+
+    enqueue_before_commit("quality_inspection_reference_update",
+        [(inspection.reference_type, inspection.reference_name)], _enqueue_processing)
+
+
+def cancel_reference_update(inspection):
+    """Drop the results of a cancelled Quality Inspection that are still queued"""
+    frappe.db.delete("Quality Inspection Reference Update",
+        {"quality_inspection": inspection.name, "status": "Queued"})
+
+
+def _enqueue_processing(references):
+    frappe.enqueue(
+        "advanced_construction_erp.advanced_construction.inspection_reference_update.process_reference_updates",
+        queue="short",
+        enqueue_after_commit=True,
+        references=sorted(references)
+    )
+
+
+def process_reference_updates(references=None):
+    """
+    Apply queued inspection results, one save per reference document
+
+    Also runs on the scheduler to pick up retries and anything whose job was lost.
+
+    Args:
+        references: List of (reference_type, reference_name) to process (defaults to every
+            reference with queued rows, up to BATCH_SIZE)
+
+    Returns:
+        Dict with the number of references completed, retried and failed
+    """
+    if references is None:
+        references = frappe.db.sql("""
+            SELECT DISTINCT reference_type, reference_name
+            FROM `tabQuality Inspection Reference Update`
+            WHERE status = 'Queued'
+            LIMIT %s
+        """, BATCH_SIZE)
+
+    result = {"completed": 0, "retried": 0, "failed": 0}
+    for reference_type, reference_name in references:
+        result[apply_reference_updates(reference_type, reference_name)] += 1
+
+    return result
+
+
+def apply_reference_updates(reference_type, reference_name):
+    """
+    Apply every queued result for one reference document in a single save
+
+    Returns:
+        "completed", "retried" or "failed"
+    """
+    rows = []
+    try:
+        # Locking the queue rows makes concurrent workers for the same reference wait here,
+        # after which they find nothing left to do
+        rows = frappe.db.sql("""
+            SELECT name, quality_inspection, item_code, inspection_status, attempts
+            FROM `tabQuality Inspection Reference Update`
+            WHERE status = 'Queued' AND reference_type = %s AND reference_name = %s
+            ORDER BY creation
+            FOR UPDATE
+        """, (reference_type, reference_name), as_dict=1)
+        if not rows:
+            return "completed"
+
+        if frappe.db.exists(reference_type, reference_name):
+            ref_doc = frappe.get_doc(reference_type, reference_name, for_update=True)
+            apply_inspection_results(ref_doc, rows)
+            ref_doc.save(ignore_permissions=True)
+
+        frappe.db.set_value("Quality Inspection Reference Update", {"name": ["in", [row.name for row in rows]]},
+            {"status": "Completed", "processed_on": now_datetime(), "error": None})
+        frappe.db.commit()
+        return "completed"
+
+    except Exception as e:
+        frappe.db.rollback()
+        if not rows:
+            # Waiting on another worker's lock: the rows stay queued for the next run
+            if isinstance(e, LOCK_ERRORS):
+                return "retried"
+            raise
+
+        error = frappe.get_traceback()
+        retry = isinstance(e, LOCK_ERRORS) and max(cint(row.attempts) for row in rows) + 1 < MAX_ATTEMPTS
+        frappe.db.sql("""
+            UPDATE `tabQuality Inspection Reference Update`
+            SET attempts = attempts + 1, status = %(status)s, error = %(error)s, processed_on = %(now)s
+            WHERE name IN %(names)s
+        """, {"status": "Queued" if retry else "Failed", "error": error, "now": now_datetime(),
+            "names": [row.name for row in rows]})
+        frappe.db.commit()
+
+        if not retry:
+            frappe.logger("construction_project").error(
+                "Quality inspection results for {0} {1} failed".format(reference_type, reference_name))
+        return "retried" if retry else "failed"
+
+
+def apply_inspection_results(ref_doc, rows):
+    """
+    Apply queued inspection results to a loaded reference document, oldest first
+
+    Args:
+        ref_doc: The Purchase Receipt or Task
+        rows: Queue rows with quality_inspection, item_code and inspection_status
+    """
+    if ref_doc.doctype == "Purchase Receipt":
+        # Later inspections of the same item win
+        latest = {row.item_code: row for row in rows}
+        for item in ref_doc.items:
+            row = latest.get(item.item_code)
+            if row:
+                item.quality_inspection = row.quality_inspection
+                item.qa_status = row.inspection_status
+
+    elif ref_doc.doctype == "Task":
+        row = rows[-1]
+        if row.inspection_status == "Approved":
+            ref_doc.status = "Completed"
+        elif row.inspection_status == "Rejected":
+            ref_doc.status = "Failed QC"
+        ref_doc.quality_inspection = row.quality_inspection
+
+
+@frappe.whitelist()
+def retry_failed_reference_updates(names=None):
+    """
+    Requeue failed reference updates and process them
+
+    Args:
+        names: JSON list of Quality Inspection Reference Update names (defaults to all failed rows)
+
+    Returns:
+        Number of rows requeued
+    """
+    frappe.only_for(["System Manager", "Quality Manager"])
+
+    filters = {"status": "Failed"}
+    if names:
+        filters["name"] = ["in", frappe.parse_json(names) if isinstance(names, str) else names]
+
+    rows = frappe.get_all("Quality Inspection Reference Update", filters=filters,
+        fields=["name", "reference_type", "reference_name"])
+    if not rows:
+        frappe.msgprint(_("No failed reference updates to retry"))
+        return 0
+
+    frappe.db.set_value("Quality Inspection Reference Update", {"name": ["in", [row.name for row in rows]]},
+        {"status": "Queued", "attempts": 0})
+    _enqueue_processing({(row.reference_type, row.reference_name) for row in rows})
+
+    return len(rows)
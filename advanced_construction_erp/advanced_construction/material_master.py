@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Bulk import and Item sync of the Construction Material master.
+
+A supplier catalogue can hold thousands of materials. The import job resolves
+units of measure and item groups from a cached lookup, reads the existing
+materials and Items of a chunk with one query each, and writes new materials,
+new Items and changed fields with bulk inserts and updates instead of saving
+every document.
+
+`get_material_usage` counts the transactions referencing many materials in one
+grouped query. The import uses it so that the stock UOM and stock item flag of
+an Item with stock movements are never changed, and materials use it to refuse
+deletion.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import cint, cstr, flt, now_datetime
+from frappe.utils.csvutils import read_csv_content
+
+DEFAULT_ITEM_GROUP = "Construction Materials"
+CHUNK_SIZE = 500
+
+LOOKUP_KEY = "construction_material_lookups"
+
+MATERIAL_FIELDS = ["material_name", "material_type", "description", "is_stock_item", "is_fixed_asset",
+    "disabled", "unit_of_measure", "weight_per_unit", "dimensions", "brand", "manufacturer",
+    "country_of_origin", "default_warehouse", "reorder_level", "safety_stock", "lead_time_days",
+    "min_order_qty", "max_order_qty", "standard_rate", "currency", "inspection_required", "asset_category"]
+CHECK_FIELDS = ("is_stock_item", "is_fixed_asset", "disabled", "inspection_required")
+NUMBER_FIELDS = ("weight_per_unit", "reorder_level", "safety_stock", "lead_time_days", "min_order_qty",
+    "max_order_qty", "standard_rate")
+
+META_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus"]
+MATERIAL_COLUMNS = META_COLUMNS + ["material_code"] + MATERIAL_FIELDS + ["item"]
+ITEM_COLUMNS = META_COLUMNS + ["item_code", "item_name", "item_group", "description", "stock_uom",
+    "is_stock_item", "disabled", "country_of_origin"]
+CHILD_COLUMNS = META_COLUMNS + ["parent", "parentfield", "parenttype", "idx"]
+
+# Item field -> Construction Material field kept in sync
+ITEM_SYNC_FIELDS = {
+    "item_name": "material_name",
+    "description": "description",
+    "disabled": "disabled",
+    "is_stock_item": "is_stock_item",
+    "stock_uom": "unit_of_measure"
+}
+
+# Item fields ERPNext does not allow to change once the Item has stock ledger entries
+STOCK_FROZEN_FIELDS = ("stock_uom", "is_stock_item")
+
+# (doctype, field, whether the field holds the linked Item rather than the material)
+USAGE_SOURCES = (
+    ("Construction Material Request Item", "material", False),
+    ("Stock Ledger Entry", "item_code", True),
+    ("Material Request Item", "item_code", True),
+    ("Purchase Order Item", "item_code", True),
+)
+
+
+def get_lookups():
+    """
+    Cached case-insensitive lookups of UOM and Item Group names
+
+    Returns:
+        Dict with `uom` and `item_group`, each a dict of lower-cased name -> name
+    """
+    def generator():
+        return {
+            "uom": {name.lower(): name for name in frappe.get_all("UOM", pluck="name")},
+            "item_group": {name.lower(): name for name in frappe.get_all("Item Group",
+                filters={"is_group": 0}, pluck="name")}
+        }
+
+    return frappe.cache().get_value(LOOKUP_KEY, generator=generator)
+
+
+def clear_lookups(doc=None, method=None):
+    """Drop the cached lookups when a UOM or Item Group changes"""
+    frappe.cache().delete_value(LOOKUP_KEY)
+
+
+def get_material_usage(materials):
+    """
+    Count the transactions referencing each material or its Item, in one grouped query
+
+    Args:
+        materials: List of Construction Material names
+
+    Returns:
+        Dict of material -> dict of doctype -> count, for materials with any usage
+    """
+    if not materials:
+        return {}
+
+    queries = []
+    for doctype, field, by_item in USAGE_SOURCES:
+        if by_item:
+            queries.append("""
+                SELECT cm.name as material, '{doctype}' as doctype, COUNT(*) as count
+                FROM `tabConstruction Material` cm
+                JOIN `tab{doctype}` ref ON ref.`{field}` = cm.item
+                WHERE cm.name IN %(materials)s
+                GROUP BY cm.name""".format(doctype=doctype, field=field))
+        else:
+            queries.append("""
+                SELECT ref.`{field}` as material, '{doctype}' as doctype, COUNT(*) as count
+                FROM `tab{doctype}` ref
+                WHERE ref.`{field}` IN %(materials)s
+                GROUP BY ref.`{field}`""".format(doctype=doctype, field=field))
+
+    usage = {}
+    for material, doctype, count in frappe.db.sql(" UNION ALL ".join(queries), {"materials": list(materials)}):
+        usage.setdefault(material, {})[doctype] = cint(count)
+
+    return usage
+
+
+def get_item_updates(material, item, has_stock=False):
+    """
+    Item fields that differ from a Construction Material
+
+    Args:
+        material: Dict with the Construction Material fields
+        item: Dict with the Item fields in ITEM_SYNC_FIELDS
+        has_stock: Whether the Item has stock ledger entries, which freezes STOCK_FROZEN_FIELDS
+
+    Returns:
+        Dict of Item field -> new value
+    """
+    updates = {}
+    for item_field, material_field in ITEM_SYNC_FIELDS.items():
+        value = material.get(material_field)
+        if item_field in ("disabled", "is_stock_item"):
+            changed = cint(item.get(item_field)) != cint(value)
+        else:
+            changed = (item.get(item_field) or "") != (value or "")
+
+        if changed and not (has_stock and item_field in STOCK_FROZEN_FIELDS):
+            updates[item_field] = value
+
+    return updates
+
+
+@frappe.whitelist()
+def import_construction_materials(materials=None, file_url=None, create_items=1):
+    """
+    Queue a bulk import of Construction Materials
+
+    Args:
+        materials: JSON list of dicts keyed by material_code and MATERIAL_FIELDS, plus an
+            optional item_group
+        file_url: URL of an uploaded CSV file with the same columns, used instead of `materials`
+        create_items: Create ERPNext Items for materials that are not linked to one
+
+    Returns:
+        Number of rows queued
+    """
+    frappe.has_permission("Construction Material", "create", throw=True)
+
+    if file_url:
+        materials = read_material_file(file_url)
+    else:
+        materials = frappe.parse_json(materials) if isinstance(materials, str) else materials
+    if not materials:
+        frappe.throw(_("No materials to import"))
+
+    frappe.enqueue(
+        "advanced_construction_erp.advanced_construction.material_master.run_material_import",
+        queue="long",
+        timeout=3600,
+        materials=materials,
+        create_items=cint(create_items),
+        user=frappe.session.user
+    )
+
+    return len(materials)
+
+
+def read_material_file(file_url):
+    """Read the rows of an uploaded CSV file as dicts keyed by the header row"""
+    content = frappe.get_doc("File", {"file_url": file_url}).get_content()
+    rows = read_csv_content(content)
+    if not rows:
+        return []
+
+    header = [frappe.scrub(column or "") for column in rows[0]]
+    return [dict(zip(header, row)) for row in rows[1:] if any(row)]
+
+
+def prepare_row(row, lookups):
+    """
+    Normalize an import row
+
+    Returns:
+        Tuple of (dict of material fields, with material_code and item_group, or None; error or None)
+    """
+    material = {"material_code": cstr(row.get("material_code")).strip()}
+    if not material["material_code"]:
+        return None, _("Material Code is missing")
+
+    for field in MATERIAL_FIELDS:
+        value = row.get(field)
+        if field in CHECK_FIELDS:
+            value = cint(value)
+        elif field in NUMBER_FIELDS:
+            value = cint(value) if field == "lead_time_days" else flt(value)
+        elif isinstance(value, str):
+            value = value.strip() or None
+        material[field] = value
+
+    if not material["material_name"]:
+        return None, _("Material Name is missing")
+    if not material["material_type"]:
+        return None, _("Material Type is missing")
+    if material["is_fixed_asset"] and not material["asset_category"]:
+        return None, _("Asset Category is required for Fixed Assets")
+
+    material["unit_of_measure"] = lookups["uom"].get((material["unit_of_measure"] or "").lower())
+    if not material["unit_of_measure"]:
+        return None, _("Unknown Unit of Measure {0}").format(row.get("unit_of_measure"))
+
+    item_group = cstr(row.get("item_group")).strip() or DEFAULT_ITEM_GROUP
+    material["item_group"] = lookups["item_group"].get(item_group.lower())
+    if not material["item_group"]:
+        return None, _("Unknown Item Group {0}").format(item_group)
+
+    return material, None
+
+
+def run_material_import(materials, create_items=True, user=None):
+    """
+    Create or update Construction Materials and their Items in chunks
+
+    Args:
+        materials: List of import row dicts
+        create_items: Create ERPNext Items for materials that are not linked to one
+        user: User the import runs for and progress is reported to
+
+    Returns:
+        Dict with created, updated, items_created, items_updated and errors (list of
+        (material_code, message))
+    """
+    user = user or frappe.session.user
+    lookups = get_lookups()
+    stats = {"created": 0, "updated": 0, "items_created": 0, "items_updated": 0, "errors": []}
+
+    rows = {}
+    for row in materials:
+        material, error = prepare_row(row, lookups)
+        if error:
+            stats["errors"].append((row.get("material_code"), error))
+        else:
+            # The last row for a code wins
+            rows[material["material_code"]] = material
+
+    rows = list(rows.values())
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk_stats = _import_chunk(rows[start:start + CHUNK_SIZE], create_items, user)
+        for key, value in chunk_stats.items():
+            stats[key] += value
+        frappe.db.commit()
+
+        done = min(start + CHUNK_SIZE, len(rows))
+        frappe.publish_progress(done * 100.0 / len(rows), title=_("Importing Construction Materials"),
+            description=_("{0} of {1} materials imported").format(done, len(rows)))
+
+    frappe.publish_realtime("msgprint", _("Construction Material import: {0} created, {1} updated, "
+        "{2} Items created, {3} Items updated, {4} rows skipped").format(stats["created"], stats["updated"],
+            stats["items_created"], stats["items_updated"], len(stats["errors"])), user=user)
+
+    frappe.logger("construction_project").info(
+        "Construction Material import: {0}, errors: {1}".format(
+            {key: value for key, value in stats.items() if key != "errors"}, stats["errors"][:20]))
+
+    return stats
+
+
+def _import_chunk(rows, create_items, user):
+    codes = [row["material_code"] for row in rows]
+    existing = {row.name: row for row in frappe.get_all("Construction Material",
+        filters={"name": ["in", codes]},
+        fields=["name"] + MATERIAL_FIELDS + ["item"]
+    )}
+
+    # Link to Items that already exist under the material code instead of duplicating them
+    existing_items = set(frappe.get_all("Item", filters={"name": ["in", codes]}, pluck="name"))
+    new_items = []
+    for row in rows:
+        current = existing.get(row["material_code"])
+        row["item"] = current.item if current and current.item else None
+        if not row["item"] and create_items:
+            row["item"] = row["material_code"]
+            if row["material_code"] not in existing_items:
+                new_items.append(row)
+
+    timestamp = now_datetime()
+    meta = (timestamp, timestamp, user, user, 0)
+
+    if new_items:
+        _insert_items(new_items, meta)
+
+    frappe.db.bulk_insert("Construction Material", MATERIAL_COLUMNS, [
+        (row["material_code"],) + meta + (row["material_code"],)
+        + tuple(row[field] for field in MATERIAL_FIELDS) + (row["item"],)
+        for row in rows
+        if row["material_code"] not in existing
+    ])
+
+    material_updates = {}
+    for row in rows:
+        current = existing.get(row["material_code"])
+        if not current:
+            continue
+        changes = {field: row[field] for field in MATERIAL_FIELDS + ["item"]
+            if current.get(field) != row[field] and not (field in NUMBER_FIELDS + CHECK_FIELDS
+                and flt(current.get(field)) == flt(row[field]))}
+        if changes:
+            material_updates[row["material_code"]] = changes
+    if material_updates:
+        frappe.db.bulk_update("Construction Material", material_updates)
+
+    created_items = {row["material_code"] for row in new_items}
+    item_updates = _get_item_updates([row for row in rows
+        if row["item"] and row["material_code"] not in created_items])
+    if item_updates:
+        frappe.db.bulk_update("Item", item_updates)
+
+    return {
+        "created": len(rows) - len(existing),
+        "updated": len(material_updates),
+        "items_created": len(new_items),
+        "items_updated": len(item_updates)
+    }
+
+
+def _insert_items(rows, meta):
+    company = frappe.defaults.get_global_default("company")
+
+    frappe.db.bulk_insert("Item", ITEM_COLUMNS, [
+        (row["material_code"],) + meta + (row["material_code"], row["material_name"], row["item_group"],
+            row["description"], row["unit_of_measure"], row["is_stock_item"], row["disabled"],
+            row["country_of_origin"])
+        for row in rows
+    ])
+
+    # Rows Item.validate would add: the stock UOM conversion and the company defaults
+    frappe.db.bulk_insert("UOM Conversion Detail", CHILD_COLUMNS + ["uom", "conversion_factor"], [
+        (frappe.generate_hash(length=10),) + meta + (row["material_code"], "uoms", "Item", 1,
+            row["unit_of_measure"], 1)
+        for row in rows
+    ])
+    if company:
+        frappe.db.bulk_insert("Item Default", CHILD_COLUMNS + ["company", "default_warehouse"], [
+            (frappe.generate_hash(length=10),) + meta + (row["material_code"], "item_defaults", "Item", 1,
+                company, row["default_warehouse"])
+            for row in rows
+        ])
+
+
+def _get_item_updates(rows):
+    if not rows:
+        return {}
+
+    items = {item.name: item for item in frappe.get_all("Item",
+        filters={"name": ["in", [row["item"] for row in rows]]},
+        fields=["name"] + list(ITEM_SYNC_FIELDS)
+    )}
+    usage = get_material_usage([row["material_code"] for row in rows
+        if row["item"] in items and items[row["item"]].stock_uom != row["unit_of_measure"]])
+
+    updates = {}
+    for row in rows:
+        item = items.get(row["item"])
+        if not item:
+            continue
+        changes = get_item_updates(row, item,
+            has_stock=bool(usage.get(row["material_code"], {}).get("Stock Ledger Entry")))
+        if changes:
+            updates[item.name] = changes
+
+    return updates
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Consolidation of approved Construction Material Requests into Material Requests.
+
+Instead of one ERPNext Material Request per construction request, a background
+job collects every approved, not yet ordered request line due in a date window,
+merges the lines by item, warehouse and schedule date, and raises the fewest
+Material Requests (at most MAX_LINES_PER_REQUEST lines each).
+
+Every source line is recorded in Material Request Consolidation Log against the
+merged line it went into, so each Material Request Item traces back to its
+construction_material_request_item rows. Budget commitments use the log to
+transfer reservations from the construction requests. Only one run works at a
+time, and cancelling a consolidated Material Request drops its log rows so its
+source lines can be consolidated again.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import getdate, nowdate, flt, now_datetime
+
+MAX_LINES_PER_REQUEST = 300
+
+# Database lock held for a whole run; runs commit per Material Request, so row locks would not do
+RUN_LOCK = "construction_material_request_consolidation"
+RUN_LOCK_TIMEOUT = 600
+
+LOG_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "consolidation", "material_request", "material_request_item", "construction_material_request",
+    "construction_material_request_item", "construction_project", "item_code", "warehouse",
+    "schedule_date", "qty", "amount"]
+
+
+@frappe.whitelist()
+def consolidate_material_requests(from_date=None, to_date=None):
+    """
+    Queue the consolidation of approved Construction Material Requests due in a window
+
+    Args:
+        from_date: Earliest schedule date (defaults to no lower bound)
+        to_date: Latest schedule date (defaults to today)
+
+    Returns:
+        The consolidation run id
+    """
+    frappe.has_permission("Material Request", "create", throw=True)
+
+    consolidation = "MRC-{0}".format(frappe.generate_hash(length=8))
+    frappe.enqueue(
+        "advanced_construction_erp.advanced_construction.material_request_consolidation.run_consolidation",
+        queue="long",
+        timeout=3600,
+        consolidation=consolidation,
+        from_date=from_date,
+        to_date=to_date or nowdate()
+    )
+
+    return consolidation
+
+
+def get_open_lines(from_date=None, to_date=None):
+    """
+    Approved Construction Material Request lines with an Item that are not consolidated yet
+
+    Returns:
+        List of dicts with the source line, its request, project, item, warehouse, schedule
+        date, quantity and estimated amount
+    """
+    conditions = ""
+    if from_date:
+        conditions += " AND IFNULL(cmri.schedule_date, cmr.required_by_date) >= %(from_date)s"
+    if to_date:
+        conditions += " AND IFNULL(cmri.schedule_date, cmr.required_by_date) <= %(to_date)s"
+
+    return frappe.db.sql("""
+        SELECT cmri.name as construction_material_request_item, cmr.name as construction_material_request,
+            cmr.construction_project, cmr.project, cmri.item as item_code, cmri.item_name, cmri.uom,
+            cmri.warehouse, IFNULL(cmri.schedule_date, cmr.required_by_date) as schedule_date,
+            cmri.quantity as qty, cmri.estimated_amount as amount, cmr.transaction_date
+        FROM `tabConstruction Material Request` cmr
+        JOIN `tabConstruction Material Request Item` cmri
+            ON cmri.parent = cmr.name AND cmri.parenttype = 'Construction Material Request'
+        WHERE cmr.docstatus = 1 AND cmr.approval_status = 'Approved' AND cmr.status = 'Approved'
+            AND IFNULL(cmri.item, '') != '' AND cmri.quantity > 0 {conditions}
+            AND NOT EXISTS (
+                SELECT 1 FROM `tabMaterial Request Consolidation Log` log
+                WHERE log.construction_material_request_item = cmri.name
+            )
+        ORDER BY schedule_date, cmri.item, cmri.warehouse
+    """.format(conditions=conditions), {"from_date": from_date, "to_date": to_date}, as_dict=1)
+
+
+def merge_lines(lines):
+    """
+    Merge source lines by item, warehouse and schedule date
+
+    Returns:
+        List of dicts with item_code, item_name, uom, warehouse, schedule_date, qty, project
+        (set only when every source shares it) and `sources`
+    """
+    merged = {}
+    for line in lines:
+        key = (line.item_code, line.warehouse, getdate(line.schedule_date))
+        row = merged.get(key)
+        if not row:
+            row = merged[key] = frappe._dict(item_code=line.item_code, item_name=line.item_name, uom=line.uom,
+                warehouse=line.warehouse, schedule_date=key[2], qty=0, project=line.project, sources=[])
+        row.qty += flt(line.qty)
+        if row.project != line.project:
+            row.project = None
+        row.sources.append(line)
+
+    return list(merged.values())
+
+
+def run_consolidation(consolidation, from_date=None, to_date=None):
+    """
+    Raise consolidated Material Requests for the open lines due in a window
+
+    Material Requests are still inserted and submitted as documents, because ERPNext updates
+    requested quantities and budgets on submit; the traceability log and the request statuses
+    are written in bulk.
+
+    Returns:
+        List of the Material Request names
+    """
+    # A run queued right behind another would read the same open lines
+    if not frappe.db.sql("SELECT GET_LOCK(%s, %s)", (RUN_LOCK, RUN_LOCK_TIMEOUT))[0][0]:
+        frappe.throw(_("Another Material Request consolidation is still running"))
+
+    try:
+        return _run_consolidation(consolidation, from_date, to_date)
+    finally:
+        frappe.db.sql("SELECT RELEASE_LOCK(%s)", RUN_LOCK)
+
+
+def _run_consolidation(consolidation, from_date=None, to_date=None):
+    # Start a new transaction so lines logged by the run that held the lock are visible
+    frappe.db.commit()
+    lines = merge_lines(get_open_lines(from_date, to_date))
+    if not lines:
+        return []
+
+    material_requests = []
+    chunks = range(0, len(lines), MAX_LINES_PER_REQUEST)
+    for count, start in enumerate(chunks, 1):
+        chunk = lines[start:start + MAX_LINES_PER_REQUEST]
+        material_requests.append(_make_material_request(consolidation, chunk))
+        frappe.db.commit()
+
+        frappe.publish_progress(count * 100.0 / len(chunks), title=_("Consolidating Material Requests"),
+            description=_("{0} of {1} Material Requests created").format(count, len(chunks)))
+
+    ordered = update_ordered_requests({source.construction_material_request
+        for line in lines for source in line.sources})
+    frappe.db.commit()
+
+    frappe.logger("construction_project").info(
+        "Material request consolidation {0}: {1} source lines into {2} lines on {3} Material Requests, "
+        "{4} construction requests ordered".format(consolidation, sum(len(line.sources) for line in lines),
+            len(lines), len(material_requests), len(ordered)))
+
+    return material_requests
+
+
+def _make_material_request(consolidation, lines):
+    mr = frappe.new_doc("Material Request")
+    mr.material_request_type = "Purchase"
+    mr.transaction_date = nowdate()
+    mr.schedule_date = min(line.schedule_date for line in lines)
+    projects = {line.project for line in lines}
+    if len(projects) == 1:
+        mr.project = projects.pop()
+
+    for line in lines:
+        sources = line.sources
+        mr.append("items", {
+            "item_code": line.item_code,
+            "item_name": line.item_name,
+            "qty": line.qty,
+            "uom": line.uom,
+            "warehouse": line.warehouse,
+            "schedule_date": line.schedule_date,
+            "project": line.project,
+            # Unambiguous only when the line has a single source; the log covers merged lines
+            "construction_material_request": sources[0].construction_material_request if len(sources) == 1 else None,
+            "construction_material_request_item": sources[0].construction_material_request_item if len(sources) == 1 else None
+        })
+
+    mr.insert(ignore_permissions=True)
+
+    # Written before submit so budget commitments can transfer the source reservations
+    timestamp = now_datetime()
+    frappe.db.bulk_insert("Material Request Consolidation Log", LOG_COLUMNS, [
+        (frappe.generate_hash(length=12), timestamp, timestamp, frappe.session.user, frappe.session.user, 0,
+            consolidation, mr.name, item.name, source.construction_material_request,
+            source.construction_material_request_item, source.construction_project, source.item_code,
+            source.warehouse, line.schedule_date, flt(source.qty), flt(source.amount))
+        for item, line in zip(mr.items, lines)
+        for source in line.sources
+    ])
+
+    mr.submit()
+    return mr.name
+
+
+def update_ordered_requests(construction_material_requests):
+    """
+    Mark construction requests whose Item lines are all consolidated as Ordered
+
+    Returns:
+        List of the requests updated
+    """
+    if not construction_material_requests:
+        return []
+
+    ordered = frappe.db.sql_list("""
+        SELECT cmri.parent
+        FROM `tabConstruction Material Request Item` cmri
+        LEFT JOIN `tabMaterial Request Consolidation Log` log
+            ON log.construction_material_request_item = cmri.name
+        WHERE cmri.parenttype = 'Construction Material Request' AND cmri.parent IN %(requests)s
+            AND IFNULL(cmri.item, '') != ''
+        GROUP BY cmri.parent
+        HAVING SUM(log.name IS NULL) = 0
+    """, {"requests": list(construction_material_requests)})
+
+    if ordered:
+        frappe.db.set_value("Construction Material Request", {"name": ["in", ordered]}, "status", "Ordered")
+
+    return ordered
+
+
+def release_consolidated_lines(doc, method=None):
+    """
+    Return the source lines of a cancelled Material Request to consolidation
+
+    Hooked on cancel of Material Request. The log rows are deleted and construction requests
+    marked Ordered by the consolidation go back to Approved.
+    """
+    requests = frappe.get_all("Material Request Consolidation Log",
+        filters={"material_request": doc.name}, distinct=True, pluck="construction_material_request")
+    if not requests:
+        return
+
+    frappe.db.delete("Material Request Consolidation Log", {"material_request": doc.name})
+    frappe.db.set_value("Construction Material Request",
+        {"name": ["in", requests], "status": "Ordered", "docstatus": 1}, "status", "Approved")
+
+
+def get_consolidated_sources(material_request):
+    """
+    Source lines consolidated into a Material Request
+
+    Returns:
+        List of dicts with material_request_item, construction_material_request,
+        construction_project, item_code and amount
+    """
+    return frappe.get_all("Material Request Consolidation Log",
+        filters={"material_request": material_request},
+        fields=["material_request_item", "construction_material_request", "construction_material_request_item",
+            "construction_project", "item_code", "qty", "amount"]
+    )
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Batch billing of contract milestones.
+
+The billing run reads every milestone that is completed or due, and not yet
+invoiced, across all live contracts with one query. It raises one Sales
+Invoice per client and currency for those milestones. Each milestone records
+its invoice in `sales_invoice`. The statuses of a chunk of clients are then
+set with one UPDATE and committed together with the invoices. Running it again
+only picks up milestones that still have no invoice, so a rerun after a
+failure never bills twice. Cancelling or deleting a Sales Invoice clears it
+from its milestones, so they are billed again.
+"""
+
+from __future__ import unicode_literals
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, add_days, nowdate
+
+BILLABLE_CONTRACT_STATUSES = ("Active", "Completed")
+INVOICE_ITEM = "Construction Service"
+PAYMENT_TERMS_DAYS = 30
+CHUNK_SIZE = 100
+
+
+def get_invoice_item(contract_number, milestone_name, amount):
+    """Sales Invoice Item billing one milestone"""
+    return {
+        "item_code": INVOICE_ITEM,
+        "qty": 1,
+        "rate": amount,
+        "amount": amount,
+        "description": _("Payment for milestone: {0}").format(milestone_name) + (
+            " ({0})".format(contract_number) if contract_number else "")
+    }
+
+
+def get_billable_milestones(as_of=None):
+    """
+    Milestones that are completed or due by `as_of` and have no invoice yet
+
+    Returns:
+        List of dicts with the milestone, its contract, client, currency, amount and the
+        ERPNext Project of the contract's Construction Project
+    """
+    return frappe.db.sql("""
+        SELECT cm.name, cm.parent as contract, cm.milestone_name, cm.payment_amount,
+            c.contract_number, c.client, c.currency, cp.project
+        FROM `tabContract Milestone` cm
+        JOIN `tabContract Management` c ON c.name = cm.parent
+        LEFT JOIN `tabConstruction Project` cp ON cp.name = c.project
+        WHERE cm.parenttype = 'Contract Management' AND c.docstatus < 2
+            AND c.status IN %(contract_statuses)s AND IFNULL(c.client, '') != ''
+            AND IFNULL(cm.sales_invoice, '') = '' AND IFNULL(cm.payment_status, 'Not Invoiced') = 'Not Invoiced'
+            AND cm.payment_amount > 0 AND IFNULL(cm.status, '') != 'Cancelled'
+            AND (cm.status = 'Completed' OR cm.due_date <= %(as_of)s)
+        ORDER BY c.client, c.currency, cm.due_date, cm.idx
+    """, {"contract_statuses": BILLABLE_CONTRACT_STATUSES, "as_of": getdate(as_of or nowdate())}, as_dict=1)
+
+
+def make_client_invoice(client, currency, milestones):
+    """
+    Insert one draft Sales Invoice for a client's milestones
+
+    Returns:
+        The Sales Invoice name
+    """
+    invoice = frappe.new_doc("Sales Invoice")
+    invoice.customer = client
+    if currency:
+        invoice.currency = currency
+    invoice.due_date = add_days(nowdate(), PAYMENT_TERMS_DAYS)
+
+    projects = {milestone.project for milestone in milestones}
+    if len(projects) == 1:
+        invoice.project = projects.pop()
+
+    # The same references a single-milestone invoice carries, where they are unambiguous
+    contracts = {milestone.contract for milestone in milestones}
+    if len(contracts) == 1:
+        invoice.construction_contract = contracts.pop()
+    if len(milestones) == 1:
+        invoice.contract_milestone = milestones[0].name
+
+    for milestone in milestones:
+        invoice.append("items", get_invoice_item(milestone.contract_number, milestone.milestone_name,
+            milestone.payment_amount))
+
+    invoice.insert(ignore_permissions=True)
+    return invoice.name
+
+
+def mark_invoiced(invoices):
+    """
+    Set the invoice and status of many milestones with one statement
+
+    Milestones invoiced since they were read are left untouched.
+
+    Args:
+        invoices: Dict of Contract Milestone name -> Sales Invoice name
+    """
+    if not invoices:
+        return
+
+    frappe.db.sql("""
+        UPDATE `tabContract Milestone`
+        SET sales_invoice = CASE name {cases} END, payment_status = 'Invoiced'
+        WHERE name IN %s AND IFNULL(sales_invoice, '') = ''
+    """.format(cases=" ".join(["WHEN %s THEN %s"] * len(invoices))),
+        [value for item in invoices.items() for value in item] + [tuple(invoices)])
+
+
+def release_invoiced_milestones(doc, method=None):
+    """
+    Return the milestones of a cancelled or deleted Sales Invoice to billing
+
+    Hooked on cancel and trash of Sales Invoice.
+    """
+    frappe.db.set_value("Contract Milestone", {"sales_invoice": doc.name},
+        {"sales_invoice": None, "payment_status": "Not Invoiced"})
+
+
+def run_milestone_billing(as_of=None, user=None):
+    """
+    Invoice every billable milestone, one Sales Invoice per client and currency
+
+    Sales Invoices are inserted as documents so ERPNext sets accounts, taxes and totals.
+
+    Args:
+        as_of: Bill milestones due by this date (defaults to today)
+        user: User to report the result to
+
+    Returns:
+        Dict with milestones, invoices, clients, errors (list of (client, message)), seconds and
+        milestones_per_second
+    """
+    started = time.time()
+    milestones = get_billable_milestones(as_of)
+
+    groups = {}
+    for milestone in milestones:
+        groups.setdefault((milestone.client, milestone.currency), []).append(milestone)
+
+    stats = {"milestones": 0, "invoices": 0, "clients": len({client for client, currency in groups}), "errors": []}
+    keys = list(groups)
+    for start in range(0, len(keys), CHUNK_SIZE):
+        invoices = {}
+        for client, currency in keys[start:start + CHUNK_SIZE]:
+            # A concurrent run may have billed some of them since they were read
+            unbilled = set(frappe.db.sql_list("""
+                SELECT name FROM `tabContract Milestone`
+                WHERE name IN %(names)s AND IFNULL(sales_invoice, '') = ''
+                FOR UPDATE
+            """, {"names": [milestone.name for milestone in groups[(client, currency)]]}))
+            group = [milestone for milestone in groups[(client, currency)] if milestone.name in unbilled]
+            if not group:
+                continue
+
+            frappe.db.savepoint("milestone_billing")
+            try:
+                invoice = make_client_invoice(client, currency, group)
+            except Exception:
+                frappe.db.rollback(save_point="milestone_billing")
+                stats["errors"].append((client, frappe.get_traceback()))
+                continue
+
+            stats["invoices"] += 1
+            for milestone in group:
+                invoices[milestone.name] = invoice
+
+        # Invoices and the statuses pointing at them commit together
+        mark_invoiced(invoices)
+        frappe.db.commit()
+        stats["milestones"] += len(invoices)
+
+    stats["seconds"] = round(time.time() - started, 2)
+    stats["milestones_per_second"] = round(stats["milestones"] / stats["seconds"], 1) if stats["seconds"] else 0
+
+    frappe.logger("construction_project").info(
+        "Milestone billing: {0} milestones on {1} invoices for {2} clients in {3}s ({4}/s), {5} clients failed".format(
+            stats["milestones"], stats["invoices"], stats["clients"], stats["seconds"],
+            stats["milestones_per_second"], len(stats["errors"])))
+
+    if user:
+        frappe.publish_realtime("msgprint", _("{0} milestones billed on {1} Sales Invoices in {2} seconds, "
+            "{3} clients failed").format(stats["milestones"], stats["invoices"], stats["seconds"],
+                len(stats["errors"])), user=user)
+
+    return stats
+
+
+@frappe.whitelist()
+def make_milestone_invoices(as_of=None):
+    """Queue a billing run for milestones due by `as_of`"""
+    frappe.has_permission("Sales Invoice", "create", throw=True)
+
+    frappe.enqueue(
+        "advanced_construction_erp.advanced_construction.milestone_billing.run_milestone_billing",
+        queue="long",
+        timeout=3600,
+        as_of=as_of,
+        user=frappe.session.user
+    )
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Keeps Non Conformance Report actions in step with their Tasks.
+
+Each corrective or preventive action gets a Task on submit; the action rows are
+linked back to their tasks in one bulk update. When a task changes status its
+actions are queued for the transaction and synced just before commit: the
+status of every linked task is read with a single join, changed actions are
+written in bulk and the status of the affected reports is moved forward with
+targeted updates, without loading or saving the reports.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import nowdate, getdate
+
+from advanced_construction_erp.utils import enqueue_before_commit
+
+ACTION_TABLES = (("corrective_actions", "Corrective"), ("preventive_actions", "Preventive"))
+
+
+def create_action_tasks(ncr):
+    """
+    Create a Task for every action of a Non Conformance Report that has none yet
+
+    Tasks are a nested set with their own validations, so each one is still inserted as a
+    document; the back-links to the actions are written together at the end.
+
+    Args:
+        ncr: The Non Conformance Report
+
+    Returns:
+        List of the created Task names
+    """
+    if not ncr.project:
+        return []
+
+    links = {}
+    priority = "High" if ncr.severity in ["High", "Critical"] else "Medium"
+
+    for table, action_type in ACTION_TABLES:
+        for action in ncr.get(table) or []:
+            if action.task:
+                continue
+
+            task = frappe.get_doc({
+                "doctype": "Task",
+                "subject": f"{action_type} Action: {action.action_description[:50]}",
+                "description": action.action_description,
+                "project": ncr.project,
+                "expected_start_date": nowdate(),
+                "expected_end_date": action.due_date,
+                "status": "Open",
+                "priority": priority,
+                "reference_type": "Non Conformance Report",
+                "reference_name": ncr.name
+            })
+            if action.assigned_to:
+                task._assign = action.assigned_to
+            task.insert()
+
+            action.task = task.name
+            links[action.name] = {"task": task.name}
+
+    if links:
+        frappe.db.bulk_update("Non Conformance Action", links, update_modified=False)
+        frappe.msgprint(_("{0} tasks created for the actions").format(len(links)))
+
+    return [values["task"] for values in links.values()]
+
+
+def queue_task_sync(tasks):
+    """Sync the actions linked to the given Tasks once, just before the transaction commits"""
+    enqueue_before_commit("non_conformance_task_sync", tasks, lambda tasks: sync_action_status(tasks=tasks))
+
+
+def sync_action_status(ncrs=None, tasks=None):
+    """
+    Complete actions whose Task is completed and advance the status of their reports
+
+    Args:
+        ncrs: Non Conformance Report names to sync
+        tasks: Alternatively, Task names whose actions should be synced
+
+    Returns:
+        Dict with the number of actions and reports updated
+    """
+    if ncrs:
+        condition, values = "a.parent IN %(names)s", {"names": list(ncrs)}
+    elif tasks:
+        condition, values = "a.task IN %(names)s", {"names": list(tasks)}
+    else:
+        return {"actions": 0, "reports": 0}
+
+    rows = frappe.db.sql("""
+        SELECT a.name, a.parent, a.status, t.status as task_status, t.completed_on
+        FROM `tabNon Conformance Action` a
+        JOIN `tabTask` t ON t.name = a.task
+        WHERE a.parenttype = 'Non Conformance Report' AND {condition}
+    """.format(condition=condition), values, as_dict=1)
+
+    updates = {
+        row.name: {"status": "Completed", "completion_date": row.completed_on or getdate(nowdate())}
+        for row in rows
+        if row.task_status == "Completed" and row.status != "Completed"
+    }
+    if not updates:
+        return {"actions": 0, "reports": 0}
+
+    frappe.db.bulk_update("Non Conformance Action", updates, update_modified=False)
+
+    parents = list({row.parent for row in rows if row.name in updates})
+    return {"actions": len(updates), "reports": update_report_status(parents)}
+
+
+def update_report_status(ncrs):
+    """
+    Move reports whose corrective actions are all completed to 'Corrective Action Completed'
+
+    Mirrors the action-driven part of NonConformanceReport.update_status.
+
+    Returns:
+        Number of reports updated
+    """
+    completed = frappe.db.sql_list("""
+        SELECT ncr.name
+        FROM `tabNon Conformance Report` ncr
+        JOIN `tabNon Conformance Action` a
+            ON a.parent = ncr.name AND a.parenttype = 'Non Conformance Report' AND a.parentfield = 'corrective_actions'
+        WHERE ncr.name IN %(ncrs)s AND ncr.status = 'Action Plan Created'
+        GROUP BY ncr.name
+        HAVING SUM(a.status != 'Completed') = 0
+    """, {"ncrs": ncrs})
+
+    if completed:
+        frappe.db.set_value("Non Conformance Report", {"name": ["in", completed]},
+            "status", "Corrective Action Completed")
+
+    return len(completed)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Coalesced progress recomputation for Construction Projects.
+
+Task events only mark their project as dirty. Dirty projects are recomputed
+once per transaction (just before commit) from an aggregate query over their
+tasks, instead of loading and saving the whole project for every task change.
+
+Set `defer_project_progress_recompute` in site config to push the work out of
+the request entirely: dirty projects are then collected in Redis and flushed by
+the scheduler, coalescing updates over a short window.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt
+
+from advanced_construction_erp.utils import enqueue_before_commit
+from advanced_construction_erp.advanced_construction.project_status_summary import refresh_project_summaries
+
+DIRTY_PROJECTS_KEY = "construction_project_progress_dirty"
+METRICS_KEY = "construction_project_progress_metrics"
+METRICS = ("marked", "recomputed", "flushes")
+
+
+def mark_project_dirty(project):
+    """
+    Schedule a progress recompute for a Construction Project
+
+    Args:
+        project: The name of the Construction Project
+    """
+    if not project:
+        return
+
+    _increment_metric("marked")
+
+    if cint(frappe.conf.get("defer_project_progress_recompute")):
+        # Only publish the mark once the task change is visible to the flushing job
+        frappe.db.after_commit.add(lambda: frappe.cache().sadd(DIRTY_PROJECTS_KEY, project))
+    else:
+        enqueue_before_commit("construction_project_progress", [project], recompute_project_progress)
+
+
+def flush_dirty_projects(batch_size=500):
+    """Scheduled job that recomputes every project marked dirty since the last run"""
+    projects = [frappe.safe_decode(project) for project in frappe.cache().smembers(DIRTY_PROJECTS_KEY)]
+    if not projects:
+        return
+
+    # Unmark before recomputing so marks arriving meanwhile are kept for the next run
+    frappe.cache().srem(DIRTY_PROJECTS_KEY, *projects)
+
+    for start in range(0, len(projects), batch_size):
+        recompute_project_progress(projects[start:start + batch_size])
+        frappe.db.commit()
+
+
+def recompute_project_progress(projects):
+    """
+    Recompute progress for several Construction Projects with one aggregate query
+
+    Args:
+        projects: Iterable of Construction Project names
+
+    Returns:
+        Dict of project name -> progress
+    """
+    projects = list(set(projects))
+    if not projects:
+        return {}
+
+    counts = frappe.db.sql("""
+        SELECT
+            parent,
+            COUNT(*) AS total_tasks,
+            SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) AS completed_tasks
+        FROM `tabConstruction Project Task`
+        WHERE parenttype = 'Construction Project' AND parent IN %(projects)s
+        GROUP BY parent
+    """, {"projects": projects}, as_dict=1)
+
+    progress = {project: 0 for project in projects}
+    for row in counts:
+        if row.total_tasks:
+            progress[row.parent] = flt(row.completed_tasks) / flt(row.total_tasks) * 100
+
+    # Projects removed in the same transaction are skipped by the UPDATE itself
+    frappe.db.bulk_update("Construction Project", {
+        project: {"progress": value} for project, value in progress.items()
+    }, update_modified=False)
+    refresh_project_summaries(projects)
+
+    _increment_metric("recomputed", len(projects))
+    _increment_metric("flushes")
+
+    return progress
+
+
+@frappe.whitelist()
+def get_progress_recompute_metrics():
+    """
+    Get counters showing how much progress work was coalesced
+
+    Returns:
+        Dict with marked task events, recomputed projects, flushes and the number of saved recomputes
+    """
+    frappe.only_for("System Manager")
+
+    cache = frappe.cache()
+    metrics = {metric: cint(cache.get(cache.make_key("{0}:{1}".format(METRICS_KEY, metric)))) for metric in METRICS}
+    metrics["coalesced"] = max(metrics["marked"] - metrics["recomputed"], 0)
+    metrics["pending"] = len(cache.smembers(DIRTY_PROJECTS_KEY) or [])
+
+    return metrics
+
+
+def _increment_metric(metric, amount=1):
+    cache = frappe.cache()
+    cache.incrby(cache.make_key("{0}:{1}".format(METRICS_KEY, metric)), amount)
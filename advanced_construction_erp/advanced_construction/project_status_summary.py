@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Pre-aggregated Construction Project status figures.
+
+Construction Project Status Summary holds one row per status, construction
+type, project manager and start month with project counts and cost totals. It
+backs the summary mode of the Construction Project Status report, so portfolio
+views never scan the project table.
+
+Saving or deleting a project queues the groups it left and joined; they are
+recomputed once, just before the transaction commits. Writers that update
+progress, costs or budgets without saving the project queue the groups of the
+projects they touched. Bulk status changes made by the daily status job
+rebuild the whole table with a single aggregate query.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+
+import frappe
+from frappe.utils import getdate, add_months, flt, now_datetime
+
+from advanced_construction_erp.utils import enqueue_before_commit
+
+SUMMARY_COLUMNS = ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "status", "construction_type", "project_manager", "start_month",
+    "project_count", "total_budget", "actual_cost", "total_progress"]
+
+
+def get_summary_key(project):
+    """Return the (status, construction_type, project_manager, start_month) group of a project"""
+    start_date = project.get("expected_start_date")
+    return (project.get("status"), project.get("construction_type"), project.get("project_manager"),
+        getdate(start_date).strftime("%Y-%m") if start_date else None)
+
+
+def get_summary_name(key):
+    """Deterministic name of the summary row of a group"""
+    return hashlib.md5("\n".join(value or "" for value in key).encode("utf-8")).hexdigest()
+
+
+def queue_status_summary_refresh(doc, method=None):
+    """Recompute the summary groups a Construction Project left and joined, before commit"""
+    keys = [get_summary_key(doc)]
+    before = doc.get_doc_before_save()
+    if before:
+        keys.append(get_summary_key(before))
+
+    enqueue_before_commit("construction_project_status_summary", keys, refresh_status_summary)
+
+
+def queue_project_summary_refresh(projects):
+    """Recompute the summary groups of Construction Projects updated without a save, before commit"""
+    enqueue_before_commit("construction_project_status_summary_projects", projects, refresh_project_summaries)
+
+
+def refresh_project_summaries(projects):
+    """
+    Recompute the current summary groups of the given Construction Projects
+
+    Args:
+        projects: Iterable of Construction Project names
+    """
+    projects = list(set(projects))
+    if not projects:
+        return
+
+    refresh_status_summary([get_summary_key(row) for row in frappe.get_all("Construction Project",
+        filters={"name": ["in", projects]},
+        fields=["status", "construction_type", "project_manager", "expected_start_date"]
+    )])
+
+
+def refresh_status_summary(keys):
+    """
+    Recompute the given summary groups
+
+    Args:
+        keys: Iterable of (status, construction_type, project_manager, start_month) tuples
+    """
+    timestamp = now_datetime()
+    values = []
+    names = []
+
+    for key in set(keys):
+        status, construction_type, project_manager, start_month = key
+        if start_month:
+            month_start = getdate(start_month + "-01")
+            date_condition = "expected_start_date >= %(from_date)s AND expected_start_date < %(to_date)s"
+            params = {"from_date": month_start, "to_date": add_months(month_start, 1)}
+        else:
+            date_condition = "expected_start_date IS NULL"
+            params = {}
+
+        params.update({"status": status, "construction_type": construction_type, "project_manager": project_manager})
+
+        # <=> matches NULL groups and can still use the indexes
+        row = frappe.db.sql("""
+            SELECT COUNT(*), SUM(total_budget), SUM(actual_cost), SUM(progress)
+            FROM `tabConstruction Project`
+            WHERE status <=> %(status)s AND construction_type <=> %(construction_type)s
+                AND project_manager <=> %(project_manager)s AND {date_condition}
+        """.format(date_condition=date_condition), params)[0]
+
+        name = get_summary_name(key)
+        names.append(name)
+        if row[0]:
+            values.append((name, timestamp, timestamp, "Administrator", "Administrator", 0)
+                + key + (row[0], flt(row[1]), flt(row[2]), flt(row[3])))
+
+    if names:
+        frappe.db.delete("Construction Project Status Summary", {"name": ["in", names]})
+    frappe.db.bulk_insert("Construction Project Status Summary", SUMMARY_COLUMNS, values)
+
+
+def rebuild_status_summary():
+    """Rebuild the whole summary table with one aggregate query"""
+    timestamp = now_datetime()
+    rows = frappe.db.sql("""
+        SELECT status, construction_type, project_manager, DATE_FORMAT(expected_start_date, %(month_format)s),
+            COUNT(*), SUM(total_budget), SUM(actual_cost), SUM(progress)
+        FROM `tabConstruction Project`
+        GROUP BY status, construction_type, project_manager, DATE_FORMAT(expected_start_date, %(month_format)s)
+    """, {"month_format": "%Y-%m"})
+
+    frappe.db.delete("Construction Project Status Summary")
+    frappe.db.bulk_insert("Construction Project Status Summary", SUMMARY_COLUMNS, [
+        (get_summary_name(row[:4]), timestamp, timestamp, "Administrator", "Administrator", 0)
+            + tuple(row[:4]) + (row[4], flt(row[5]), flt(row[6]), flt(row[7]))
+        for row in rows
+    ])
+
+
+@frappe.whitelist()
+def rebuild_project_status_summary():
+    """Rebuild the status summary on demand"""
+    frappe.only_for("System Manager")
+    rebuild_status_summary()
@@ -33,6 +33,27 @@ frappe.query_reports["Construction Project Status"] = {
             "label": __("Project Manager"),
             "fieldtype": "Link",
             "options": "User"
+        },
+        {
+            "fieldname": "summary_mode",
+            "label": __("Summary"),
+            "fieldtype": "Check",
+            "default": 0
+        },
+        {
+            "fieldname": "page_length",
+            "label": __("Rows per Page"),
+            "fieldtype": "Select",
+            "options": "100\n500\n1000",
+            "default": "500",
+            "depends_on": "eval:!doc.summary_mode"
+        },
+        {
+            "fieldname": "page",
+            "label": __("Page"),
+            "fieldtype": "Int",
+            "default": 1,
+            "depends_on": "eval:!doc.summary_mode"
         }
     ],
 
@@ -65,6 +86,20 @@ frappe.query_reports["Construction Project Status"] = {
     },
 
     "onload": function(report) {
+        report.page.add_inner_button(__("Previous Page"), function() {
+            var page = cint(report.get_filter_value("page")) || 1;
+            if (page > 1) {
+                report.set_filter_value("page", page - 1);
+            }
+        });
+
+        report.page.add_inner_button(__("Next Page"), function() {
+            var page = cint(report.get_filter_value("page")) || 1;
+            if ((report.data || []).length >= cint(report.get_filter_value("page_length"))) {
+                report.set_filter_value("page", page + 1);
+            }
+        });
+
         report.page.add_inner_button(__("Export to Excel"), function() {
             var filters = report.get_values();
             window.location.href = `/api/method/construction_project.construction_project.report.construction_project_status.construction_project_status.export_to_excel?filters=${JSON.stringify(filters)}`;
@@ -1,16 +1,21 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import getdate, flt
+from frappe.utils import getdate, flt, cint
+
+DEFAULT_PAGE_LENGTH = 500
 
 def execute(filters=None):
     if not filters:
         filters = {}
 
+    if cint(filters.get("summary_mode")):
+        return get_summary_columns(), get_summary_data(filters)
+
     columns = get_columns()
-    data = get_data(filters)
+    data, message = get_data(filters)
 
-    return columns, data
+    return columns, data, message
 
 def get_columns():
     return [
@@ -80,7 +85,13 @@ def get_columns():
 
 def get_data(filters):
     conditions = get_conditions(filters)
-    
+    page_length = cint(filters.get("page_length")) or DEFAULT_PAGE_LENGTH
+    page = max(cint(filters.get("page")), 1)
+
+    values = dict(filters, limit=page_length, offset=(page - 1) * page_length)
+
+    # Only the requested page is read; the composite indexes on status / type / manager
+    # with expected_start_date serve both the filters and the ordering
     data = frappe.db.sql("""
         SELECT 
             cp.project,
@@ -98,11 +109,142 @@ def get_data(filters):
         WHERE 
             {conditions}
         ORDER BY 
-            cp.expected_start_date DESC
-    """.format(conditions=conditions), filters, as_dict=1)
+            cp.expected_start_date DESC, cp.name DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+    """.format(conditions=conditions), values, as_dict=1)
+
+    total = frappe.db.sql("""
+        SELECT COUNT(*) FROM `tabConstruction Project` cp WHERE {conditions}
+    """.format(conditions=conditions), values)[0][0]
+
+    message = _("Showing projects {0} to {1} of {2}").format(
+        values["offset"] + 1 if data else 0, values["offset"] + len(data), total)
+
+    return data, message
+
+def get_summary_columns():
+    return [
+        {
+            "label": _("Status"),
+            "fieldname": "status",
+            "fieldtype": "Data",
+            "width": 100
+        },
+        {
+            "label": _("Construction Type"),
+            "fieldname": "construction_type",
+            "fieldtype": "Data",
+            "width": 120
+        },
+        {
+            "label": _("Project Manager"),
+            "fieldname": "project_manager",
+            "fieldtype": "Link",
+            "options": "User",
+            "width": 120
+        },
+        {
+            "label": _("Projects"),
+            "fieldname": "project_count",
+            "fieldtype": "Int",
+            "width": 80
+        },
+        {
+            "label": _("Average Progress"),
+            "fieldname": "progress",
+            "fieldtype": "Percent",
+            "width": 100
+        },
+        {
+            "label": _("Total Budget"),
+            "fieldname": "total_budget",
+            "fieldtype": "Currency",
+            "width": 120
+        },
+        {
+            "label": _("Actual Cost"),
+            "fieldname": "actual_cost",
+            "fieldtype": "Currency",
+            "width": 120
+        },
+        {
+            "label": _("Cost Variance"),
+            "fieldname": "cost_variance",
+            "fieldtype": "Currency",
+            "width": 120
+        }
+    ]
+
+def get_summary_data(filters):
+    """
+    Portfolio totals per status, construction type and project manager
+
+    Summary rows are kept per start month, so they only answer filters on status, type,
+    manager and a from date on the first of a month. Any other filter is aggregated from the
+    projects with the same conditions as the detail mode.
+    """
+    from_date = filters.get("from_date")
+    if filters.get("project") or filters.get("to_date") or (from_date and getdate(from_date).day != 1):
+        data = frappe.db.sql("""
+            SELECT 
+                cp.status,
+                cp.construction_type,
+                cp.project_manager,
+                COUNT(*) as project_count,
+                SUM(cp.progress) as total_progress,
+                SUM(cp.total_budget) as total_budget,
+                SUM(cp.actual_cost) as actual_cost
+            FROM 
+                `tabConstruction Project` cp
+            WHERE 
+                {conditions}
+            GROUP BY 
+                cp.status, cp.construction_type, cp.project_manager
+            ORDER BY 
+                cp.status, cp.construction_type, cp.project_manager
+        """.format(conditions=get_conditions(filters)), filters, as_dict=1)
+    else:
+        data = get_summary_rows(filters)
+
+    for row in data:
+        row.progress = flt(row.pop("total_progress")) / row.project_count if row.project_count else 0
+        row.cost_variance = flt(row.total_budget) - flt(row.actual_cost)
 
     return data
 
+def get_summary_rows(filters):
+    """Read the pre-aggregated Construction Project Status Summary"""
+    conditions = "1=1"
+    values = {}
+
+    for field in ("construction_type", "status", "project_manager"):
+        if filters.get(field):
+            conditions += " AND {0} = %({0})s".format(field)
+            values[field] = filters.get(field)
+
+    if filters.get("from_date"):
+        conditions += " AND start_month >= %(from_month)s"
+        values["from_month"] = getdate(filters.get("from_date")).strftime("%Y-%m")
+
+    return frappe.db.sql("""
+        SELECT 
+            status,
+            construction_type,
+            project_manager,
+            SUM(project_count) as project_count,
+            SUM(total_progress) as total_progress,
+            SUM(total_budget) as total_budget,
+            SUM(actual_cost) as actual_cost
+        FROM 
+            `tabConstruction Project Status Summary`
+        WHERE 
+            {conditions}
+        GROUP BY 
+            status, construction_type, project_manager
+        ORDER BY 
+            status, construction_type, project_manager
+    """.format(conditions=conditions), values, as_dict=1)
+
 def get_conditions(filters):
     conditions = "1=1"
     
@@ -3,21 +3,40 @@
 # For license information, please see license.txt
 
 from __future__ import unicode_literals
+import hashlib
+import json
+
 import frappe
 from frappe import _
 from frappe.utils import getdate, flt
 
+# Report results per filter set; dropped whenever an inspection is submitted or cancelled
+CACHE_KEY = "quality_inspection_summary"
+FILTER_FIELDS = ("from_date", "to_date", "project", "inspection_type", "status")
+
 def execute(filters=None):
     if not filters:
         filters = {}
         
     columns = get_columns()
-    data = get_data(filters)
+    data = get_cached_data(filters)
     
     chart_data = get_chart_data(data)
     
     return columns, data, None, chart_data
 
+def get_cached_data(filters):
+    """Get report data from the cache, computing it on a miss"""
+    key = hashlib.md5(json.dumps(
+        {field: str(filters.get(field) or "") for field in FILTER_FIELDS}, sort_keys=True
+    ).encode("utf-8")).hexdigest()
+
+    return frappe.cache().hget(CACHE_KEY, key, generator=lambda: get_data(filters))
+
+def clear_cache(doc=None, method=None):
+    """Drop every cached result of the report"""
+    frappe.cache().delete_value(CACHE_KEY)
+
 def get_columns():
     """Return columns for the report"""
     return [
@@ -91,108 +110,44 @@ def get_data(filters):
     
     conditions_str = " AND ".join(conditions) if conditions else "1=1"
     
-    # Get all inspections grouped by project and type
-    inspections = frappe.db.sql("""
+    # One pass over the precomputed inspection facts (one row per submitted inspection).
+    # ROLLUP adds the project totals (inspection_type NULL) and a grand total (project NULL);
+    # real NULLs are grouped as '' to tell them apart.
+    rows = frappe.db.sql("""
         SELECT 
-            qi.project,
-            qi.inspection_type,
+            IFNULL(qi.project, '') as project,
+            IFNULL(qi.inspection_type, '') as inspection_type,
             COUNT(qi.name) as total_inspections,
             SUM(CASE WHEN qi.status = 'Approved' THEN 1 ELSE 0 END) as approved,
             SUM(CASE WHEN qi.status = 'Rejected' THEN 1 ELSE 0 END) as rejected,
             AVG(qi.quality_score) as avg_quality_score,
-            SUM(qi.failed_checks) as total_failures
-        FROM 
-            `tabQuality Inspection` qi
-        WHERE 
-            qi.docstatus = 1 AND {0}
-        GROUP BY 
-            qi.project, qi.inspection_type
-        ORDER BY 
-            qi.project, qi.inspection_type
-    """.format(conditions_str), filters, as_dict=1)
-    
-    # Get critical failures
-    critical_failures = {}
-    critical_data = frappe.db.sql("""
-        SELECT 
-            qi.project,
-            qi.inspection_type,
-            COUNT(qii.name) as critical_failures
+            SUM(qi.critical_failures) as critical_failures
         FROM 
-            `tabQuality Inspection` qi
-        JOIN 
-            `tabQuality Inspection Item` qii ON qii.parent = qi.name
+            `tabQuality Inspection Fact` qi
         WHERE 
-            qi.docstatus = 1 AND 
-            qii.status = 'Fail' AND 
-            qii.is_critical = 1 AND
             {0}
         GROUP BY 
-            qi.project, qi.inspection_type
+            IFNULL(qi.project, ''), IFNULL(qi.inspection_type, '') WITH ROLLUP
     """.format(conditions_str), filters, as_dict=1)
     
-    # Create lookup for critical failures
-    for row in critical_data:
-        key = f"{row.project}_{row.inspection_type}"
-        critical_failures[key] = row.critical_failures
-    
-    # Process data
-    for insp in inspections:
-        key = f"{insp.project}_{insp.inspection_type}"
-        
-        # Calculate approval rate
-        total_completed = insp.approved + insp.rejected
-        approval_rate = (insp.approved / total_completed * 100) if total_completed > 0 else 0
-        
-        row = {
-            "project": insp.project,
-            "inspection_type": insp.inspection_type,
-            "total_inspections": insp.total_inspections,
-            "approved": insp.approved,
-            "rejected": insp.rejected,
-            "approval_rate": approval_rate,
-            "avg_quality_score": insp.avg_quality_score,
-            "critical_failures": critical_failures.get(key, 0)
-        }
-        
-        data.append(row)
-    
-    # Add summary row for each project
-    projects = {}
-    for row in data:
-        if row["project"] not in projects:
-            projects[row["project"]] = {
-                "total_inspections": 0,
-                "approved": 0,
-                "rejected": 0,
-                "quality_score_sum": 0,
-                "quality_score_count": 0,
-                "critical_failures": 0
-            }
+    for row in rows:
+        # Skip the grand total
+        if row.project is None:
+            continue
         
-        projects[row["project"]]["total_inspections"] += row["total_inspections"]
-        projects[row["project"]]["approved"] += row["approved"]
-        projects[row["project"]]["rejected"] += row["rejected"]
-        projects[row["project"]]["quality_score_sum"] += row["avg_quality_score"] * row["total_inspections"]
-        projects[row["project"]]["quality_score_count"] += row["total_inspections"]
-        projects[row["project"]]["critical_failures"] += row["critical_failures"]
-    
-    # Add project summary rows
-    for project, values in projects.items():
-        total_completed = values["approved"] + values["rejected"]
-        approval_rate = (values["approved"] / total_completed * 100) if total_completed > 0 else 0
-        avg_quality_score = (values["quality_score_sum"] / values["quality_score_count"]) if values["quality_score_count"] > 0 else 0
+        total_completed = flt(row.approved) + flt(row.rejected)
+        is_group = row.inspection_type is None
         
         data.append({
-            "project": project,
-            "inspection_type": "<b>Project Total</b>",
-            "total_inspections": values["total_inspections"],
-            "approved": values["approved"],
-            "rejected": values["rejected"],
-            "approval_rate": approval_rate,
-            "avg_quality_score": avg_quality_score,
-            "critical_failures": values["critical_failures"],
-            "is_group": 1
+            "project": row.project or None,
+            "inspection_type": "<b>Project Total</b>" if is_group else row.inspection_type or None,
+            "total_inspections": row.total_inspections,
+            "approved": flt(row.approved),
+            "rejected": flt(row.rejected),
+            "approval_rate": (flt(row.approved) / total_completed * 100) if total_completed > 0 else 0,
+            "avg_quality_score": flt(row.avg_quality_score),
+            "critical_failures": flt(row.critical_failures),
+            "is_group": 1 if is_group else 0
         })
     
     return data
@@ -202,21 +157,12 @@ def get_chart_data(data):
     if not data:
         return None
     
-    # Group data by project for chart
-    projects = {}
-    for row in data:
-        # Skip summary rows
-        if row.get("is_group"):
-            continue
-            
-        if row["project"] not in projects:
-            projects[row["project"]] = {
-                "approved": 0,
-                "rejected": 0
-            }
-        
-        projects[row["project"]]["approved"] += row["approved"]
-        projects[row["project"]]["rejected"] += row["rejected"]
+    # The project total rows already hold the per-project figures
+    projects = {
+        row["project"]: row
+        for row in data
+        if row.get("is_group")
+    }
     
     # Prepare chart data
     labels = list(projects.keys())
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Your Company and contributors
+# For license information, please see license.txt
+
+"""
+Resource-constrained scheduling for Construction Project Tasks.
+
+Tasks are placed one at a time in priority order (serial schedule generation),
+each at the earliest day where its dependencies are finished and every resource
+it consumes stays within its daily capacity. Tasks of several projects can be
+levelled together so that shared crews and equipment are not double booked.
+"""
+
+from __future__ import unicode_literals
+import heapq
+import random
+import time
+from collections import defaultdict
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, cint, flt, nowdate
+
+PRIORITY_RANK = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
+
+# Tasks already running keep their dates but still occupy resources
+FIXED_STATUSES = ("In Progress",)
+
+# Tasks that no longer consume resources
+SKIPPED_STATUSES = ("Completed", "Cancelled")
+
+
+def resource_key(resource_type, resource_name):
+    """Return the key used to identify a resource in requirements and capacities"""
+    return "{0}::{1}".format(resource_type, resource_name)
+
+
+def level_resources(tasks, requirements, capacities, start_date=None):
+    """
+    Level daily resource usage against capacities
+
+    Args:
+        tasks: List of dicts with name, start_date, end_date, duration, depends_on, priority and status
+        requirements: Dict of task name -> {resource key: units used per day}
+        capacities: Dict of resource key -> units available per day. Resources without
+            a capacity are treated as unconstrained
+        start_date: No task is moved before this date (defaults to today)
+
+    Returns:
+        Dict with `schedule` (task name -> start_date, end_date, shift_days) and `conflicts`
+    """
+    floor = getdate(start_date or nowdate()).toordinal()
+    conflicts = []
+
+    active = {task["name"]: task for task in tasks if task.get("status") not in SKIPPED_STATUSES}
+
+    planned_start = {}
+    duration = {}
+    predecessors = {}
+    successors = defaultdict(list)
+
+    for name, task in active.items():
+        start = getdate(task["start_date"]).toordinal() if task.get("start_date") else floor
+        days = cint(task.get("duration"))
+        if not days and task.get("start_date") and task.get("end_date"):
+            days = getdate(task["end_date"]).toordinal() - start + 1
+
+        planned_start[name] = start
+        duration[name] = max(days, 1)
+
+        # Dependencies on finished tasks no longer constrain the schedule
+        preds = [dep.strip() for dep in (task.get("depends_on") or "").split(",") if dep.strip() in active]
+        predecessors[name] = preds
+        for pred in preds:
+            successors[pred].append(name)
+
+    order = _topological_order(active, predecessors, successors)
+    if len(order) < len(active):
+        for name in set(active) - set(order):
+            conflicts.append({"task": name, "reason": _("Circular dependency")})
+
+    # Longest remaining path through the network, used to break priority ties
+    tail = {}
+    for name in reversed(order):
+        tail[name] = duration[name] + max((tail[succ] for succ in successors[name] if succ in tail), default=0)
+
+    demand = {}
+    for name in order:
+        task_demand = []
+        for key, qty in (requirements.get(name) or {}).items():
+            qty = flt(qty)
+            if qty <= 0 or key not in capacities:
+                continue
+            if qty > flt(capacities[key]):
+                conflicts.append({
+                    "task": name,
+                    "resource": key,
+                    "reason": _("Requires {0} per day but capacity is {1}").format(qty, capacities[key])
+                })
+                continue
+            task_demand.append((key, qty))
+        demand[name] = task_demand
+
+    usage = defaultdict(lambda: defaultdict(float))
+    finish = {}
+
+    # Running tasks are pinned to their current dates
+    for name in order:
+        if active[name].get("status") in FIXED_STATUSES:
+            _reserve(usage, demand[name], planned_start[name], duration[name])
+            finish[name] = planned_start[name] + duration[name] - 1
+
+    remaining = {name: len([p for p in predecessors[name] if p not in finish]) for name in order if name not in finish}
+    ready = []
+    for name, count in remaining.items():
+        if not count:
+            heapq.heappush(ready, _priority_key(active[name], tail[name], planned_start[name], name))
+
+    schedule = {}
+    while ready:
+        name = heapq.heappop(ready)[-1]
+
+        earliest = max(planned_start[name], floor)
+        for pred in predecessors[name]:
+            earliest = max(earliest, finish[pred] + 1)
+
+        start = _find_start(earliest, duration[name], demand[name], usage, capacities)
+        _reserve(usage, demand[name], start, duration[name])
+        finish[name] = start + duration[name] - 1
+
+        schedule[name] = {
+            "start_date": getdate(_from_ordinal(start)),
+            "end_date": getdate(_from_ordinal(finish[name])),
+            "shift_days": start - planned_start[name]
+        }
+
+        for succ in successors[name]:
+            if succ not in remaining:
+                continue
+            remaining[succ] -= 1
+            if not remaining[succ]:
+                heapq.heappush(ready, _priority_key(active[succ], tail[succ], planned_start[succ], succ))
+
+    return {"schedule": schedule, "conflicts": conflicts}
+
+
+def _topological_order(active, predecessors, successors):
+    """Kahn's algorithm; tasks caught in a cycle are left out"""
+    indegree = {name: len(predecessors[name]) for name in active}
+    queue = [name for name, count in indegree.items() if not count]
+    order = []
+
+    while queue:
+        name = queue.pop()
+        order.append(name)
+        for succ in successors[name]:
+            indegree[succ] -= 1
+            if not indegree[succ]:
+                queue.append(succ)
+
+    return order
+
+
+def _priority_key(task, tail, planned_start, name):
+    """Higher priority first, then the longest remaining path, then the earliest planned start"""
+    rank = PRIORITY_RANK.get(task.get("priority"), PRIORITY_RANK["Medium"])
+    critical = 0 if cint(task.get("is_critical_path")) else 1
+    return (rank, critical, -tail, planned_start, name)
+
+
+def _find_start(earliest, duration, demand, usage, capacities):
+    """Return the first day from `earliest` on which the task fits within all capacities"""
+    start = earliest
+    while True:
+        moved = False
+        for key, qty in demand:
+            used = usage[key]
+            capacity = flt(capacities[key])
+            # Scan the window backwards so a conflict skips past the latest blocked day
+            for day in range(start + duration - 1, start - 1, -1):
+                if used.get(day, 0) + qty > capacity + 1e-9:
+                    start = day + 1
+                    moved = True
+                    break
+            if moved:
+                break
+
+        if not moved:
+            return start
+
+
+def _reserve(usage, demand, start, duration):
+    for key, qty in demand:
+        used = usage[key]
+        for day in range(start, start + duration):
+            used[day] += qty
+
+
+def _from_ordinal(ordinal):
+    from datetime import date
+    return date.fromordinal(ordinal)
+
+
+def get_leveling_data(projects):
+    """
+    Load tasks, resource requirements and capacities for the given projects
+
+    Args:
+        projects: List of Construction Project names
+
+    Returns:
+        Tuple of (tasks, requirements, capacities) as expected by `level_resources`
+    """
+    tasks = frappe.get_all("Construction Project Task",
+        filters={
+            "parenttype": "Construction Project",
+            "parent": ["in", projects]
+        },
+        fields=["name", "parent", "task_name", "start_date", "end_date", "duration",
+            "depends_on", "priority", "status", "is_critical_path"]
+    )
+
+    requirement_rows = frappe.get_all("Resource Requirement",
+        filters={
+            "construction_project": ["in", projects],
+            "construction_project_task": ["is", "set"]
+        },
+        fields=["construction_project_task", "resource_type", "resource_name", "quantity"]
+    )
+
+    requirements = defaultdict(lambda: defaultdict(float))
+    for row in requirement_rows:
+        key = resource_key(row.resource_type, row.resource_name)
+        requirements[row.construction_project_task][key] += flt(row.quantity)
+
+    capacities = {
+        resource_key(row.resource_type, row.resource_name): flt(row.daily_capacity)
+        for row in frappe.get_all("Construction Resource Capacity",
+            filters={"disabled": 0},
+            fields=["resource_type", "resource_name", "daily_capacity"]
+        )
+    }
+
+    return tasks, requirements, capacities
+
+
+@frappe.whitelist()
+def level_project_resources(projects, start_date=None, apply=0):
+    """
+    Level resources across one or more Construction Projects
+
+    Args:
+        projects: Construction Project name or JSON list of names
+        start_date: No task is moved before this date (defaults to today)
+        apply: If set, write the levelled dates back to the tasks
+
+    Returns:
+        Dict with the levelled schedule, conflicts and the number of shifted tasks
+    """
+    projects = frappe.parse_json(projects) if isinstance(projects, str) and projects.startswith("[") else projects
+    if isinstance(projects, str):
+        projects = [projects]
+
+    apply = cint(apply)
+    for project in projects:
+        frappe.has_permission("Construction Project", "write" if apply else "read", project, throw=True)
+
+    tasks, requirements, capacities = get_leveling_data(projects)
+    result = level_resources(tasks, requirements, capacities, start_date)
+
+    shifted = {name: row for name, row in result["schedule"].items() if row["shift_days"]}
+    if apply and shifted:
+        frappe.db.bulk_update("Construction Project Task", {
+            name: {"start_date": row["start_date"], "end_date": row["end_date"]}
+            for name, row in shifted.items()
+        })
+
+    result["shifted_tasks"] = len(shifted)
+    return result
+
+
+def benchmark_resource_leveling(projects=20, tasks_per_project=250, resources=30, seed=7):
+    """
+    Time the levelling heuristic on a synthetic portfolio
+
+    Run with:
+        bench --site <site> execute advanced_construction_erp.advanced_construction.resource_leveling.benchmark_resource_leveling --kwargs "{'projects': 50}"
+
+    Args:
+        projects: Number of parallel projects
+        tasks_per_project: Number of tasks in each project
+        resources: Number of shared resources
+        seed: Random seed, so runs are comparable
+
+    Returns:
+        Dict with task count, elapsed seconds and throughput
+    """
+    rng = random.Random(seed)
+    start = getdate(nowdate())
+    keys = [resource_key("Labor", "Crew {0}".format(i)) for i in range(cint(resources))]
+    capacities = {key: rng.randint(6, 12) for key in keys}
+
+    tasks = []
+    requirements = {}
+    for p in range(cint(projects)):
+        names = []
+        for t in range(cint(tasks_per_project)):
+            name = "P{0}-T{1}".format(p, t)
+            depends_on = rng.sample(names[-20:], min(len(names[-20:]), rng.randint(0, 2)))
+            tasks.append({
+                "name": name,
+                "start_date": start,
+                "duration": rng.randint(1, 15),
+                "depends_on": ",".join(depends_on),
+                "priority": rng.choice(list(PRIORITY_RANK)),
+                "status": "Not Started"
+            })
+            requirements[name] = {key: rng.randint(1, 5) for key in rng.sample(keys, rng.randint(1, 3))}
+            names.append(name)
+
+    started = time.perf_counter()
+    result = level_resources(tasks, requirements, capacities, start)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "tasks": len(tasks),
+        "resources": len(keys),
+        "elapsed_seconds": round(elapsed, 3),
+        "tasks_per_second": round(len(tasks) / elapsed) if elapsed else None,
+        "shifted_tasks": len([row for row in result["schedule"].values() if row["shift_days"]]),
+        "conflicts": len(result["conflicts"])
+    }
@@ -219,6 +219,42 @@ has_upload_permission = {"Employee": "erpnext.setup.doctype.employee.employee.ha
 # 	"Task": {"on_update": "advanced_construction_erp.controllers.employee_boarding_controller.update_task"},
 # }
 
+doc_events = {
+	"Purchase Order": {
+		"validate": "advanced_construction_erp.advanced_construction.events.purchase_order.validate_purchase_order",
+		"on_submit": [
+			"advanced_construction_erp.advanced_construction.events.purchase_order.on_purchase_order_submit",
+			"advanced_construction_erp.advanced_construction.budget_commitment.reserve_budget",
+		],
+		"on_cancel": [
+			"advanced_construction_erp.advanced_construction.events.purchase_order.on_cancel",
+			"advanced_construction_erp.advanced_construction.budget_commitment.release_budget",
+		],
+	},
+	"Material Request": {
+		"on_submit": "advanced_construction_erp.advanced_construction.budget_commitment.reserve_budget",
+		"on_cancel": [
+			"advanced_construction_erp.advanced_construction.budget_commitment.release_budget",
+			"advanced_construction_erp.advanced_construction.material_request_consolidation.release_consolidated_lines",
+		],
+	},
+	"Task": {
+		"on_update": "advanced_construction_erp.advanced_construction.events.task.on_task_update",
+	},
+	"Sales Invoice": {
+		"on_cancel": "advanced_construction_erp.advanced_construction.milestone_billing.release_invoiced_milestones",
+		"on_trash": "advanced_construction_erp.advanced_construction.milestone_billing.release_invoiced_milestones",
+	},
+	"UOM": {
+		"on_update": "advanced_construction_erp.advanced_construction.material_master.clear_lookups",
+		"on_trash": "advanced_construction_erp.advanced_construction.material_master.clear_lookups",
+	},
+	"Item Group": {
+		"on_update": "advanced_construction_erp.advanced_construction.material_master.clear_lookups",
+		"on_trash": "advanced_construction_erp.advanced_construction.material_master.clear_lookups",
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -251,6 +287,24 @@ has_upload_permission = {"Employee": "erpnext.setup.doctype.employee.employee.ha
 # 	"monthly": ["advanced_construction_erp.controllers.employee_reminders.send_reminders_in_advance_monthly"],
 # }
 
+scheduler_events = {
+	"all": [
+		"advanced_construction_erp.advanced_construction.project_progress.flush_dirty_projects",
+		"advanced_construction_erp.advanced_construction.inspection_reference_update.process_reference_updates",
+	],
+	"daily_long": [
+		"advanced_construction_erp.advanced_construction.doctype.construction_project.construction_project.update_project_status",
+		"advanced_construction_erp.advanced_construction.earned_value.take_evm_snapshots",
+		"advanced_construction_erp.advanced_construction.cost_snapshots.take_cost_snapshots",
+		"advanced_construction_erp.advanced_construction.events.purchase_order.reconcile_project_costs",
+		"advanced_construction_erp.advanced_construction.actual_cost.update_all_budget_actuals",
+		"advanced_construction_erp.advanced_construction.budget_history.compact_budget_history",
+		"advanced_construction_erp.advanced_construction.forecasting.run_portfolio_forecast",
+		"advanced_construction_erp.advanced_construction.demand_planning.run_demand_planning",
+		"advanced_construction_erp.advanced_construction.milestone_billing.run_milestone_billing",
+	],
+}
+
 # TODO (6): IN CASE OF NEED TO OVERRIDE ADVANCE PAYMENT PAYABLE DOCTYPES
 #advance_payment_payable_doctypes = ["Leave Encashment", "Gratuity", "Employee Advance"]
 
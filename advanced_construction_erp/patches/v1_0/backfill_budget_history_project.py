@@ -0,0 +1,11 @@
+import frappe
+
+
+def execute():
+    """Set the Construction Project of budget history rows captured before the column existed"""
+    frappe.db.sql("""
+        UPDATE `tabConstruction Project Budget History` h
+        JOIN `tabConstruction Project Budget` b ON b.name = h.budget_item
+        SET h.construction_project = b.parent
+        WHERE IFNULL(h.construction_project, '') = '' AND b.parenttype = 'Construction Project'
+    """)
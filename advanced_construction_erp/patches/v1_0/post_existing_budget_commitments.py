@@ -0,0 +1,26 @@
+import frappe
+
+from advanced_construction_erp.advanced_construction.budget_commitment import (
+    reserve_budget, refresh_budgeted_amounts
+)
+
+# Source documents first, so later documents can take over their reservations
+VOUCHER_TYPES = ("Construction Material Request", "Material Request", "Purchase Order")
+
+
+def execute():
+    """Post the commitments of documents submitted before the commitment ledger existed"""
+    for voucher_type in VOUCHER_TYPES:
+        names = frappe.get_all(voucher_type, filters={"docstatus": 1}, order_by="creation", pluck="name")
+        for count, name in enumerate(names, 1):
+            # Idempotent per voucher; existing budgets may already be overspent
+            reserve_budget(frappe.get_doc(voucher_type, name), check_budget=False)
+            if count % 500 == 0:
+                frappe.db.commit()
+
+    # Balance rows created by the postings have no budgeted amount until their project's budget
+    # is written to them
+    for count, project in enumerate(frappe.get_all("Construction Project", pluck="name"), 1):
+        refresh_budgeted_amounts(project)
+        if count % 500 == 0:
+            frappe.db.commit()
@@ -0,0 +1,6 @@
+from advanced_construction_erp.advanced_construction.defect_cube import rebuild_defect_cube
+
+
+def execute():
+    """Fill the Quality Defect Cube from the inspections and reports submitted before it existed"""
+    rebuild_defect_cube()
@@ -0,0 +1,6 @@
+from advanced_construction_erp.advanced_construction.inspection_facts import rebuild_inspection_facts
+
+
+def execute():
+    """Fill Quality Inspection Fact from the inspections submitted before it existed"""
+    rebuild_inspection_facts()
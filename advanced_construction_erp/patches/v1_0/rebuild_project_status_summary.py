@@ -0,0 +1,6 @@
+from advanced_construction_erp.advanced_construction.project_status_summary import rebuild_status_summary
+
+
+def execute():
+    """Fill the Construction Project Status Summary from the existing projects"""
+    rebuild_status_summary()
@@ -0,0 +1,22 @@
+import frappe
+
+from advanced_construction_erp.advanced_construction.checklist_versions import store_checklist_items
+
+
+def execute():
+    """Submit the Active checklist versions created before checklists were submittable and store their manifests"""
+    names = frappe.get_all("Quality Checklist", filters={"status": "Active", "docstatus": 0}, pluck="name")
+    if not names:
+        return
+
+    # Set directly: legacy versions may not pass today's validation, and submitting one at a
+    # time would mark the others Obsolete
+    frappe.db.set_value("Quality Checklist", {"name": ["in", names]}, "docstatus", 1, update_modified=False)
+    frappe.db.sql("""
+        UPDATE `tabQuality Checklist Item`
+        SET docstatus = 1
+        WHERE parenttype = 'Quality Checklist' AND parent IN %(names)s
+    """, {"names": names})
+
+    for name in names:
+        store_checklist_items(frappe.get_doc("Quality Checklist", name))
@@ -1,3 +1,4 @@
+import frappe
 from frappe.utils import floor
 
 
@@ -32,4 +33,28 @@ def seconds_to_duration(seconds):
 	elif seconds:
 		return f"{seconds}s"
 	else:
-		return "0s"
\ No newline at end of file
+		return "0s"
+
+
+def enqueue_before_commit(queue, values, callback):
+	"""Collect `values` under `queue` and call `callback(values)` once, just before the transaction commits.
+
+	Repeated calls within the same transaction only add to the pending set, so work triggered by many
+	document events is coalesced into a single call. Pending values are dropped on rollback.
+	"""
+	queues = getattr(frappe.local, "before_commit_queues", None)
+	if queues is None:
+		queues = frappe.local.before_commit_queues = {}
+
+	if queue not in queues:
+		queues[queue] = set()
+		frappe.db.before_commit.add(lambda: _flush_before_commit_queue(queue, callback))
+		frappe.db.after_rollback.add(lambda: queues.pop(queue, None))
+
+	queues[queue].update(values)
+
+
+def _flush_before_commit_queue(queue, callback):
+	values = (getattr(frappe.local, "before_commit_queues", None) or {}).pop(queue, None)
+	if values:
+		callback(values)